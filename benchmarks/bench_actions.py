@@ -0,0 +1,406 @@
+"""
+Message throughput, latency and memory of the actions, without a broker.
+
+Synthetic `MQTTMessage`s are handed to `on_message` of the actions, as the
+mqtt client would. Nothing leaves the machine:
+
+- MqttDatastreamAction (one case per parser) and MqttLoggingAction store
+  into a fake datastore, the objects the datastore library needs are still
+  created.
+- QaqcAction posts to a scheduler stand-in on localhost.
+- The thing and new file event actions are measured up to `act` (decoding
+  and validation), as they talk to postgres, minio or grafana.
+
+Every case runs in its own process, so the peak RSS belongs to it alone.
+Results are printed as JSON (to track them between versions), a table goes
+to stderr.
+
+    python benchmarks/bench_actions.py [--sizes 1,10,100] [-n 2000] [-o out.json]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SRC = os.path.abspath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+BROKER = "localhost:1883"
+THING_UUID = "7ff34ed2-5e56-11ec-9b0a-54e1ad7c5c19"
+START = datetime(2022, 5, 24, 8, 53, tzinfo=timezone.utc)
+
+
+# payloads ###################################################################
+
+
+def campbell_cr6_payload(size: int) -> dict:
+    names = [f"value_{i}" for i in range(20)]
+    observations = {
+        (START + timedelta(minutes=i)).strftime("%Y-%m-%dT%H:%M:%SZ"): [
+            round(random.uniform(-10, 40), 2) for _ in names
+        ]
+        for i in range(size)
+    }
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [None, None, None]},
+        "properties": {
+            "loggerID": "CR6_18341",
+            "observationNames": names,
+            "observations": observations,
+        },
+    }
+
+
+def ydoc_ml417_payload(size: int) -> dict:
+    data = []
+    for i in range(size):
+        ts = START + timedelta(minutes=i)
+        row = {"$ts": int(ts.strftime("%y%m%d%H%M%S"))}
+        for code in ("MINVi", "AVGVi", "AVGCi", "P1*", "P2", "P3", "P4"):
+            row[code] = round(random.uniform(0, 5), 2)
+        data.append(row)
+    return {"device": {"sn": 99073020, "name": "UFZ"}, "channels": [], "data": data}
+
+
+def brightsky_dwd_api_payload(size: int) -> dict:
+    weather = {f"property_{i}": round(random.uniform(0, 100), 1) for i in range(size)}
+    weather["timestamp"] = START.isoformat()
+    weather["icon"] = "partly-cloudy-day"
+    return {"weather": weather, "sources": [{"id": 1, "station_name": "Leipzig"}]}
+
+
+def sine_dummy_payload(size: int) -> dict:
+    return {"sine": 0.5, "cosine": 0.86}
+
+
+def log_message_payload(size: int) -> dict:
+    return {
+        "timestamp": START.isoformat(),
+        "level": "INFO",
+        "message": "x" * size,
+    }
+
+
+def data_parsed_payload(size: int) -> dict:
+    return {"thing_uuid": THING_UUID, "db_uri": "postgresql://u:p@localhost/db"}
+
+
+def thing_payload(size: int) -> dict:
+    return {
+        "uuid": THING_UUID,
+        "name": "logger",
+        "description": "a benchmark logger",
+        "database": {"username": "u", "password": "p", "url": "postgresql://"},
+        "project": {"name": "project", "uuid": "057d8bba-40b3-11ec-a337-125e5a40a845"},
+        "raw_data_storage": {"bucket_name": "b", "username": "u", "password": "p"},
+        "mqtt_authentication_credentials": {"username": "u", "password_hash": "h"},
+        "properties": {
+            "default_parser": "campbell_cr6",
+            "parsers": [
+                {"type": "csvparser", "settings": None} for _ in range(size)
+            ],
+        },
+    }
+
+
+def new_file_payload(size: int) -> dict:
+    record = {"s3": {"bucket": {"name": "bucket"}, "object": {"key": "data.csv"}}}
+    return {
+        "EventName": "s3:ObjectCreated:Put",
+        "Key": "bucket/data.csv",
+        "Records": [record] * size,
+    }
+
+
+# stand-ins ##################################################################
+
+
+class FakeSession:
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeDatastore:
+    """Accepts everything the actions store and keeps only the count."""
+
+    def __init__(self):
+        self.session = FakeSession()
+        self.stored = 0
+
+    def store_observations(self, observations):
+        self.stored += len(observations)
+
+    def store_journal_entry(self, entry):
+        self.stored += 1
+
+    def insert_commit_chunk(self):
+        pass
+
+
+class SchedulerHandler(BaseHTTPRequestHandler):
+    # keep-alive, as the scheduler client pools its connections
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"out": "ok"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_scheduler() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SchedulerHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+# cases ######################################################################
+
+
+def datastream_action(parser_name: str):
+    import action_registry
+    from MqttDatastreamAction import ThingContext
+    from parsers import get_parser
+
+    cls = action_registry.load("MqttDatastreamAction")
+    action = cls("mqtt_ingest/#", BROKER, "u", "p", "postgresql://bench@localhost/b")
+    thing = ThingContext(FakeDatastore(), "bench", THING_UUID, get_parser(parser_name))
+    # the thing is cached, the authentication database is never asked
+    action.datastores.get("bench", lambda user: thing)
+    # a schema without FROST tables, no bounds are updated
+    action.frost.missing["bench"] = float("inf")
+    topic = "mqtt_ingest/bench/data/jsn"
+    return action, topic
+
+
+def logging_action():
+    import action_registry
+
+    from datastores import DatastoreLease
+
+    cls = action_registry.load("MqttLoggingAction")
+    action = cls("logging/#", BROKER, "u", "p", "postgresql://bench@localhost/b")
+    lease = DatastoreLease(FakeDatastore())
+    action.datastores.get(THING_UUID, lambda device_id: lease)
+    return action, f"logging/{THING_UUID}"
+
+
+def qaqc_action():
+    import action_registry
+
+    cls = action_registry.load("QaqcAction")
+    action = cls("data_parsed", BROKER, "u", "p", {"url": start_scheduler()})
+    return action, "data_parsed"
+
+
+def decode_only(name: str, topic: str):
+    def create():
+        import action_registry
+        from AbstractAction import AbstractAction
+
+        base = action_registry.load(name)
+
+        class DecodeOnly(base):
+            def __init__(self):
+                AbstractAction.__init__(self, topic, BROKER, "u", "p")
+
+            def act(self, content, message):
+                pass
+
+        DecodeOnly.__name__ = name
+        return DecodeOnly(), topic
+
+    return create
+
+
+# name -> (create the action and its topic, payload of a size)
+CASES = {
+    **{
+        f"MqttDatastreamAction/{parser}": (
+            lambda parser=parser: datastream_action(parser),
+            globals()[f"{parser}_payload"],
+        )
+        for parser in ("campbell_cr6", "ydoc_ml417", "brightsky_dwd_api", "sine_dummy")
+    },
+    "MqttLoggingAction": (logging_action, log_message_payload),
+    "QaqcAction": (qaqc_action, data_parsed_payload),
+    "CreateThingInDatabaseAction (decode)": (
+        decode_only("CreateThingInDatabaseAction", "thing_created"),
+        thing_payload,
+    ),
+    "MqttUserAction (decode)": (
+        decode_only("MqttUserAction", "thing_created"),
+        thing_payload,
+    ),
+    "ProcessNewFileAction (decode)": (
+        decode_only("ProcessNewFileAction", "object_storage_notification"),
+        new_file_payload,
+    ),
+}
+
+
+class ErrorCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run_case(name: str, size: int, number: int) -> dict:
+    from paho.mqtt.client import MQTTMessage
+
+    random.seed(size)
+    logging.basicConfig(level=logging.WARNING)
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+
+    create, payload = CASES[name]
+    try:
+        action, topic = create()
+    except (ImportError, LookupError) as e:
+        # the dependencies of the action are not installed
+        return {"case": name, "size": size, "skipped": f"{e}"}
+
+    body = json.dumps(payload(size)).encode()
+    messages = []
+    for mid in range(number):
+        message = MQTTMessage(mid=mid, topic=topic.encode())
+        message.payload = body
+        messages.append(message)
+
+    for message in messages[: max(1, number // 10)]:
+        action.on_message(None, None, message)
+    errors.count = 0
+
+    latencies = []
+    start = time.perf_counter()
+    for message in messages:
+        t = time.perf_counter()
+        action.on_message(None, None, message)
+        latencies.append(time.perf_counter() - t)
+    total = time.perf_counter() - start
+    action.shutdown()
+
+    latencies.sort()
+    # kilobytes on linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "case": name,
+        "size": size,
+        "payload_bytes": len(body),
+        "messages": number,
+        "errors": errors.count,
+        "messages_per_s": number / total,
+        "p50_us": percentile(latencies, 0.5) * 1e6,
+        "p99_us": percentile(latencies, 0.99) * 1e6,
+        "peak_rss_kb": peak_rss,
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=SRC,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="1,10,100", help="payload sizes")
+    parser.add_argument("-n", "--number", type=int, default=2000)
+    parser.add_argument("-k", "--case", action="append", help="run only these")
+    parser.add_argument("-o", "--output", help="write the JSON to a file")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        # a single case, in a fresh process started below
+        sys.path.insert(0, SRC)
+        os.chdir(SRC)
+        print(json.dumps(run_case(args.run_case, args.size, args.number)))
+        return
+
+    results = []
+    print(
+        f"{'case':<40}{'size':>6}{'msg/s':>10}{'p50 us':>10}{'p99 us':>10}"
+        f"{'rss MB':>9}{'errors':>8}",
+        file=sys.stderr,
+    )
+    for name in args.case or CASES:
+        for size in (int(s) for s in args.sizes.split(",")):
+            proc = subprocess.run(
+                [sys.executable, __file__, "--run-case", name, "--size", str(size)]
+                + ["--number", str(args.number)],
+                capture_output=True,
+                text=True,
+            )
+            if proc.returncode != 0:
+                result = {"case": name, "size": size, "failed": proc.stderr[-2000:]}
+            else:
+                result = json.loads(proc.stdout.splitlines()[-1])
+            results.append(result)
+
+            if "messages_per_s" in result:
+                print(
+                    f"{name:<40}{size:>6}{result['messages_per_s']:>10.0f}"
+                    f"{result['p50_us']:>10.1f}{result['p99_us']:>10.1f}"
+                    f"{result['peak_rss_kb'] / 1024:>9.1f}{result['errors']:>8}",
+                    file=sys.stderr,
+                )
+            else:
+                reason = result.get("skipped") or "failed, see JSON"
+                print(f"{name:<40}{size:>6}  {reason}", file=sys.stderr)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "number": args.number,
+        "results": results,
+    }
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(out)
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
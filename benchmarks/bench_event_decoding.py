@@ -0,0 +1,88 @@
+"""
+Per message cost of turning a schema backed event into objects.
+
+Compares validating the parsed dict with `fastavro.validate` and building
+the `Thing` objects afterwards (the former behaviour of the thing actions)
+against the single pass decoders of `SchemaRegistry.decoder`.
+
+    python benchmarks/bench_event_decoding.py [-n 20000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+
+import fastavro  # noqa: E402
+
+from schema_registry import SchemaRegistry, SCHEMA_DIR  # noqa: E402
+from thing import Database, Project, RawDataStorage, Thing  # noqa: E402
+
+THING = {
+    "uuid": "7ff34ed2-5e56-11ec-9b0a-54e1ad7c5c19",
+    "name": "logger",
+    "description": "a test logger",
+    "database": {"username": "u", "password": "p", "url": "postgresql://"},
+    "project": {"name": "project", "uuid": "057d8bba-40b3-11ec-a337-125e5a40a845"},
+    "raw_data_storage": {"bucket_name": "b", "username": "u", "password": "p"},
+    "mqtt_authentication_credentials": None,
+    "properties": {"default_parser": "campbell_cr6", "parsers": []},
+}
+
+NEW_FILE = {
+    "EventName": "s3:ObjectCreated:Put",
+    "Key": "bucket/data.csv",
+    "Records": [{"s3": {"bucket": {"name": "bucket"}, "object": {"key": "data.csv"}}}],
+}
+
+
+def legacy_thing(message: dict) -> Thing:
+    raw_data_storage = None
+    if "raw_data_storage" in message:
+        raw_data_storage = RawDataStorage.get_instance(message["raw_data_storage"])
+    return Thing(
+        message["uuid"],
+        message["name"],
+        Project.get_instance(message["project"]),
+        Database.get_instance(message["database"]),
+        raw_data_storage,
+        message["description"],
+        message["properties"],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    registry = SchemaRegistry()
+    cases = [
+        ("thing_event.avsc", THING, legacy_thing),
+        ("new_file_event.avsc", NEW_FILE, lambda message: message),
+    ]
+    print(f"{'schema':<26}{'validate + build':>20}{'decoder':>14}{'speedup':>10}")
+    for name, datum, build in cases:
+        path = os.path.join(SCHEMA_DIR, name)
+        schema = registry.get(path)
+        decode = registry.decoder(path)
+
+        def before():
+            fastavro.validate(datum, schema, raise_errors=True)
+            return build(datum)
+
+        before_time = timeit.timeit(before, number=args.number)
+        after_time = timeit.timeit(lambda: decode(datum), number=args.number)
+
+        per_before = before_time / args.number * 1e6
+        per_after = after_time / args.number * 1e6
+        print(
+            f"{name:<26}{per_before:>17.2f} us{per_after:>11.2f} us"
+            f"{per_before / per_after:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
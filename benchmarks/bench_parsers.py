@@ -0,0 +1,140 @@
+"""
+Parsing cost of large multi-timestamp payloads in MqttDatastreamAction.
+
+Compares the former parsers, which created an `Observation` per value in
+nested loops, with the columnar parsers of `parsers.py`. The columnar
+parsers are measured alone, as consumed by the COPY writer, and including
+the conversion to `Observation` objects, as needed by the datastore library.
+
+    python benchmarks/bench_parsers.py [--timestamps 1000] [--values 20]
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+
+from tsm_datastore_lib.Observation import Observation  # noqa: E402
+
+import parsers  # noqa: E402
+
+
+def legacy_campbell_cr6(payload, origin):
+    properties = payload.get("properties")
+    if properties is None:
+        return []
+    out = []
+    for timestamp, values in properties["observations"].items():
+        for i, (key, value) in enumerate(zip(properties["observationNames"], values)):
+            out.append(
+                Observation(
+                    timestamp=timestamp, value=value, position=i, origin=origin, header=key
+                )
+            )
+    return out
+
+
+def legacy_ydoc_ml417(payload, origin):
+    ret = []
+    for data in payload["data"]:
+        try:
+            ts = datetime.strptime(str(data["$ts"]), "%y%m%d%H%M%S")
+            ret.extend(
+                [
+                    Observation(ts, data["MINVi"], origin, 0, header="MINVi"),
+                    Observation(ts, data["AVGVi"], origin, 1, header="AVGCi"),
+                    Observation(ts, data["AVGCi"], origin, 2, header="AVGCi"),
+                    Observation(ts, data["P1*"], origin, 3, header="P1*"),
+                    Observation(ts, data["P2"], origin, 4, header="P2"),
+                    Observation(ts, data["P3"], origin, 5, header="P3"),
+                    Observation(ts, data["P4"], origin, 6, header="P4"),
+                ]
+            )
+        except KeyError:
+            pass
+    return ret
+
+
+def cr6_payload(timestamps, values):
+    start = datetime(2022, 12, 21, 11)
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [None, None, None]},
+        "properties": {
+            "loggerID": "CR6_66666666",
+            "observationNames": [f"value_{i}" for i in range(values)],
+            "observations": {
+                (start + timedelta(minutes=t)).strftime("%Y-%m-%dT%H:%M:%SZ"): [
+                    float(t + i) for i in range(values)
+                ]
+                for t in range(timestamps)
+            },
+        },
+    }
+
+
+def ydoc_payload(rows):
+    start = datetime(2023, 1, 16, 11)
+    data = []
+    for r in range(rows):
+        ts = int((start + timedelta(minutes=r)).strftime("%y%m%d%H%M%S"))
+        data.append({"$ts": ts, "$msg": "WDT;pr2_1"})
+        data.append(
+            {"$ts": ts, "MINVi": 3.74, "AVGVi": 3.94, "AVGCi": 116, "P1*": 0.1,
+             "P2": 0.2, "P3": 0.3, "P4": 0.4}
+        )
+    return {"data": data}
+
+
+def measure(name, count, number, candidates):
+    print(f"{name} ({count} observations per payload)")
+    for label, fn in candidates:
+        t = timeit.timeit(fn, number=number) / number
+        print(f"  {label:<30}{t * 1000:>9.2f} ms{count / t:>14.0f} observations/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--timestamps", type=int, default=1000)
+    parser.add_argument("--values", type=int, default=20)
+    parser.add_argument("-n", "--number", type=int, default=20)
+    args = parser.parse_args()
+
+    origin = "localhost:1883/mqtt_ingest/logger/data/jsn"
+
+    cr6 = cr6_payload(args.timestamps, args.values)
+    measure(
+        f"campbell_cr6, {args.timestamps} timestamps x {args.values} values",
+        args.timestamps * args.values,
+        args.number,
+        [
+            ("legacy (Observation objects)", lambda: legacy_campbell_cr6(cr6, origin)),
+            ("columnar", lambda: parsers.campbell_cr6(cr6, origin)),
+            (
+                "columnar + observations()",
+                lambda: parsers.campbell_cr6(cr6, origin).observations(),
+            ),
+        ],
+    )
+
+    ydoc = ydoc_payload(args.timestamps)
+    measure(
+        f"ydoc_ml417, {args.timestamps} rows",
+        args.timestamps * len(parsers.YDOC_ML417_CHANNELS),
+        args.number,
+        [
+            ("legacy (Observation objects)", lambda: legacy_ydoc_ml417(ydoc, origin)),
+            ("columnar", lambda: parsers.ydoc_ml417(ydoc, origin)),
+            (
+                "columnar + observations()",
+                lambda: parsers.ydoc_ml417(ydoc, origin).observations(),
+            ),
+        ],
+    )
+
+
+if __name__ == "__main__":
+    main()
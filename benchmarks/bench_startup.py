@@ -0,0 +1,100 @@
+"""
+Cold start cost of the dispatcher.
+
+Compares importing every action module up front (how main.py used to start)
+with importing only the action of the selected command through the action
+registry. Reports the import time as measured by `python -X importtime`,
+the number of imported modules, the wall time of the process and the time
+until a first synthetic message has been handled by a QaqcAction.
+
+    python benchmarks/bench_startup.py [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC = os.path.abspath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+sys.path.insert(0, SRC)
+
+from action_registry import BUILTIN_ACTIONS  # noqa: E402
+
+EAGER_IMPORTS = "\n".join(
+    f"try:\n    import {name}\nexcept ImportError as e:\n    print(e, file=sys.stderr)"
+    for name in BUILTIN_ACTIONS
+)
+
+FIRST_MESSAGE = """
+import sys
+sys.path.insert(0, {src!r})
+{imports}
+import action_registry
+from paho.mqtt.client import MQTTMessage
+
+class Action(action_registry.load("QaqcAction")):
+    def act(self, content, message):
+        pass
+
+action = Action("data_parsed", "localhost:1883", "u", "p", {{"url": "http://localhost"}})
+message = MQTTMessage(mid=1, topic=b"data_parsed")
+message.payload = b'{{"thing_uuid": "7ff34ed2", "db_uri": "postgresql://"}}'
+action.handle_message(message)
+"""
+
+
+def run(args, cwd=SRC):
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    imports = [
+        line.split("|")
+        for line in proc.stderr.splitlines()
+        if line.startswith("import time:") and "self [us]" not in line
+    ]
+    import_time = sum(int(i[0].split(":")[1]) for i in imports) / 1e6
+    return wall, import_time, len(imports)
+
+
+def report(name, results):
+    wall = statistics.median(r[0] for r in results)
+    imp = statistics.median(r[1] for r in results)
+    modules = results[0][2]
+    print(f"{name:<44}{wall * 1000:>9.0f} ms{imp * 1000:>10.0f} ms{modules:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cli = ["main.py", "-m", "localhost:1883", "-u", "u", "-p", "p", "-t", "t"]
+    print(f"{'':<44}{'wall':>12}{'imports':>13}{'modules':>9}")
+    report(
+        "eager: import all action modules",
+        [run(["-c", f"import sys\n{EAGER_IMPORTS}"]) for _ in range(args.repeat)],
+    )
+    for command in ("run-qaqc", "parse-data"):
+        report(
+            f"lazy: main.py {command} --help",
+            [run([*cli, command, "--help"]) for _ in range(args.repeat)],
+        )
+
+    for name, imports in (("eager", EAGER_IMPORTS), ("lazy", "")):
+        script = FIRST_MESSAGE.format(src=SRC, imports=imports)
+        report(
+            f"{name}: time to first message",
+            [run(["-c", f"import sys\n{script}"]) for _ in range(args.repeat)],
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,23 @@
 from __future__ import annotations
-import json
 import logging
 import os.path
+import signal
+import threading
 import typing
 
-import fastavro
 import paho.mqtt.client as mqtt
 from paho.mqtt.client import MQTTMessage
 from abc import ABC, abstractmethod
 
+import decoding
+import mqtt_loop
+import profiling
+from metrics import ActionMetrics
+from schema_registry import registry
+from worker_pool import KeyedWorkerPool
+
+TOPIC_DELIMITER = "/"
+
 
 class AbstractAction(ABC):
 
@@ -25,20 +34,83 @@ class AbstractAction(ABC):
         self.mqtt_port = int(self.mqtt_broker.split(":")[1])
         self.mqtt_client = mqtt.Client()
 
+        self.decoder = decoding.get_decoder()
+        # validates and converts a message to typed objects in a single pass
+        self.decode_event = None
+        if self.SCHEMA_FILE is not None:
+            self.decode_event = registry.decoder(self.SCHEMA_FILE)
+
+        self.pool: KeyedWorkerPool | None = None
+        self.ordering = "topic"
+        self.metrics = ActionMetrics(self.__class__.__name__, topic)
+        self._stop_event = threading.Event()
+
+    def use_worker_pool(
+        self, workers: int, max_in_flight: int, ordering: str = "topic"
+    ):
+        """
+        Hand received messages to a pool of `workers` threads instead of
+        processing them on the network thread of the mqtt client.
+
+        :param max_in_flight: number of queued or running messages, reading
+            from the mqtt connection pauses when the limit is reached
+        :param ordering: 'topic' or 'thing' process all messages of the same
+            topic (or second topic level, i.e. the thing) in order by the same
+            worker, 'none' distributes them round robin. Only use 'none' for
+            actions without per thing state.
+        """
+        self.ordering = ordering
+        self.pool = KeyedWorkerPool(
+            workers, max_in_flight, name=f"{self.__class__.__name__}-worker"
+        )
+
     def connect_mqtt(self):
         self.mqtt_client.username_pw_set(self.mqtt_user, self.mqtt_password)
         self.mqtt_client.on_connect = self.on_connect
         self.mqtt_client.on_log = self.on_log
         self.mqtt_client.connect(self.mqtt_host, self.mqtt_port)
 
+    def subscriptions(self) -> typing.List[typing.Tuple[str, typing.Callable]]:
+        """Topics to subscribe and the mqtt message callbacks handling them."""
+        return [(self.topic, self.on_message)]
+
     def subscribe_to_mqtt_topic(self):
-        self.connect_mqtt()
-        self.mqtt_client.subscribe(self.topic)
+        # the topics are subscribed in `on_connect`
+        for topic, callback in self.subscriptions():
+            if callback != self.on_message:
+                self.mqtt_client.message_callback_add(topic, callback)
         self.mqtt_client.on_message = self.on_message
+        self.connect_mqtt()
 
     def run_loop(self) -> typing.NoReturn:
         self.subscribe_to_mqtt_topic()
-        self.mqtt_client.loop_forever()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.on_sigterm)
+        try:
+            mqtt_loop.loop_forever(
+                self.mqtt_client, self.accepts_messages, self._stop_event
+            )
+        finally:
+            self.shutdown()
+
+    def accepts_messages(self) -> bool:
+        """Whether another message can be taken without blocking."""
+        return self.pool is None or self.pool.has_capacity()
+
+    def shutdown(self):
+        """Finish queued messages and release resources."""
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.close()
+
+    def on_sigterm(self, signum, frame):
+        self.logger.info("Received SIGTERM, shutting down")
+        self._stop_event.set()
+        self.mqtt_client.disconnect()
+
+    def close(self):
+        """Release resources, called once the mqtt loop has stopped."""
+        pass
 
     def on_log(self, client, userdata, level, buf):
         self.logger.debug(f"{buf}")
@@ -46,6 +118,9 @@ class AbstractAction(ABC):
     def on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             self.logger.info(f"Connected to {self.mqtt_broker}")
+            # subscribe again after reconnects, the broker forgot the
+            # subscriptions of the clean session
+            client.subscribe([(topic, 0) for topic, _ in self.subscriptions()])
         else:
             self.logger.error(f"Failed to connect, return code {rc}")
 
@@ -55,30 +130,58 @@ class AbstractAction(ABC):
             f"{message.topic!r} with QoS {message.qos}"
         )
         self.logger.debug(f"{message=}")
+        self.metrics.messages.inc()
+        self.metrics.in_flight.inc()
+        if self.pool is None:
+            self.handle_message(message)
+        else:
+            self.pool.submit(self.ordering_key(message), self.handle_message, message)
+
+    def ordering_key(self, message: MQTTMessage) -> str | None:
+        if self.ordering == "topic":
+            return message.topic
+        if self.ordering == "thing":
+            levels = message.topic.split(TOPIC_DELIMITER)
+            return levels[1] if len(levels) > 1 else message.topic
+        return None
+
+    def handle_message(self, message: MQTTMessage):
+        metrics = self.metrics
+        profiler = profiling.profiler
+        if profiler.enabled:
+            profiler.begin(self.__class__.__name__, message.mid)
+        stage = "parse"
         try:
-            content = self._parse_message(message)
-            self.act(content, message)
+            with metrics.parse.time():
+                content = self._parse_message(message)
+            profiling.mark("decode")
+            if self.decode_event is not None:
+                stage = "validate"
+                with metrics.validate.time():
+                    content = self.decode_event(content)
+                profiling.mark("validate")
+                self.logger.debug(f"Received message {message.mid} matches avro schema")
+            stage = "act"
+            with metrics.act.time():
+                self.act(content, message)
         except Exception as e:
+            metrics.errors[stage].inc()
             self.logger.error(
                 f"Errors occurred, discarding message {message.mid}", exc_info=e
             )
+        finally:
+            metrics.in_flight.dec()
+            if profiler.enabled:
+                profiler.end()
 
     def _parse_message(self, message: MQTTMessage) -> typing.Any:
-        decoded: str = message.payload.decode("utf-8")
-
-        if self.SCHEMA_FILE is not None:
-            content = json.loads(decoded)
-            fastavro.validate(content, fastavro.schema.load_schema(self.SCHEMA_FILE))
-            self.logger.debug(f"Received message {message.mid} matches avro schema")
-            return content
+        if self.decode_event is not None:
+            return self.decoder.loads(message.payload)
 
-        try:
-            # also parse single numeric values
-            # and the constants null, +/-Infinity, NoN
-            return json.loads(decoded)
-        except json.JSONDecodeError:
-            # string / datetime / other
-            return decoded
+        # also parse single numeric values
+        # and the constants null, +/-Infinity, NaN
+        # string / datetime / other are returned as string
+        return self.decoder.decode(message.payload)
 
     @abstractmethod
     def act(self, content: typing.Any, message: MQTTMessage):
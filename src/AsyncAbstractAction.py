@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import asyncio
+import signal
+import threading
+import typing
+from abc import abstractmethod
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.client import MQTTMessage
+
+from AbstractAction import AbstractAction
+from worker_pool import Slots
+
+
+class AsyncAbstractAction(AbstractAction):
+    """
+    Base of actions processing every message as an asyncio task.
+
+    All messages share one thread, so thousands of requests to the scheduler,
+    the object storage or the database can be in flight without a thread
+    each. Subclasses implement `async def act` and open their clients in
+    `setup` and close them in `teardown`, both run on the event loop.
+
+    `run_loop` drives the mqtt client from the event loop. When the action
+    is hosted by a `Dispatcher`, the event loop runs on a thread of its own
+    and the messages are handed over to it.
+    """
+
+    is_async = True
+
+    # seconds between reconnection attempts, doubled up to the maximum
+    RECONNECT_DELAY = 1.0
+    RECONNECT_DELAY_MAX = 60.0
+
+    def __init__(self, topic, mqtt_broker, mqtt_user, mqtt_password):
+        super().__init__(topic, mqtt_broker, mqtt_user, mqtt_password)
+        self.max_in_flight = 1000
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread: threading.Thread | None = None
+        self._tasks: typing.Set[asyncio.Task] = set()
+        # ordering key -> task of the last message with that key
+        self._tails: typing.Dict[str, asyncio.Task] = {}
+        # backpressure: reading from the socket pauses while the limit is
+        # reached, a hosted action pauses the dispatcher's loop instead
+        self._paused = False
+        self._slots: Slots | None = None
+        self._stopping = False
+        self._stopped: asyncio.Future | None = None
+        self._misc: asyncio.Task | None = None
+
+    def use_worker_pool(
+        self, workers: int, max_in_flight: int, ordering: str = "topic"
+    ):
+        """
+        Limit the number of concurrent messages to `max_in_flight`. There
+        are no worker threads, `workers` is ignored.
+        """
+        self.max_in_flight = max_in_flight
+        self.ordering = ordering
+
+    async def setup(self):
+        """Open clients, called on the event loop before the first message."""
+        pass
+
+    async def teardown(self):
+        """Close clients, called on the event loop after the last message."""
+        pass
+
+    @abstractmethod
+    async def act(self, content: typing.Any, message: MQTTMessage):
+        raise NotImplementedError
+
+    # message handling ########################################################
+
+    def on_message(self, client, userdata, message: MQTTMessage):
+        self.logger.info(
+            f"received message {message.mid} on topic "
+            f"{message.topic!r} with QoS {message.qos}"
+        )
+        self.logger.debug(f"{message=}")
+        self.metrics.messages.inc()
+        self.metrics.in_flight.inc()
+        if self._loop_thread is None and self.loop is not None:
+            # called by the mqtt client on the event loop
+            self._submit(message)
+            return
+
+        # called by the network thread of a dispatcher
+        if self.loop is None:
+            self._start_loop_thread()
+        self._slots.take()
+        self.loop.call_soon_threadsafe(self._submit, message)
+
+    def accepts_messages(self) -> bool:
+        return self._slots is None or self._slots.available()
+
+    def _submit(self, message: MQTTMessage):
+        key = self.ordering_key(message)
+        previous = self._tails.get(key) if key is not None else None
+        task = self.loop.create_task(self.handle_message(message, previous))
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+        if key is not None:
+            self._tails[key] = task
+            task.add_done_callback(lambda t: self._forget_tail(key, t))
+        if self._slots is None and len(self._tasks) >= self.max_in_flight:
+            self._pause_reading()
+
+    def _done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if self._slots is not None:
+            self._slots.release()
+        elif self._paused and len(self._tasks) < self.max_in_flight:
+            self._resume_reading()
+
+    def _forget_tail(self, key: str, task: asyncio.Task):
+        if self._tails.get(key) is task:
+            del self._tails[key]
+
+    async def handle_message(
+        self, message: MQTTMessage, previous: asyncio.Task | None = None
+    ):
+        if previous is not None:
+            # messages with the same ordering key are processed in order
+            await asyncio.wait((previous,))
+        metrics = self.metrics
+        stage = "parse"
+        try:
+            with metrics.parse.time():
+                content = self._parse_message(message)
+            if self.decode_event is not None:
+                stage = "validate"
+                with metrics.validate.time():
+                    content = self.decode_event(content)
+                self.logger.debug(f"Received message {message.mid} matches avro schema")
+            stage = "act"
+            with metrics.act.time():
+                await self.act(content, message)
+        except Exception as e:
+            metrics.errors[stage].inc()
+            self.logger.error(
+                f"Errors occurred, discarding message {message.mid}", exc_info=e
+            )
+        finally:
+            metrics.in_flight.dec()
+
+    async def _drain(self):
+        """Wait for the messages in flight."""
+        while self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+    # mqtt client on the event loop ###########################################
+
+    def run_loop(self) -> typing.NoReturn:
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._stopped = self.loop.create_future()
+        await self.setup()
+        try:
+            client = self.mqtt_client
+            client.on_socket_open = self._on_socket_open
+            client.on_socket_close = self._on_socket_close
+            client.on_socket_register_write = self._on_socket_register_write
+            client.on_socket_unregister_write = self._on_socket_unregister_write
+            client.on_disconnect = self._on_disconnect
+            client.on_message = self.on_message
+            for topic, callback in self.subscriptions():
+                if callback != self.on_message:
+                    client.message_callback_add(topic, callback)
+            self.connect_mqtt()
+            if threading.current_thread() is threading.main_thread():
+                self.loop.add_signal_handler(signal.SIGTERM, self._on_sigterm)
+            await self._stopped
+        finally:
+            await self._drain()
+            await self.teardown()
+            self.close()
+
+    def _on_sigterm(self):
+        self.logger.info("Received SIGTERM, shutting down")
+        self._stopping = True
+        self.mqtt_client.disconnect()
+
+    def _on_disconnect(self, client, userdata, rc):
+        if self._stopping:
+            if not self._stopped.done():
+                self._stopped.set_result(None)
+            return
+        self.logger.warning(f"Disconnected from {self.mqtt_broker}, return code {rc}")
+        self.loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = self.RECONNECT_DELAY
+        while not self._stopping:
+            await asyncio.sleep(delay)
+            try:
+                self.mqtt_client.reconnect()
+                return
+            except OSError as e:
+                self.logger.warning(f"Unable to reconnect: {e}")
+                delay = min(delay * 2, self.RECONNECT_DELAY_MAX)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self._paused = False
+        self._misc = self.loop.create_task(self._misc_loop())
+
+    def _on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self._misc is not None:
+            self._misc.cancel()
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def _misc_loop(self):
+        # keep alive pings and retries of the mqtt client, a paused client
+        # still has to read the answer to its ping, see `mqtt_loop`
+        while self.mqtt_client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            if self._paused and getattr(self.mqtt_client, "_ping_t", 0):
+                self._resume_reading()
+            await asyncio.sleep(1)
+
+    def _pause_reading(self):
+        sock = self.mqtt_client.socket()
+        if sock is not None:
+            self.loop.remove_reader(sock)
+            self._paused = True
+
+    def _resume_reading(self):
+        sock = self.mqtt_client.socket()
+        if sock is not None:
+            self.loop.add_reader(sock, self.mqtt_client.loop_read)
+        self._paused = False
+
+    # event loop on a thread of its own, when hosted by a dispatcher ##########
+
+    def _start_loop_thread(self):
+        self._slots = Slots(self.max_in_flight)
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        failed: typing.List[BaseException] = []
+
+        def run():
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self.setup())
+            except BaseException as e:
+                failed.append(e)
+                ready.set()
+                return
+            ready.set()
+            loop.run_forever()
+
+        self._loop_thread = threading.Thread(
+            target=run, name=f"{self.__class__.__name__}-loop", daemon=True
+        )
+        self._loop_thread.start()
+        ready.wait()
+        if failed:
+            raise failed[0]
+        self.loop = loop
+
+    def shutdown(self):
+        if self._loop_thread is not None:
+
+            async def finish():
+                await self._drain()
+                await self.teardown()
+
+            asyncio.run_coroutine_threadsafe(finish(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._loop_thread.join()
+            self.loop.close()
+        self.close()
@@ -0,0 +1,65 @@
+import json
+
+import asyncpg
+
+from AsyncAbstractAction import AsyncAbstractAction
+from AbstractAction import MQTTMessage
+from thing import Thing
+
+
+class AsyncMqttUserAction(AsyncAbstractAction):
+    """`MqttUserAction` on a pool of non-blocking database connections."""
+
+    SCHEMA_FILE = "./avro_schema_files/thing_event.avsc"
+
+    SQL = (
+        "INSERT INTO mqtt_auth.mqtt_user (project_uuid, thing_uuid, username, "
+        "password, description,properties, db_schema) "
+        "VALUES ($1, $2, $3, $4, $5, $6, $7) "
+        "ON CONFLICT (thing_uuid) "
+        "DO UPDATE SET"
+        " project_uuid = EXCLUDED.project_uuid,"
+        " username = EXCLUDED.username,"
+        " password=EXCLUDED.password,"
+        " description = EXCLUDED.description,"
+        " properties = EXCLUDED.properties,"
+        " db_schema = EXCLUDED.db_schema"
+    )
+
+    def __init__(
+        self, topic, mqtt_broker, mqtt_user, mqtt_password, database_settings: dict
+    ):
+        super().__init__(topic, mqtt_broker, mqtt_user, mqtt_password)
+        self.database_settings = database_settings
+        self.db_pool: asyncpg.Pool | None = None
+
+    async def setup(self):
+        self.db_pool = await asyncpg.create_pool(
+            self.database_settings.get("url"),
+            min_size=1,
+            max_size=self.database_settings.get("pool_size", 10),
+        )
+
+    async def teardown(self):
+        await self.db_pool.close()
+
+    async def act(self, content: Thing, message: MQTTMessage):
+        thing = Thing.get_instance(content)
+        credentials = thing.mqtt_authentication_credentials
+        if credentials:
+            await self.create_user(
+                thing, credentials.username, credentials.password_hash
+            )
+
+    async def create_user(self, thing, user, pw):
+        with self.metrics.db("create_user").time():
+            await self.db_pool.execute(
+                self.SQL,
+                thing.project.uuid,
+                thing.uuid,
+                user,
+                pw,
+                thing.description,
+                json.dumps(thing.properties),
+                thing.database.username,
+            )
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from minio import Minio
+
+from AsyncAbstractAction import AsyncAbstractAction
+from AbstractAction import MQTTMessage
+from ProcessNewFileAction import PUT_EVENTS, Job, batch_results, files_by_bucket
+from async_scheduler_client import AsyncSchedulerClient
+from bucket_tags import BucketTags
+
+
+class AsyncProcessNewFileAction(AsyncAbstractAction):
+    """
+    `ProcessNewFileAction` with non-blocking requests to the scheduler.
+
+    The minio client has no asyncio interface, its calls run on a thread
+    pool of `minio_settings["workers"]` threads, which share the connection
+    pool of the client.
+    """
+
+    SCHEMA_FILE = "./avro_schema_files/new_file_event.avsc"
+
+    def __init__(
+        self,
+        topic,
+        mqtt_broker,
+        mqtt_user,
+        mqtt_password,
+        minio_settings: dict,
+        scheduler_settings: dict,
+        bucket_tags_cache_size: int = 1000,
+        bucket_tags_cache_ttl: float = 3600,
+        thing_topic: str | None = None,
+        scheduler_batch: bool = False,
+    ):
+        super().__init__(topic, mqtt_broker, mqtt_user, mqtt_password)
+        self.minio_settings = minio_settings
+        self.minio = Minio(
+            minio_settings.get("minio_url"),
+            secure=minio_settings.get("minio_secure", True),
+            access_key=minio_settings.get("minio_access_key"),
+            secret_key=minio_settings.get("minio_secure_key"),
+        )
+        self.bucket_tags = BucketTags(
+            self.minio, self.metrics, bucket_tags_cache_size, bucket_tags_cache_ttl
+        )
+        self.thing_topic = thing_topic
+        self.scheduler_settings = scheduler_settings
+        self.scheduler_batch = scheduler_batch
+        self.scheduler: AsyncSchedulerClient | None = None
+        self.executor: ThreadPoolExecutor | None = None
+
+    def subscriptions(self):
+        subscriptions = super().subscriptions()
+        if self.thing_topic:
+            # drop the cached tags of a bucket when its thing changes
+            subscriptions.append((self.thing_topic, self.bucket_tags.on_thing_message))
+        return subscriptions
+
+    async def setup(self):
+        self.executor = ThreadPoolExecutor(
+            self.minio_settings.get("workers", 32), thread_name_prefix="minio"
+        )
+        self.scheduler = AsyncSchedulerClient(**self.scheduler_settings)
+        await self.scheduler.open()
+
+    async def teardown(self):
+        await self.scheduler.close()
+        self.executor.shutdown()
+
+    async def minio_call(self, method, *args):
+        with self.metrics.http("minio").time():
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, functools.partial(method, *args)
+            )
+
+    async def bucket_tags_call(self, bucket_name: str):
+        try:
+            return self.bucket_tags.cache.peek(bucket_name)
+        except KeyError:
+            pass
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, self.bucket_tags.get, bucket_name
+        )
+
+    async def act(self, content, message: MQTTMessage):
+        # skip all messages that are not a put event
+        if content.EventName not in PUT_EVENTS:
+            return
+
+        files = files_by_bucket(content.Records)
+        lookups = await asyncio.gather(
+            *(self.bucket_tags_call(bucket_name) for bucket_name in files),
+            return_exceptions=True,
+        )
+        failed = 0
+        jobs = []
+        for (bucket_name, filenames), tags in zip(files.items(), lookups):
+            if isinstance(tags, Exception):
+                self.logger.error(
+                    f"Unable to read tags of {bucket_name!r}", exc_info=tags
+                )
+                failed += len(filenames)
+                continue
+            sources = await asyncio.gather(
+                *(
+                    self.minio_call(
+                        self.minio.presigned_get_object, bucket_name, filename
+                    )
+                    for filename in filenames
+                ),
+                return_exceptions=True,
+            )
+            for filename, source in zip(filenames, sources):
+                if isinstance(source, Exception):
+                    self.logger.error(
+                        f"Unable to sign {bucket_name}/{filename}", exc_info=source
+                    )
+                    failed += 1
+                    continue
+                jobs.append(Job(bucket_name, filename, tags, source))
+
+        results = await self.submit(jobs)
+        # one write per file, with the response of the scheduler
+        tagged = await asyncio.gather(
+            *(
+                self.minio_call(
+                    self.minio.set_object_tags,
+                    job.bucket_name,
+                    job.filename,
+                    job.object_tags(result),
+                )
+                for job, result in zip(jobs, results)
+            ),
+            return_exceptions=True,
+        )
+        for job, result, tag_result in zip(jobs, results, tagged):
+            error = result if isinstance(result, Exception) else None
+            if error is not None:
+                self.logger.error(
+                    f"Unable to schedule {job.bucket_name}/{job.filename}",
+                    exc_info=error,
+                )
+            if isinstance(tag_result, Exception):
+                self.logger.error(
+                    f"Unable to tag {job.bucket_name}/{job.filename}",
+                    exc_info=tag_result,
+                )
+                error = error or tag_result
+            if error is not None:
+                failed += 1
+
+        if failed:
+            raise RuntimeError(
+                f"{failed} of {len(content.Records)} files of the event failed"
+            )
+
+    async def submit(self, jobs: typing.List[Job]) -> typing.List[dict | Exception]:
+        """Post the jobs to the scheduler, return its response or the error."""
+        if self.scheduler_batch and len(jobs) > 1:
+            try:
+                return batch_results(jobs, await self.post([job.data for job in jobs]))
+            except Exception as e:
+                return [e] * len(jobs)
+        return await asyncio.gather(
+            *(self.post(job.data) for job in jobs), return_exceptions=True
+        )
+
+    async def post(self, data: dict | list):
+        with self.metrics.http("scheduler").time():
+            return await self.scheduler.post(data)
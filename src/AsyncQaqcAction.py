@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import asyncio
+
+from paho.mqtt.client import MQTTMessage
+
+from AsyncAbstractAction import AsyncAbstractAction
+from async_scheduler_client import AsyncSchedulerClient
+from debouncer import Debouncer
+
+
+class AsyncQaqcAction(AsyncAbstractAction):
+    """`QaqcAction` with non-blocking requests to the scheduler."""
+
+    SCHEMA_FILE = "./avro_schema_files/data_parsed_event.avsc"
+
+    def __init__(
+        self,
+        topic,
+        mqtt_broker,
+        mqtt_user,
+        mqtt_password,
+        scheduler_settings: dict,
+        debounce_window: float = 0,
+        debounce_max_wait: float = 60,
+    ):
+        super().__init__(topic, mqtt_broker, mqtt_user, mqtt_password)
+        self.scheduler_settings = scheduler_settings
+        self.scheduler: AsyncSchedulerClient | None = None
+        self.debounce_window = debounce_window
+        self.debounce_max_wait = debounce_max_wait
+        self.debouncer: Debouncer[str, str] | None = None
+
+    async def setup(self):
+        # keep-alive connections to the scheduler, shared by all requests
+        self.scheduler = AsyncSchedulerClient(**self.scheduler_settings)
+        await self.scheduler.open()
+        if self.debounce_window > 0:
+            self.debouncer = Debouncer(
+                self.schedule_threadsafe,
+                self.debounce_window,
+                self.debounce_max_wait,
+                on_coalesced=self.metrics.coalesced.inc,
+                name=f"{self.__class__.__name__}-debouncer",
+            )
+
+    async def teardown(self):
+        if self.debouncer is not None:
+            # the pending jobs are posted on this loop, don't block it
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.debouncer.close
+            )
+        await self.scheduler.close()
+
+    async def act(self, content, message: MQTTMessage):
+        if self.debouncer is None:
+            await self.schedule(content.thing_uuid, content.db_uri)
+        else:
+            self.debouncer.trigger(content.thing_uuid, content.db_uri)
+
+    def schedule_threadsafe(self, thing_uuid: str, db_uri: str):
+        """`schedule` for the threads of the debouncer."""
+        asyncio.run_coroutine_threadsafe(
+            self.schedule(thing_uuid, db_uri), self.loop
+        ).result()
+
+    async def schedule(self, thing_uuid: str, db_uri: str):
+        data = {
+            "thing_uuid": thing_uuid,
+            "target": db_uri,
+        }
+        with self.metrics.http("scheduler").time():
+            await self.scheduler.post(data)
@@ -170,14 +170,13 @@ class CreateGrafanaDashboardAction(AbstractAction):
         ds_uid = thing.project.uuid
         # query all datastreams for thing from database
         datastreams = self.get_datastreams(thing)
+        aggregates = self.has_aggregates(thing)
         panels = []
         # loop over datastreams, create list of panel dictionaries
         # to be used in dashboard dictionary
         for num, (ds_id, ds_name) in enumerate(datastreams):
             (x,y) = self.panel_position(num, width, height, ncol)
-            sql_query = "SELECT result_time AS \"time\", result_number "\
-                        f"AS \"value\" FROM {db_user}.observation "\
-                        f"WHERE datastream_id = {ds_id}"
+            sql_query = self.panel_query(db_user, ds_id, aggregates)
             # append panel dictionary to panels list
             panels.append({
                 "id": num + 1,
@@ -207,6 +206,46 @@ class CreateGrafanaDashboardAction(AbstractAction):
             })
         return panels
 
+    @staticmethod
+    def panel_query(db_user, ds_id, aggregates=True):
+        """
+        Query of the observations of a datastream in the time range of the
+        dashboard. With aggregates, the source depends on the interval
+        grafana asks for, i.e. on the time range: raw observations below a
+        minute, the minute rollup below an hour and the hourly one above.
+        The conditions on $__interval_ms are constant, so postgres skips the
+        other sources without reading them.
+        """
+        raw = "SELECT result_time AS \"time\", result_number AS \"value\" "\
+              f"FROM {db_user}.observation WHERE datastream_id = {ds_id} "\
+              "AND $__timeFilter(result_time)"
+        if not aggregates:
+            return f"{raw} ORDER BY 1"
+        rollup = "SELECT bucket AS \"time\", avg AS \"value\" "\
+                 "FROM {db_user}.{view} WHERE datastream_id = {ds_id} "\
+                 "AND $__timeFilter(bucket) AND {condition}"
+        return "\nUNION ALL\n".join([
+            f"{raw} AND $__interval_ms < 60000",
+            rollup.format(
+                db_user=db_user, view="observation_1min", ds_id=ds_id,
+                condition="$__interval_ms >= 60000 AND $__interval_ms < 3600000"),
+            rollup.format(
+                db_user=db_user, view="observation_1h", ds_id=ds_id,
+                condition="$__interval_ms >= 3600000"),
+        ]) + "\nORDER BY 1"
+
+    def has_aggregates(self, thing):
+        # schemas created before the continuous aggregates lack them
+        user = thing.database.username.lower()
+        with self.db:
+            with self.db.cursor() as c:
+                c.execute(
+                    "SELECT count(*) FROM pg_class c JOIN pg_namespace n "
+                    "ON c.relnamespace = n.oid WHERE n.nspname = %s "
+                    "AND c.relname IN ('observation_1min', 'observation_1h')",
+                    (user,))
+                return c.fetchone()[0] == 2
+
     def get_datastreams(self, thing):
         user = thing.database.username.lower()
         with self.db:
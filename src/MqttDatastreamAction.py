@@ -4,176 +4,213 @@
 from __future__ import annotations
 
 import logging
+import threading
 import typing
-from functools import lru_cache
-from typing import Dict, Callable, List
+from typing import List
 
 from paho.mqtt.client import MQTTMessage
 
 from AbstractAction import AbstractAction
+import metrics
+import profiling
+from batch_buffer import BatchBuffer
+from datastores import (
+    DatastoreLease,
+    create_datastore,
+    dispose_datastore,
+    get_engine,
+)
+from frost_tables import FrostTables
+from observation_writer import CopyObservationWriter
+from parsers import ObservationBatch, Parser, get_parser
+from ttl_cache import TTLCache
 
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
-from datetime import datetime
-from tsm_datastore_lib.Observation import Observation
 from tsm_datastore_lib.SqlAlchemyDatastore import SqlAlchemyDatastore
 
 TOPIC_DELIMITER = "/"
 
 
-def campbell_cr6(payload: dict, origin: str) -> List[Observation]:
-    # the basic data massage looked like this
-    # {
-    #     "type": "Feature",
-    #     "geometry": {"type": "Point", "coordinates": [null, null, null]},
-    #     "properties": {
-    #         "loggerID": "CR6_18341",
-    #         "observationNames": ["Batt_volt_Min", "PTemp"],
-    #         "observations": {"2022-05-24T08:53:00Z": [11.9, 26.91]}
-    #     }
-    # }
-
-    properties = payload.get("properties")
-    if properties is None:
-        return []
-
-    out = []
-    for timestamp, values in properties["observations"].items():
-        for i, (key, value) in enumerate(zip(properties["observationNames"], values)):
-            obs = Observation(
-                timestamp=timestamp,
-                value=value,
-                position=i,
-                origin=origin,
-                header=key,
-            )
-            out.append(obs)
-    return out
-
-
-def ydoc_ml417(payload: dict, origin: str) -> List[Observation]:
-    # mqtt_ingest/test-logger-pb/test/data/jsn
-    # {
-    # "device":
-    #   {"sn":99073020,"name":"UFZ","v":"4.2B5","imei":353081090730204,"sim":89490200001536167920},
-    # "channels":[
-    #   {"code":"SB","name":"Signal","unit":"bars"},
-    #   {"code":"MINVi","name":"Min voltage","unit":"V"},
-    #   {"code":"AVGVi","name":"Average voltage","unit":"V"},
-    #   {"code":"AVGCi","name":"Average current","unit":"mA"},
-    #   {"code":"P1*","name":"pr2_1_10","unit":"m3/m3"},
-    #   {"code":"P2","name":"pr2_1_20","unit":"m3/m3"},
-    #   {"code":"P3","name":"pr2_1_30","unit":"m3/m3"},
-    #   {"code":"P4","name":"pr2_1_40","unit":"m3/m3"},
-    #   {}],
-    # "data":[
-    #   {"$ts":230116110002,"$msg":"WDT;pr2_1"},
-    #   {"$ts":230116110002,"MINVi":3.74,"AVGVi":3.94,"AVGCi":116,"P1*":"0*T","P2":"0*T","P3":"0*T","P4":"0*T"},
-    #   {}]}
-    if "data/jsn" not in origin:
-        return []
-
-    # data = payload['data'][1]
-    ret = []
-    for data in payload["data"]:
-
-        try:
-            ts = datetime.strptime(str(data["$ts"]), "%y%m%d%H%M%S")
-            ob0 = Observation(ts, data["MINVi"], origin, 0, header="MINVi")
-            ob1 = Observation(ts, data["AVGVi"], origin, 1, header="AVGCi")
-            ob2 = Observation(ts, data["AVGCi"], origin, 2, header="AVGCi")
-            ob3 = Observation(ts, data["P1*"], origin, 3, header="P1*")
-            ob4 = Observation(ts, data["P2"], origin, 4, header="P2")
-            ob5 = Observation(ts, data["P3"], origin, 5, header="P3")
-            ob6 = Observation(ts, data["P4"], origin, 6, header="P4")
-            ret.extend([ob0, ob1, ob2, ob3, ob4, ob5, ob6])
-        except KeyError as e:
-            pass
-    return ret
-
-
-def brightsky_dwd_api(payload: dict, origin: str) -> List[Observation]:
-    weather = payload["weather"]
-    timestamp = weather.pop("timestamp")
-    source = payload["sources"][0]
-
-    out = []
-
-    for property, value in weather.items():
-        try:
-            obs = Observation(
-                timestamp=timestamp,
-                value=value,
-                position=property,
-                origin=origin,
-                header=source,
-            )
-        except Exception as e:
-            continue
-        out.append(obs)
-
-    return out
+class ThingContext(DatastoreLease):
+    """Everything needed to ingest the messages of a thing, see `DatastoreLease`."""
 
+    __slots__ = ("schema", "uuid", "parser")
 
-def scripted_dummy(payload: dict, origin: str):
-
-    timestamp = datetime.now()
-
-    return [
-        Observation(
-            timestamp=timestamp,
-            value=payload["sine"],
-            position=0,
-            origin=origin,
-            header="sine",
-        ),
-        Observation(
-            timestamp=timestamp,
-            value=payload["cosine"],
-            position=1,
-            origin=origin,
-            header="cosine",
-        ),
-    ]
+    def __init__(
+        self, datastore: SqlAlchemyDatastore, schema: str, uuid: str, parser: Parser
+    ):
+        super().__init__(datastore)
+        self.schema = schema
+        self.uuid = uuid
+        self.parser = parser
 
 
 class MqttDatastreamAction(AbstractAction):
     # The maximum number of datastore instances (database connections) to be held
-    # @todo: Get it as optional command line parameter
     DATASTORE_CACHE_SIZE = 100
 
-    def __init__(self, root_topic, mqtt_broker, mqtt_user, mqtt_password, target_uri):
+    def __init__(
+        self,
+        root_topic,
+        mqtt_broker,
+        mqtt_user,
+        mqtt_password,
+        target_uri,
+        batch_size: int = 1,
+        batch_max_latency: float = 0.5,
+        writer: str = "orm",
+        datastore_cache_size: int = DATASTORE_CACHE_SIZE,
+        datastore_cache_ttl: float | None = None,
+        negative_cache_ttl: float | None = None,
+        frost_mapping_refresh: float = 300,
+    ):
+        """
+        :param batch_size: Number of observations per thing collected across
+            messages before they are written. 1 writes every message on its own.
+        :param batch_max_latency: Maximum time in seconds observations are
+            held back when batching.
+        :param writer: 'orm' stores observations through the datastore,
+            'copy' writes numeric observations of known datastreams with
+            `COPY` and uses the datastore only for the remaining ones.
+        :param datastore_cache_size: Maximum number of datastores held.
+        :param datastore_cache_ttl: Seconds after which a datastore is created
+            again, to pick up changed credentials or parsers.
+        :param negative_cache_ttl: Seconds for which unknown mqtt users are
+            remembered.
+        :param frost_mapping_refresh: Seconds after which the datastream
+            mapping behind the FROST views of a thing is refreshed, 0 never
+            refreshes it. Schemas without the tables are checked again after
+            as many seconds, or 300 with 0. The datastream bounds are updated
+            by every write.
+        """
         super().__init__(root_topic, mqtt_broker, mqtt_user, mqtt_password)
 
         self.target_uri = target_uri
-        self.auth_db = psycopg2.connect(target_uri)
+        # connected on the first lookup of a thing
+        self.auth_db = None
+        # the connection is shared by all workers of the pool
+        self.auth_db_lock = threading.Lock()
+
+        self.copy_writer: CopyObservationWriter | None = None
+        if writer == "copy":
+            self.copy_writer = CopyObservationWriter(get_engine(target_uri))
+        self.frost = FrostTables(get_engine(target_uri), frost_mapping_refresh)
+        # mqtt user -> pending observations, flushed with the thing's current
+        # context, which may have been evicted and loaded again meanwhile
+        self.buffer: BatchBuffer[str] | None = None
+        if batch_size > 1:
+            self.buffer = BatchBuffer(
+                self.__flush_observations,
+                batch_size,
+                batch_max_latency,
+                on_discard=self.metrics.discarded.inc,
+            )
+
+        # mqtt user -> thing
+        self.datastores: TTLCache[str, ThingContext] = TTLCache(
+            datastore_cache_size,
+            ttl=datastore_cache_ttl,
+            negative_ttl=negative_cache_ttl,
+            # unknown parsers are a misconfiguration as well
+            negative_errors=(LookupError, NotImplementedError),
+            on_evict=self.__on_datastore_evicted,
+        )
+        metrics.caches.register(self.__class__.__name__, "datastores", self.datastores)
 
     def act(self, content: typing.Any, message: MQTTMessage):
         topic = message.topic
         origin = f"{self.mqtt_broker}/{topic}"
+        mqtt_user = topic.split(TOPIC_DELIMITER)[1]
 
-        datastore = self.__get_datastore_by_topic(topic)
+        thing = self.__lease_thing(mqtt_user)
+        try:
+            profiling.mark("lookup")
+            batch = thing.parser(content, origin)
+            profiling.mark("parse")
+
+            if self.buffer is None:
+                self.store_observations(thing, [batch])
+            else:
+                self.buffer.add(mqtt_user, [batch], len(batch))
+        finally:
+            thing.release()
+
+    def __flush_observations(self, mqtt_user: str, batches: List[ObservationBatch]):
+        thing = self.__lease_thing(mqtt_user)
+        try:
+            self.store_observations(thing, batches)
+        finally:
+            thing.release()
 
-        parser = self.__get_parser(datastore)
-        observations = parser(content, origin)
+    def store_observations(self, thing: ThingContext, batches: List[ObservationBatch]):
+        batch = ObservationBatch.concat(batches)
+        if not batch:
+            return
 
+        self.__write_observations(thing, batch)
         try:
-            datastore.store_observations(observations)
-            datastore.insert_commit_chunk()
+            with self.metrics.db("update_frost_tables").time():
+                self.frost.update(thing.schema, thing.uuid, batch)
+            profiling.mark("frost")
+        except Exception as e:
+            # the observations are stored, don't write them again
+            self.logger.error(
+                f"Unable to update the FROST tables of {thing.schema!r}", exc_info=e
+            )
+
+    def __write_observations(self, thing: ThingContext, batch: ObservationBatch):
+        if self.copy_writer is not None:
+            with self.metrics.db("copy_observations").time():
+                batch = self.copy_writer.write(thing.schema, thing.uuid, batch)
+            profiling.mark("copy")
+            if not batch:
+                return
+            # the datastore creates the missing datastreams
+            self.copy_writer.forget(thing.schema, thing.uuid)
+
+        datastore = thing.datastore
+        try:
+            with self.metrics.db("store_observations").time():
+                datastore.store_observations(batch.observations())
+                profiling.mark("store")
+                datastore.insert_commit_chunk()
+                profiling.mark("commit")
         except Exception:
             datastore.session.rollback()
             raise
 
-    @lru_cache(maxsize=DATASTORE_CACHE_SIZE)
-    def __get_datastore_by_topic(self, topic):
+    def close(self):
+        if self.buffer is not None:
+            self.buffer.close()
+        self.datastores.clear()
+        self.logger.info(f"datastore cache: {self.datastores.stats()}")
+
+    def __lease_thing(self, mqtt_user: str) -> ThingContext:
         """
-        :param topic: e.g. 'mqtt_ingest/seefo_envimo_cr6_test_002/7ff34ed2-5e56-11ec-9b0a-54e1ad7c5c19'
+        :param mqtt_user: second level of the topic, e.g. 'seefo_envimo_cr6_test_002'
+            of 'mqtt_ingest/seefo_envimo_cr6_test_002/7ff34ed2-5e56-11ec-9b0a-54e1ad7c5c19'
         """
-        mqtt_user = topic.split(TOPIC_DELIMITER)[1]
+        while True:
+            thing = self.datastores.get(mqtt_user, self.__load_thing)
+            # evicted between the lookup and the lease, load it again
+            if thing.acquire():
+                return thing
+
+    def __on_datastore_evicted(self, mqtt_user: str, thing: ThingContext):
+        self.logger.debug(f"evicting datastore of {mqtt_user!r}")
+        # pending observations stay buffered under the mqtt user, disposed by
+        # the last writer if one is using it
+        thing.evict()
+
+    def __load_thing(self, mqtt_user: str) -> ThingContext:
         sql = "select * from mqtt_auth.mqtt_user u where u.username = %(username)s"
-        with self.auth_db:
-            with self.auth_db.cursor(cursor_factory=RealDictCursor) as c:
+        lookup = self.metrics.db("lookup_mqtt_user")
+        with lookup.time(), self.auth_db_lock:
+            if self.auth_db is None:
+                self.auth_db = psycopg2.connect(self.target_uri)
+            with self.auth_db, self.auth_db.cursor(cursor_factory=RealDictCursor) as c:
                 c: RealDictCursor
                 c.execute(sql, {"username": mqtt_user})
                 mqtt_auth = c.fetchone()
@@ -183,23 +220,15 @@ class MqttDatastreamAction(AbstractAction):
                 f"user {mqtt_user!r} is not present in authentication database"
             )
 
-        datastore = SqlAlchemyDatastore(
-            self.target_uri, mqtt_auth["thing_uuid"], mqtt_auth["db_schema"]
+        with self.metrics.db("load_thing").time():
+            datastore = create_datastore(
+                self.target_uri, mqtt_auth["thing_uuid"], mqtt_auth["db_schema"]
+            )
+        try:
+            parser = get_parser(datastore.sqla_thing.properties["default_parser"])
+        except NotImplementedError:
+            dispose_datastore(datastore)
+            raise
+        return ThingContext(
+            datastore, mqtt_auth["db_schema"], str(mqtt_auth["thing_uuid"]), parser
         )
-        return datastore
-
-    def __get_parser(
-        self, datastore: SqlAlchemyDatastore
-    ) -> Callable[[dict, str], List[Observation]]:
-        parser = datastore.sqla_thing.properties["default_parser"]
-
-        if parser == "campbell_cr6":
-            return campbell_cr6
-        if parser == "brightsky_dwd_api":
-            return brightsky_dwd_api
-        if parser == "ydoc_ml417":
-            return ydoc_ml417
-        if parser == "sine_dummy":
-            return scripted_dummy
-
-        raise NotImplementedError(f"parser {parser!r} not found.")
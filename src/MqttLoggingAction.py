@@ -3,49 +3,159 @@
 
 from __future__ import annotations
 
-from functools import lru_cache
-from collections import OrderedDict
+import typing
+
 from AbstractAction import AbstractAction, MQTTMessage
 
 from tsm_datastore_lib.JournalEntry import JournalEntry
 from tsm_datastore_lib.SqlAlchemyDatastore import SqlAlchemyDatastore
 
+import metrics
+import profiling
+from batch_buffer import BatchBuffer
+from datastores import DatastoreLease, create_datastore, get_engine
+from journal_writer import InsertJournalWriter, OverloadPolicy
+from ttl_cache import TTLCache
+
 TOPIC_DELIMITER = "/"
 
 
 class MqttLoggingAction(AbstractAction):
     # The maximum number of datastore instances (database connections) to be held
-    # @todo: Get it as optional command line parameter
     DATASTORE_CACHE_SIZE = 100
     SCHEMA_FILE = "./avro_schema_files/log_message.avsc"
 
-    def __init__(self, root_topic, mqtt_broker, mqtt_user, mqtt_password, target_uri):
+    def __init__(
+        self,
+        root_topic,
+        mqtt_broker,
+        mqtt_user,
+        mqtt_password,
+        target_uri,
+        datastore_cache_size: int = DATASTORE_CACHE_SIZE,
+        datastore_cache_ttl: float | None = None,
+        negative_cache_ttl: float | None = None,
+        batch_size: int = 1,
+        batch_max_latency: float = 1.0,
+        writer: str = "orm",
+        overload_policy: str = "keep",
+        overload_threshold: int = 10000,
+        overload_min_level: str = "WARNING",
+        overload_sample_rate: int = 10,
+    ):
+        """
+        :param batch_size: Number of log messages per thing collected before
+            they are written in one transaction. 1 writes every message on
+            its own.
+        :param batch_max_latency: Maximum time in seconds log messages are
+            held back when batching.
+        :param writer: 'orm' stores entries through the datastore, 'insert'
+            writes a batch with a single multi-row insert.
+        :param overload_policy: 'keep', 'drop' or 'sample' the messages below
+            `overload_min_level` while more than `overload_threshold`
+            messages wait for being written, queued for the workers or in
+            the batches, see `OverloadPolicy`.
+        """
         super().__init__(root_topic, mqtt_broker, mqtt_user, mqtt_password)
 
         self.target_uri = target_uri
-        self.datastores: OrderedDict[SqlAlchemyDatastore] = OrderedDict()
+        self.insert_writer: InsertJournalWriter | None = None
+        if writer == "insert":
+            self.insert_writer = InsertJournalWriter(get_engine(target_uri))
+        self.buffer: BatchBuffer[str] | None = None
+        if batch_size > 1:
+            self.buffer = BatchBuffer(
+                self.store_journal_entries,
+                batch_size,
+                batch_max_latency,
+                name=f"{self.__class__.__name__}-flusher",
+                on_discard=self.metrics.discarded.inc,
+            )
+        self.overload = OverloadPolicy(
+            overload_policy,
+            overload_threshold,
+            overload_min_level,
+            overload_sample_rate,
+        )
+        # device id -> datastore, disposed by the last writer if one is using it
+        self.datastores: TTLCache[str, DatastoreLease] = TTLCache(
+            datastore_cache_size,
+            ttl=datastore_cache_ttl,
+            negative_ttl=negative_cache_ttl,
+            on_evict=lambda device_id, lease: lease.evict(),
+        )
+        metrics.caches.register(self.__class__.__name__, "datastores", self.datastores)
 
-    def act(self, content: dict, message: MQTTMessage):
-        topic = message.topic
+    def act(self, content, message: MQTTMessage):
+        device_id = message.topic.split(TOPIC_DELIMITER)[1]
+        if not self.overload.admit(content.level, self.waiting()):
+            self.metrics.dropped.inc()
+            return
         log_entry = self.parse(content)
-        datastore = self.__get_datastore_by_topic(topic)
-        datastore.store_journal_entry(log_entry)
-        datastore.insert_commit_chunk()
+        profiling.mark("parse")
+        # unknown things fail the message, not the batch
+        self.__lease_datastore(device_id).release()
+        profiling.mark("lookup")
+        if self.buffer is None:
+            self.store_journal_entries(device_id, [log_entry])
+        else:
+            self.buffer.add(device_id, [log_entry])
+
+    def waiting(self) -> int:
+        """Messages queued for the workers or in batches, besides this one."""
+        waiting = 0
+        if self.pool is not None:
+            waiting += self.pool.pending() - 1
+        if self.buffer is not None:
+            waiting += self.buffer.pending()
+        return waiting
+
+    def store_journal_entries(self, device_id: str, entries: typing.List[JournalEntry]):
+        lease = self.__lease_datastore(device_id)
+        try:
+            self.__store(lease.datastore, entries)
+        finally:
+            lease.release()
+
+    def __store(self, datastore: SqlAlchemyDatastore, entries: typing.List[JournalEntry]):
+        if self.insert_writer is not None:
+            with self.metrics.db("insert_journal_entries").time():
+                self.insert_writer.write(datastore.sqla_thing.id, entries)
+            profiling.mark("store")
+            return
+
+        try:
+            with self.metrics.db("store_journal_entry").time():
+                for entry in entries:
+                    datastore.store_journal_entry(entry)
+                profiling.mark("store")
+                datastore.insert_commit_chunk()
+                profiling.mark("commit")
+        except Exception:
+            datastore.session.rollback()
+            raise
 
     def parse(self, content):
         return JournalEntry(
-            timestamp=content["timestamp"],
-            message=content["message"],
-            level=content["level"],
+            timestamp=content.timestamp,
+            message=content.message,
+            level=content.level,
             extra={},
         )
 
-    @lru_cache(maxsize=DATASTORE_CACHE_SIZE)
-    def __get_datastore_by_topic(self, topic):
-        """
-        :param topic: e.g. 'logging/7ff34ed2-5e56-11ec-9b0a-54e1ad7c5c19'
-        """
-        device_id = topic.split(TOPIC_DELIMITER)[1]
-        datastore = SqlAlchemyDatastore(self.target_uri, device_id)
-        self.datastores[topic] = datastore
-        return datastore
+    def close(self):
+        if self.buffer is not None:
+            self.buffer.close()
+        self.datastores.clear()
+        self.logger.info(f"datastore cache: {self.datastores.stats()}")
+
+    def __lease_datastore(self, device_id: str) -> DatastoreLease:
+        while True:
+            lease = self.datastores.get(device_id, self.__load_datastore)
+            # evicted between the lookup and the lease, load it again
+            if lease.acquire():
+                return lease
+
+    def __load_datastore(self, device_id: str) -> DatastoreLease:
+        with self.metrics.db("load_thing").time():
+            return DatastoreLease(create_datastore(self.target_uri, device_id))
@@ -17,12 +17,11 @@ class MqttUserAction(AbstractAction):
         super().__init__(topic, mqtt_broker, mqtt_user, mqtt_password)
         self.db = psycopg2.connect(database_settings.get("url"))
 
-    def act(self, content: dict, message: MQTTMessage):
+    def act(self, content: Thing, message: MQTTMessage):
         thing = Thing.get_instance(content)
-        if content["mqtt_authentication_credentials"]:
-            user = content["mqtt_authentication_credentials"]["username"]
-            pw = content["mqtt_authentication_credentials"]["password_hash"]
-            self.create_user(thing, user, pw)
+        credentials = thing.mqtt_authentication_credentials
+        if credentials:
+            self.create_user(thing, credentials.username, credentials.password_hash)
 
     def create_user(self, thing, user, pw):
         sql = (
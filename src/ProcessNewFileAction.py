@@ -1,12 +1,72 @@
-import json
+from __future__ import annotations
+
 import logging
+import typing
 from datetime import datetime
-from urllib import request
 
 from minio import Minio
 from minio.commonconfig import Tags
 
+import scheduler_client
 from AbstractAction import AbstractAction, MQTTMessage
+from bucket_tags import BucketTags
+
+
+PUT_EVENTS = ("s3:ObjectCreated:Put", "s3:ObjectCreated:CompleteMultipartUpload")
+
+
+class Job:
+    """A new file to be parsed by the scheduler."""
+
+    __slots__ = ("bucket_name", "filename", "data", "received")
+
+    def __init__(self, bucket_name: str, filename: str, tags: dict, source: str):
+        self.bucket_name = bucket_name
+        self.filename = filename
+        self.received = datetime.now().isoformat()
+        self.data = {
+            "parser": tags.get("thing_properties_default_parser"),
+            "target": tags.get("thing_database_url"),
+            "source": source,
+            "thing_uuid": tags.get("thing_uuid"),
+        }
+
+    def object_tags(self, result: dict | Exception) -> Tags:
+        """
+        Tags of the file after it was posted to the scheduler, with the
+        response of the scheduler or only the checkpoint if that failed.
+        The tags of an object are replaced as a whole, so they are written
+        once.
+        """
+        object_tags = Tags.new_object_tags()
+        object_tags["thing_uuid"] = self.data["thing_uuid"]
+        object_tags["checkpoint_process_new_file_action"] = self.received
+        if not isinstance(result, Exception):
+            object_tags["transmitted_to_scheduler"] = datetime.now().isoformat()
+            # Add some information about the scheduler, when we have some useful
+            # data from it
+            object_tags["scheduled_job_id"] = "23"
+            # When using a real scheduler, this will not work anymore because its
+            # async...
+            object_tags["parser_output"] = result.get("out")
+        return object_tags
+
+
+def files_by_bucket(records) -> typing.Dict[str, typing.List[str]]:
+    """Object keys of the records of an event, grouped by bucket."""
+    files: typing.Dict[str, typing.List[str]] = {}
+    for record in records:
+        files.setdefault(record.s3.bucket.name, []).append(record.s3.object.key)
+    return files
+
+
+def batch_results(jobs: typing.List[Job], response) -> typing.List[dict]:
+    """The responses of a batch post, one per job in the same order."""
+    if not isinstance(response, list) or len(response) != len(jobs):
+        raise ValueError(
+            f"Scheduler answered a batch of {len(jobs)} jobs with {response!r}"
+        )
+    return response
 
 
 class ProcessNewFileAction(AbstractAction):
@@ -21,6 +81,10 @@ class ProcessNewFileAction(AbstractAction):
         mqtt_password,
         minio_settings: dict,
         scheduler_settings: dict,
+        bucket_tags_cache_size: int = 1000,
+        bucket_tags_cache_ttl: float = 3600,
+        thing_topic: str | None = None,
+        scheduler_batch: bool = False,
     ):
         super().__init__(topic, mqtt_broker, mqtt_user, mqtt_password)
         self.minio_settings = minio_settings
@@ -30,51 +94,90 @@ class ProcessNewFileAction(AbstractAction):
             access_key=minio_settings.get("minio_access_key"),
             secret_key=minio_settings.get("minio_secure_key"),
         )
+        self.bucket_tags = BucketTags(
+            self.minio, self.metrics, bucket_tags_cache_size, bucket_tags_cache_ttl
+        )
+        self.thing_topic = thing_topic
 
         self.scheduler_settings = scheduler_settings
-        self.request = request.Request(scheduler_settings.get("url"), method="POST")
-        self.request.add_header("Content-Type", "application/json")
+        self.scheduler = scheduler_client.get_client(scheduler_settings)
+        # post all files of an event in one request, as a list of jobs
+        self.scheduler_batch = scheduler_batch
+
+    def subscriptions(self):
+        subscriptions = super().subscriptions()
+        if self.thing_topic:
+            # drop the cached tags of a bucket when its thing changes
+            subscriptions.append((self.thing_topic, self.bucket_tags.on_thing_message))
+        return subscriptions
 
-    def act(self, content: dict, message: MQTTMessage):
+    def act(self, content, message: MQTTMessage):
 
         # skip all messages that are not a put event
-        if content["EventName"] not in ("s3:ObjectCreated:Put", "s3:ObjectCreated:CompleteMultipartUpload"):
+        if content.EventName not in PUT_EVENTS:
             return
 
-        filename = content["Records"][0]["s3"]["object"]["key"]
-        bucket_name = content["Records"][0]["s3"]["bucket"]["name"]
-        tags = self.minio.get_bucket_tags(bucket_name)
-        thing_uuid = tags.get("thing_uuid")
-        thing_database = {
-            "user": tags.get("thing_database_user"),
-            "pass": tags.get("thing_database_pass"),
-            "url": tags.get("thing_database_url"),
-        }
+        jobs = []
+        failed = 0
+        for bucket_name, filenames in files_by_bucket(content.Records).items():
+            try:
+                tags = self.bucket_tags.get(bucket_name)
+            except Exception as e:
+                self.logger.error(f"Unable to read tags of {bucket_name!r}", exc_info=e)
+                failed += len(filenames)
+                continue
+            for filename in filenames:
+                try:
+                    source = self.minio.presigned_get_object(bucket_name, filename)
+                except Exception as e:
+                    self.logger.error(
+                        f"Unable to sign {bucket_name}/{filename}", exc_info=e
+                    )
+                    failed += 1
+                    continue
+                jobs.append(Job(bucket_name, filename, tags, source))
 
-        # add object tag with checkpoint and timestamp
-        object_tags = Tags.new_object_tags()
-        object_tags["thing_uuid"] = thing_uuid
-        object_tags["checkpoint_process_new_file_action"] = datetime.now().isoformat()
-        self.minio.set_object_tags(bucket_name, filename, object_tags)
+        for job, result in zip(jobs, self.submit(jobs)):
+            error = result if isinstance(result, Exception) else None
+            if error is not None:
+                self.logger.error(
+                    f"Unable to schedule {job.bucket_name}/{job.filename}",
+                    exc_info=error,
+                )
+            try:
+                with self.metrics.http("minio").time():
+                    self.minio.set_object_tags(
+                        job.bucket_name, job.filename, job.object_tags(result)
+                    )
+            except Exception as e:
+                self.logger.error(
+                    f"Unable to tag {job.bucket_name}/{job.filename}", exc_info=e
+                )
+                error = error or e
+            if error is not None:
+                failed += 1
 
-        # forward file to basic demo scheduler
-        data = {
-            "parser": tags.get("thing_properties_default_parser"),
-            "target": thing_database.get("url"),
-            "source": self.minio.presigned_get_object(bucket_name, filename),
-            "thing_uuid": thing_uuid,
-        }
+        if failed:
+            raise RuntimeError(
+                f"{failed} of {len(content.Records)} files of the event failed"
+            )
+
+    def submit(self, jobs: typing.List[Job]) -> typing.List[dict | Exception]:
+        """Post the jobs to the scheduler, return its response or the error."""
+        if self.scheduler_batch and len(jobs) > 1:
+            try:
+                with self.metrics.http("scheduler").time():
+                    return batch_results(
+                        jobs, self.scheduler.post([job.data for job in jobs])
+                    )
+            except Exception as e:
+                return [e] * len(jobs)
 
-        data = json.dumps(data)
-        data = data.encode()
-        r = request.urlopen(self.request, data=data)
-        resp = json.loads(r.read())
-
-        # add object tag with checkpoint and timestamp
-        # hint reuse tags object as the existing tags are overwritten otherweise
-        object_tags["transmitted_to_scheduler"] = datetime.now().isoformat()
-        # Add some information about the scheduler, when we have some useful data from it
-        object_tags["scheduled_job_id"] = "23"
-        # When using a real scheduler, this will not work anymore because its async...
-        object_tags["parser_output"] = resp.get("out")
-        self.minio.set_object_tags(bucket_name, filename, object_tags)
+        results = []
+        for job in jobs:
+            try:
+                with self.metrics.http("scheduler").time():
+                    results.append(self.scheduler.post(job.data))
+            except Exception as e:
+                results.append(e)
+        return results
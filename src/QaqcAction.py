@@ -1,10 +1,12 @@
-import json
+from __future__ import annotations
+
 import logging
-from urllib import request
 
 from paho.mqtt.client import MQTTMessage
 
+import scheduler_client
 from AbstractAction import AbstractAction
+from debouncer import Debouncer
 
 
 class QaqcAction(AbstractAction):
@@ -12,20 +14,45 @@ class QaqcAction(AbstractAction):
     SCHEMA_FILE = "./avro_schema_files/data_parsed_event.avsc"
 
     def __init__(
-        self, topic, mqtt_broker, mqtt_user, mqtt_password, scheduler_settings: dict
+        self,
+        topic,
+        mqtt_broker,
+        mqtt_user,
+        mqtt_password,
+        scheduler_settings: dict,
+        debounce_window: float = 0,
+        debounce_max_wait: float = 60,
     ):
 
         super().__init__(topic, mqtt_broker, mqtt_user, mqtt_password)
         self.scheduler_settings = scheduler_settings
-        self.request = request.Request(scheduler_settings.get("url"), method="POST")
-        self.request.add_header("Content-Type", "application/json")
-
-    def act(self, content: dict, message: MQTTMessage):
+        self.scheduler = scheduler_client.get_client(scheduler_settings)
+        # thing uuid -> database uri of the latest trigger, a burst of parsed
+        # files of a thing starts a single qaqc job
+        self.debouncer: Debouncer[str, str] | None = None
+        if debounce_window > 0:
+            self.debouncer = Debouncer(
+                self.schedule,
+                debounce_window,
+                debounce_max_wait,
+                on_coalesced=self.metrics.coalesced.inc,
+                name=f"{self.__class__.__name__}-debouncer",
+            )
+
+    def act(self, content, message: MQTTMessage):
+        if self.debouncer is None:
+            self.schedule(content.thing_uuid, content.db_uri)
+        else:
+            self.debouncer.trigger(content.thing_uuid, content.db_uri)
+
+    def schedule(self, thing_uuid: str, db_uri: str):
         data = {
-            "thing_uuid": content["thing_uuid"],
-            "target": content["db_uri"],
+            "thing_uuid": thing_uuid,
+            "target": db_uri,
         }
-        data = json.dumps(data)
-        data = data.encode()
-        r = request.urlopen(self.request, data=data)
-        resp = json.loads(r.read())
+        with self.metrics.http("scheduler").time():
+            resp = self.scheduler.post(data)
+
+    def close(self):
+        if self.debouncer is not None:
+            self.debouncer.close()
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import importlib
+import importlib.metadata
+import threading
+import typing
+
+if typing.TYPE_CHECKING:
+    from AbstractAction import AbstractAction
+
+# third party actions register themselves in this entry point group, i.e.
+# [project.entry-points."tsm_dispatcher.actions"]
+# MyAction = "my_package.actions:MyAction"
+ENTRY_POINT_GROUP = "tsm_dispatcher.actions"
+
+# name -> "module:class" of the actions shipped with the dispatcher
+BUILTIN_ACTIONS = {
+    name: f"{name}:{name}"
+    for name in (
+        "CreateThingOnMinioAction",
+        "ProcessNewFileAction",
+        "CreateThingInDatabaseAction",
+        "MqttDatastreamAction",
+        "MqttLoggingAction",
+        "QaqcAction",
+        "MqttUserAction",
+        "CreateNewFrostInstanceAction",
+        "CreateGrafanaDashboardAction",
+        "AsyncQaqcAction",
+        "AsyncProcessNewFileAction",
+        "AsyncMqttUserAction",
+    )
+}
+
+_loaded: typing.Dict[str, typing.Type[AbstractAction]] = {}
+_lock = threading.Lock()
+
+
+def _entry_points() -> typing.Dict[str, str]:
+    eps = importlib.metadata.entry_points()
+    if hasattr(eps, "select"):
+        eps = eps.select(group=ENTRY_POINT_GROUP)
+    else:  # python < 3.10
+        eps = eps.get(ENTRY_POINT_GROUP, [])
+    return {ep.name: ep.value for ep in eps}
+
+
+def available() -> typing.Dict[str, str]:
+    """All known action names and the location of their class."""
+    return {**BUILTIN_ACTIONS, **_entry_points()}
+
+
+def _import(path: str):
+    if ":" in path:
+        module, _, attr = path.partition(":")
+    else:
+        module, _, attr = path.rpartition(".")
+    if not module:
+        raise ImportError(f"{path!r} is neither 'module:class' nor 'module.class'")
+    return getattr(importlib.import_module(module), attr)
+
+
+def load(name: str) -> typing.Type[AbstractAction]:
+    """
+    Import and return the action class `name`, which is either the name of
+    a builtin action, the name of an entry point of the group
+    'tsm_dispatcher.actions' or a path like 'module:class' or
+    'module.class'. Modules are only imported on the first call.
+    """
+    with _lock:
+        cls = _loaded.get(name)
+        if cls is not None:
+            return cls
+        path = BUILTIN_ACTIONS.get(name)
+        if path is None:
+            path = _entry_points().get(name, name)
+        try:
+            cls = _import(path)
+        except (ImportError, AttributeError) as e:
+            raise LookupError(f"unable to load action {name!r}: {e}") from e
+        _loaded[name] = cls
+        return cls
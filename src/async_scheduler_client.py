@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import asyncio
+
+import aiohttp
+
+from scheduler_client import SchedulerError, _RetryableStatus, _RetryPolicy, logger
+
+# errors raised before the request was sent, see `scheduler_client.RETRY_ERRORS`
+ASYNC_RETRY_ERRORS = (
+    aiohttp.ClientConnectorError,
+    aiohttp.ConnectionTimeoutError,
+)
+
+
+class AsyncSchedulerClient(_RetryPolicy):
+    """
+    `SchedulerClient` for asyncio, with the same retries and circuit
+    breaker on a keep-alive aiohttp session. `open` and `close` it on the
+    event loop it is used on.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+        backoff_max: float = 10.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+    ):
+        super().__init__(
+            url, retries, backoff, backoff_max, failure_threshold, reset_timeout
+        )
+        self.timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=connect_timeout, sock_read=timeout
+        )
+        self.session: aiohttp.ClientSession | None = None
+
+    async def open(self):
+        self.session = aiohttp.ClientSession(timeout=self.timeout)
+
+    async def close(self):
+        await self.session.close()
+
+    async def post(self, data: dict | list) -> dict:
+        """Post `data` as json and return the decoded json response."""
+        self._check_circuit()
+        error: SchedulerError | None = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self._delay(attempt - 1))
+            try:
+                async with self.session.post(self.url, json=data) as r:
+                    status, body = r.status, await r.read()
+            except ASYNC_RETRY_ERRORS as e:
+                error = self._connect_failed(attempt, e)
+                continue
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise self._request_failed(e) from None
+            try:
+                return self._response(status, body)
+            except _RetryableStatus as e:
+                error = SchedulerError(str(e))
+                logger.debug(f"attempt {attempt + 1}: {error}")
+
+        raise self._retries_exhausted(error)
@@ -0,0 +1,336 @@
+from __future__ import annotations
+
+import typing
+from collections.abc import Mapping, Sequence
+
+INT_MIN, INT_MAX = -(2**31), 2**31 - 1
+LONG_MIN, LONG_MAX = -(2**63), 2**63 - 1
+
+Decoder = typing.Callable[[typing.Any], typing.Any]
+
+
+class SchemaValidationError(ValueError):
+    """A datum does not match its avro schema, `path` locates the field."""
+
+    def __init__(self, message: str, path: tuple = ()):
+        super().__init__(message, path)
+        self.message = message
+        self.path = path
+
+    def at(self, part: typing.Union[str, int]) -> SchemaValidationError:
+        return SchemaValidationError(self.message, (part,) + self.path)
+
+    def __str__(self):
+        location = ""
+        for part in self.path:
+            if isinstance(part, int):
+                location += f"[{part}]"
+            else:
+                location += f".{part}" if location else part
+        return f"{location or '<root>'}: {self.message}"
+
+
+class Struct:
+    """
+    Base of the classes records are decoded to.
+
+    Subclasses declare the fields of their record as `__slots__`. Decoded
+    instances are created without calling `__init__`.
+    """
+
+    __slots__ = ()
+
+    def __repr__(self):
+        fields = ", ".join(f"{f}={getattr(self, f, None)!r}" for f in self.__slots__)
+        return f"{self.__class__.__name__}({fields})"
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(
+            getattr(self, f, None) == getattr(other, f, None) for f in self.__slots__
+        )
+
+
+# avro full name -> class its records are decoded to, see `record`
+RECORD_TYPES: typing.Dict[str, type] = {}
+
+
+def record(name: str):
+    """
+    Decode records of the avro type `name` (full name, including the
+    namespace) to the decorated class. The class needs a slot per field,
+    `dict` keeps the validated mapping as it is.
+    """
+
+    def decorator(cls: type) -> type:
+        RECORD_TYPES[name] = cls
+        return cls
+
+    return decorator
+
+
+def _type_error(expected: str, datum) -> SchemaValidationError:
+    return SchemaValidationError(f"expected {expected}, got {type(datum).__name__}")
+
+
+def _null(datum):
+    if datum is not None:
+        raise _type_error("null", datum)
+    return None
+
+
+def _boolean(datum):
+    if datum is True or datum is False:
+        return datum
+    raise _type_error("boolean", datum)
+
+
+def _string(datum):
+    if isinstance(datum, str):
+        return datum
+    raise _type_error("string", datum)
+
+
+def _bytes(datum):
+    if isinstance(datum, (bytes, bytearray)):
+        return datum
+    raise _type_error("bytes", datum)
+
+
+def _integer(name: str, low: int, high: int) -> Decoder:
+    def decode(datum):
+        if isinstance(datum, int) and not isinstance(datum, bool):
+            if low <= datum <= high:
+                return datum
+            raise SchemaValidationError(f"{datum} is out of the range of {name}")
+        raise _type_error(name, datum)
+
+    return decode
+
+
+def _real(name: str) -> Decoder:
+    def decode(datum):
+        if isinstance(datum, (int, float)) and not isinstance(datum, bool):
+            return datum
+        raise _type_error(name, datum)
+
+    return decode
+
+
+PRIMITIVES: typing.Dict[str, Decoder] = {
+    "null": _null,
+    "boolean": _boolean,
+    "string": _string,
+    "bytes": _bytes,
+    "int": _integer("int", INT_MIN, INT_MAX),
+    "long": _integer("long", LONG_MIN, LONG_MAX),
+    "float": _real("float"),
+    "double": _real("double"),
+}
+
+# python types of the data matching an avro type, used to select union branches
+_PYTHON_TYPES = {
+    "null": (type(None),),
+    "boolean": (bool,),
+    "string": (str,),
+    "enum": (str,),
+    "bytes": (bytes, bytearray),
+    "fixed": (bytes, bytearray),
+    "int": (int,),
+    "long": (int,),
+    "float": (int, float),
+    "double": (int, float),
+    "array": (Sequence,),
+    "map": (Mapping,),
+    "record": (Mapping,),
+    "error": (Mapping,),
+}
+
+
+def _struct_class(name: str, fields: typing.List[str]) -> type:
+    if not all(f.isidentifier() for f in fields):
+        return dict
+    short = name.rpartition(".")[2]
+    cls = type(short, (Struct,), {"__slots__": tuple(fields), "__module__": __name__})
+    cls.__qualname__ = name
+    return cls
+
+
+class _Compiler:
+    def __init__(self, record_types: typing.Mapping[str, type]):
+        self.record_types = record_types
+        # full name -> [avro type, decoder], filled while compiling
+        self.named: typing.Dict[str, list] = {}
+
+    def avro_type(self, schema) -> str:
+        if isinstance(schema, list):
+            return "union"
+        if isinstance(schema, dict):
+            return schema["type"]
+        if schema in self.named:
+            return self.named[schema][0]
+        return schema
+
+    def compile(self, schema) -> Decoder:
+        if isinstance(schema, list):
+            return self.union(schema)
+        if isinstance(schema, str):
+            if schema in PRIMITIVES:
+                return PRIMITIVES[schema]
+            return self.reference(schema)
+
+        kind = schema["type"]
+        if kind in ("record", "error"):
+            return self.record(schema)
+        if kind == "array":
+            return self.array(schema)
+        if kind == "map":
+            return self.map(schema)
+        if kind == "enum":
+            return self.enum(schema)
+        if kind == "fixed":
+            return self.fixed(schema)
+        # {"type": "string", "logicalType": ...}
+        return self.compile(kind)
+
+    def reference(self, name: str) -> Decoder:
+        if name not in self.named:
+            raise ValueError(f"unknown avro type {name!r}")
+        entry = self.named[name]
+        # the decoder of a recursive record is set after its fields compiled
+        return lambda datum: entry[1](datum)
+
+    def record(self, schema: dict) -> Decoder:
+        name = schema["name"]
+        names = [f["name"] for f in schema["fields"]]
+        cls = self.record_types.get(name) or _struct_class(name, names)
+        if cls is not dict:
+            slots = {s for c in cls.__mro__ for s in getattr(c, "__slots__", ())}
+            missing = [n for n in names if n not in slots]
+            if missing:
+                raise TypeError(f"{cls.__name__} has no slots for fields {missing}")
+
+        entry = [schema["type"], None]
+        self.named[name] = entry
+        fields = [
+            (f["name"], f.get("default"), self.compile(f["type"]))
+            for f in schema["fields"]
+        ]
+        passthrough = cls is dict
+        new = object.__new__
+
+        def decode(datum):
+            if not isinstance(datum, Mapping):
+                raise _type_error(f"record {name}", datum)
+            obj = datum if passthrough else new(cls)
+            for field, default, decode_field in fields:
+                try:
+                    value = decode_field(datum.get(field, default))
+                except SchemaValidationError as e:
+                    if field not in datum:
+                        e = SchemaValidationError("required field is missing")
+                    raise e.at(field) from None
+                if not passthrough:
+                    setattr(obj, field, value)
+            return obj
+
+        entry[1] = decode
+        return decode
+
+    def array(self, schema: dict) -> Decoder:
+        items = self.compile(schema["items"])
+
+        def decode(datum):
+            if isinstance(datum, (str, bytes)) or not isinstance(datum, Sequence):
+                raise _type_error("array", datum)
+            out = []
+            for i, item in enumerate(datum):
+                try:
+                    out.append(items(item))
+                except SchemaValidationError as e:
+                    raise e.at(i) from None
+            return out
+
+        return decode
+
+    def map(self, schema: dict) -> Decoder:
+        values = self.compile(schema["values"])
+
+        def decode(datum):
+            if not isinstance(datum, Mapping):
+                raise _type_error("map", datum)
+            out = {}
+            for key, value in datum.items():
+                if not isinstance(key, str):
+                    raise SchemaValidationError("map keys must be strings")
+                try:
+                    out[key] = values(value)
+                except SchemaValidationError as e:
+                    raise e.at(key) from None
+            return out
+
+        return decode
+
+    def enum(self, schema: dict) -> Decoder:
+        symbols = frozenset(schema["symbols"])
+        name = schema["name"]
+
+        def decode(datum):
+            if isinstance(datum, str) and datum in symbols:
+                return datum
+            raise SchemaValidationError(f"{datum!r} is not a symbol of enum {name}")
+
+        self.named[name] = ["enum", decode]
+        return decode
+
+    def fixed(self, schema: dict) -> Decoder:
+        size = schema["size"]
+        name = schema["name"]
+
+        def decode(datum):
+            if isinstance(datum, (bytes, bytearray)) and len(datum) == size:
+                return datum
+            raise SchemaValidationError(f"expected {size} bytes of fixed {name}")
+
+        self.named[name] = ["fixed", decode]
+        return decode
+
+    def union(self, schema: list) -> Decoder:
+        branches = []
+        for branch in schema:
+            decode = self.compile(branch)
+            branches.append((_PYTHON_TYPES.get(self.avro_type(branch), object), decode))
+        if len(branches) == 1:
+            return branches[0][1]
+        expected = " or ".join(self.avro_type(b) for b in schema)
+
+        def decode_union(datum):
+            errors = []
+            for types, decode in branches:
+                if isinstance(datum, types):
+                    try:
+                        return decode(datum)
+                    except SchemaValidationError as e:
+                        errors.append(e)
+            if len(errors) == 1:
+                # the only branch of the right type reports the nested field
+                raise errors[0]
+            raise _type_error(expected, datum)
+
+        return decode_union
+
+
+def compile_schema(
+    schema, record_types: typing.Optional[typing.Mapping[str, type]] = None
+) -> Decoder:
+    """
+    Compile a parsed avro schema into a function, which validates a datum
+    and converts its records to `Struct` instances in a single pass.
+    Records are decoded to the classes registered with `record`, all
+    others to classes generated from the schema. Invalid data raises
+    `SchemaValidationError`.
+    """
+    if record_types is None:
+        record_types = RECORD_TYPES
+    return _Compiler(record_types).compile(schema)
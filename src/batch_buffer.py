@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import contextlib
+import logging
+import threading
+import time
+import typing
+
+K = typing.TypeVar("K")
+
+
+class _KeyLock:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+
+
+class _Batch:
+    __slots__ = ("items", "size", "deadline")
+
+    def __init__(self, deadline: float):
+        self.items = []
+        self.size = 0
+        self.deadline = deadline
+
+
+class BatchBuffer(typing.Generic[K]):
+    """
+    Collect items per key and hand them to `flush` in batches.
+
+    A batch is flushed when its size reaches `max_size` or when its oldest
+    item is older than `max_latency` seconds. The size of added items is
+    their number, unless given explicitly, i.e. the number of observations
+    of an added message. Flushes of the same key never run
+    concurrently and write its batches in the order they were collected.
+    A failing flush is retried `retries` times, afterwards the
+    batch is discarded and `on_discard` called with its number of items.
+    The `flush` callable is responsible for rolling back a failed write
+    before raising.
+    """
+
+    def __init__(
+        self,
+        flush: typing.Callable[[K, list], None],
+        max_size: int,
+        max_latency: float,
+        retries: int = 2,
+        name: str = "batch-flusher",
+        on_discard: typing.Callable[[int], None] | None = None,
+    ):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._flush = flush
+        self.max_size = max_size
+        self.max_latency = max_latency
+        self.retries = retries
+        self._on_discard = on_discard
+        self._lock = threading.Lock()
+        self._batches: typing.Dict[K, _Batch] = {}
+        # only keys with a pending or running flush have a lock
+        self._key_locks: typing.Dict[K, _KeyLock] = {}
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def add(self, key: K, items: typing.Sequence, size: int | None = None):
+        with self._lock:
+            batch = self._batches.get(key)
+            if batch is None:
+                batch = self._batches[key] = _Batch(time.monotonic() + self.max_latency)
+            batch.items.extend(items)
+            batch.size += len(items) if size is None else size
+            if batch.size < self.max_size:
+                return
+        self.flush_key(key)
+
+    @contextlib.contextmanager
+    def lock(self, key: K):
+        """Lock held while the batch of `key` is flushed."""
+        with self._lock:
+            key_lock = self._key_locks.get(key)
+            if key_lock is None:
+                key_lock = self._key_locks[key] = _KeyLock()
+            key_lock.users += 1
+        try:
+            with key_lock.lock:
+                yield
+        finally:
+            with self._lock:
+                key_lock.users -= 1
+                if not key_lock.users:
+                    del self._key_locks[key]
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(b.size for b in self._batches.values())
+
+    def flush_key(self, key: K, expired_at: float | None = None):
+        """
+        Flush the batch of `key`, if it expired at `expired_at` when given.
+
+        The batch is taken under the lock of the key, so batches of a key
+        are written in the order they were taken.
+        """
+        with self.lock(key):
+            with self._lock:
+                batch = self._batches.get(key)
+                if batch is None:
+                    return
+                if expired_at is not None and batch.deadline > expired_at:
+                    return
+                del self._batches[key]
+            self._write(key, batch.items)
+
+    def flush_all(self):
+        with self._lock:
+            keys = list(self._batches)
+        for key in keys:
+            self.flush_key(key)
+
+    def close(self):
+        """Stop the background flusher and flush everything pending."""
+        self._closed.set()
+        self._thread.join()
+        self.flush_all()
+
+    def _run(self):
+        while not self._closed.wait(self.max_latency / 2):
+            now = time.monotonic()
+            with self._lock:
+                expired = [k for k, b in self._batches.items() if b.deadline <= now]
+            for key in expired:
+                self.flush_key(key, expired_at=now)
+
+    def _write(self, key: K, items: list):
+        """Write a taken batch, called with the lock of `key` held."""
+        for attempt in range(self.retries + 1):
+            try:
+                self._flush(key, items)
+                return
+            except Exception as e:
+                if attempt < self.retries:
+                    self.logger.warning(
+                        f"Flushing {len(items)} items failed, retrying", exc_info=e
+                    )
+                    time.sleep(0.1 * (attempt + 1))
+                else:
+                    self.logger.error(
+                        f"Flushing {len(items)} items failed, discarding them",
+                        exc_info=e,
+                    )
+                    if self._on_discard is not None:
+                        self._on_discard(len(items))
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import logging
+import typing
+
+from paho.mqtt.client import MQTTMessage
+
+import decoding
+import metrics
+from ttl_cache import TTLCache
+
+if typing.TYPE_CHECKING:
+    from minio import Minio
+
+logger = logging.getLogger("bucket_tags")
+
+# buckets are tagged right after they are created, don't remember the
+# missing tags of a new bucket for long
+MISSING_TAGS_TTL = 10.0
+
+
+class BucketTags:
+    """
+    Cache of the tags of the raw data buckets.
+
+    `CreateThingOnMinioAction` tags the bucket of a thing once, with its uuid,
+    database and parser. The cached tags live for `ttl` seconds (0 keeps
+    them until evicted), subscribe `on_thing_message` to the thing events to
+    drop the tags of a bucket as soon as its thing changes.
+    """
+
+    def __init__(
+        self,
+        minio: Minio,
+        action_metrics: metrics.ActionMetrics,
+        maxsize: int = 1000,
+        ttl: float = 3600,
+    ):
+        self.minio = minio
+        self.metrics = action_metrics
+        self.cache: TTLCache[str, typing.Dict[str, str]] = TTLCache(
+            maxsize, ttl=ttl, negative_ttl=MISSING_TAGS_TTL
+        )
+        metrics.caches.register(action_metrics.action, "bucket_tags", self.cache)
+
+    def get(self, bucket_name: str) -> typing.Dict[str, str]:
+        """Tags of the bucket, raises `LookupError` if it has none."""
+        return self.cache.get(bucket_name, self.__load)
+
+    def __load(self, bucket_name: str) -> typing.Dict[str, str]:
+        with self.metrics.http("minio").time():
+            tags = self.minio.get_bucket_tags(bucket_name)
+        if not tags:
+            raise LookupError(f"Bucket {bucket_name!r} has no tags")
+        return dict(tags)
+
+    def on_thing_message(self, client, userdata, message: MQTTMessage):
+        try:
+            event = decoding.get_decoder().loads(message.payload)
+            bucket_name = event["raw_data_storage"]["bucket_name"]
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(
+                f"No bucket in thing event {message.mid}, dropping all cached "
+                f"bucket tags: {e!r}"
+            )
+            self.cache.clear()
+            return
+        logger.debug(f"Thing event for bucket {bucket_name!r}, dropping its tags")
+        self.cache.invalidate(bucket_name)
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import logging
+import threading
+import typing
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from tsm_datastore_lib import SqlAlchemyDatastore as datastore_module
+from tsm_datastore_lib.SqlAlchemyDatastore import SqlAlchemyDatastore
+
+logger = logging.getLogger("datastores")
+
+# settings of the connection pools, see `configure_engines`
+pool_settings = {"pool_size": 5, "max_overflow": 10, "pool_recycle": 3600}
+
+_engines: typing.Dict[str, Engine] = {}
+_engines_lock = threading.Lock()
+
+
+def configure_engines(pool_size: int, max_overflow: int, pool_recycle: int):
+    """Set the pool settings of engines created afterwards."""
+    pool_settings.update(
+        pool_size=pool_size, max_overflow=max_overflow, pool_recycle=pool_recycle
+    )
+
+
+def get_engine(uri: str) -> Engine:
+    """Return the engine of the process for `uri`, all things share its pool."""
+    with _engines_lock:
+        engine = _engines.get(uri)
+        if engine is None:
+            engine = _engines[uri] = create_engine(
+                uri, pool_pre_ping=True, **pool_settings
+            )
+            logger.debug(f"created engine with {pool_settings}")
+        return engine
+
+
+def _is_shared(engine: Engine) -> bool:
+    return any(engine.pool is e.pool for e in _engines.values())
+
+
+class SharedEngineDatastore(SqlAlchemyDatastore):
+    """
+    `SqlAlchemyDatastore` loading its thing through the shared engine of
+    `uri` instead of opening an engine of its own. Tables are mapped to
+    `schema` by schema translation and the search path is set at the start
+    of every transaction, so the same pooled connections serve all things.
+    """
+
+    def __init__(self, uri: str, thing_uuid: str, schema: str | None = None):
+        # read by initiate_connection, which the base class calls
+        self._shared_uri = uri
+        self._thing_uuid = thing_uuid
+        self._schema = schema
+        if schema is None:
+            super().__init__(uri, thing_uuid)
+        else:
+            super().__init__(uri, thing_uuid, schema)
+
+    def initiate_connection(self):
+        engine = get_engine(self._shared_uri)
+        if self._schema is not None:
+            engine = engine.execution_options(
+                schema_translate_map={None: self._schema}
+            )
+        session = Session(bind=engine)
+        if self._schema is not None:
+            search_path = engine.dialect.identifier_preparer.quote(self._schema)
+
+            @event.listens_for(session, "after_begin")
+            def set_search_path(session, transaction, connection):
+                connection.exec_driver_sql(f"SET LOCAL search_path TO {search_path}")
+
+        self.sqla_engine = engine
+        self.session = session
+        # the model the library queries its thing with
+        try:
+            thing = (
+                session.query(datastore_module.Thing)
+                .filter_by(uuid=self._thing_uuid)
+                .one_or_none()
+            )
+        finally:
+            # the connection goes back to the pool until the first write
+            session.close()
+        if thing is None:
+            raise LookupError(f"thing {self._thing_uuid!r} does not exist")
+        self.sqla_thing = session.merge(thing, load=False)
+
+
+def create_datastore(
+    uri: str, thing_uuid: str, schema: str | None = None
+) -> SqlAlchemyDatastore:
+    """Create a datastore working on the shared engine of `uri`."""
+    return SharedEngineDatastore(uri, thing_uuid, schema)
+
+
+def dispose_datastore(datastore: SqlAlchemyDatastore):
+    """
+    Close the session of `datastore` and the connections of its engine,
+    unless the engine is shared.
+    """
+    try:
+        engine = datastore.session.get_bind()
+        datastore.session.close()
+        if not _is_shared(engine):
+            engine.dispose()
+    except Exception as e:
+        logger.warning("Unable to dispose datastore", exc_info=e)
+
+
+class DatastoreLease:
+    """
+    A cached datastore, leased by the writers using it.
+
+    An evicted datastore is disposed once the last lease is released, as
+    its session must not be closed under a running write.
+    """
+
+    __slots__ = ("datastore", "_lock", "_leases", "_evicted")
+
+    def __init__(self, datastore: SqlAlchemyDatastore):
+        self.datastore = datastore
+        self._lock = threading.Lock()
+        self._leases = 0
+        self._evicted = False
+
+    def acquire(self) -> bool:
+        """Take a lease, False if the datastore was evicted already."""
+        with self._lock:
+            if self._evicted:
+                return False
+            self._leases += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._leases -= 1
+            dispose = self._evicted and self._leases == 0
+        if dispose:
+            dispose_datastore(self.datastore)
+
+    def evict(self):
+        with self._lock:
+            self._evicted = True
+            dispose = self._leases == 0
+        if dispose:
+            dispose_datastore(self.datastore)
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+K = typing.TypeVar("K")
+V = typing.TypeVar("V")
+
+
+class _Pending:
+    __slots__ = ("value", "first", "deadline", "count")
+
+    def __init__(self, value, now: float, window: float):
+        self.value = value
+        self.first = now
+        self.deadline = now + window
+        self.count = 1
+
+
+class Debouncer(typing.Generic[K, V]):
+    """
+    Coalesce triggers per key and hand the latest value to `fire`.
+
+    A key fires `window` seconds after its last trigger (trailing edge), but
+    no later than `max_wait` seconds after its first pending trigger, so a
+    steady stream of triggers still fires regularly. At most one `fire` per
+    key runs at a time, triggers meanwhile are collected and fire once it
+    returned. Different keys fire concurrently on up to `workers` threads.
+    """
+
+    def __init__(
+        self,
+        fire: typing.Callable[[K, V], None],
+        window: float,
+        max_wait: float,
+        workers: int = 4,
+        on_coalesced: typing.Callable[[], None] | None = None,
+        name: str = "debouncer",
+    ):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._fire = fire
+        self.window = window
+        self.max_wait = max(max_wait, window)
+        self.on_coalesced = on_coalesced
+        self._cond = threading.Condition()
+        self._pending: typing.Dict[K, _Pending] = {}
+        self._running: typing.Set[K] = set()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix=name)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def trigger(self, key: K, value: V):
+        now = time.monotonic()
+        with self._cond:
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = _Pending(value, now, self.window)
+                self._cond.notify()
+                return
+            pending.value = value
+            pending.count += 1
+            pending.deadline = min(now + self.window, pending.first + self.max_wait)
+        if self.on_coalesced is not None:
+            self.on_coalesced()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def close(self):
+        """Fire everything pending right away and wait for it."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _run(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                due = [
+                    key
+                    for key, p in self._pending.items()
+                    if key not in self._running and (self._closed or p.deadline <= now)
+                ]
+                for key in due:
+                    self._running.add(key)
+                    self._executor.submit(self._call, key, self._pending.pop(key))
+                if self._closed and not self._pending:
+                    return
+                waiting = [
+                    p.deadline
+                    for key, p in self._pending.items()
+                    if key not in self._running
+                ]
+                timeout = None
+                if waiting and not self._closed:
+                    timeout = max(0.0, min(waiting) - now)
+                # woken up by triggers and finished calls as well
+                self._cond.wait(timeout)
+
+    def _call(self, key: K, pending: _Pending):
+        try:
+            self._fire(key, pending.value)
+        except Exception as e:
+            self.logger.error(
+                f"Firing {key!r} after {pending.count} triggers failed", exc_info=e
+            )
+        finally:
+            with self._cond:
+                self._running.discard(key)
+                self._cond.notify()
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import json
+import logging
+import math
+import re
+import typing
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # optional
+    msgspec = None
+
+logger = logging.getLogger("decoding")
+
+BACKENDS = ("auto", "orjson", "msgspec", "json")
+
+# JSON numbers, which are converted without a JSON parser
+_NUMBER = re.compile(rb"-?(?:0|[1-9][0-9]*)(\.[0-9]+)?([eE][+-]?[0-9]+)?")
+
+# bare literals, including the non standard ones python's json module accepts
+_LITERALS = {
+    b"true": True,
+    b"false": False,
+    b"null": None,
+    b"NaN": math.nan,
+    b"Infinity": math.inf,
+    b"-Infinity": -math.inf,
+}
+
+_WHITESPACE = b" \t\n\r"
+
+
+def _decode_errors() -> typing.Tuple[typing.Type[Exception], ...]:
+    errors = (ValueError,)
+    if msgspec is not None:
+        errors += (msgspec.DecodeError,)
+    return errors
+
+
+_DECODE_ERRORS = _decode_errors()
+
+
+def _json_loads(backend: str) -> typing.Callable[[bytes], typing.Any]:
+    if backend == "auto":
+        backend = "orjson" if orjson else "msgspec" if msgspec else "json"
+    if backend == "orjson":
+        if orjson is None:
+            raise ImportError("JSON backend 'orjson' is not installed")
+        return orjson.loads
+    if backend == "msgspec":
+        if msgspec is None:
+            raise ImportError("JSON backend 'msgspec' is not installed")
+        return msgspec.json.decode
+    if backend == "json":
+        return json.loads
+    raise ValueError(f"unknown JSON backend {backend!r}, use one of {BACKENDS}")
+
+
+class PayloadDecoder:
+    """
+    Decode mqtt payloads directly from bytes.
+
+    The fast backends are stricter than python's json module, i.e. they
+    reject NaN. Payloads they refuse are decoded again with the json module,
+    so all backends accept the same input. Integers beyond 64 bit might be
+    returned as float by them.
+    """
+
+    def __init__(self, backend: str = "auto"):
+        self.backend = backend
+        self._loads = _json_loads(backend)
+
+    def loads(self, payload: bytes) -> typing.Any:
+        """Decode a JSON document, raises `ValueError` if it is invalid."""
+        try:
+            return self._loads(payload)
+        except _DECODE_ERRORS:
+            if self._loads is json.loads:
+                raise
+            return json.loads(payload)
+
+    def decode(self, payload: bytes) -> typing.Any:
+        """
+        Decode JSON documents and plain numbers, return any other payload
+        as string.
+
+        The kind of payload is detected from its first byte, so plain
+        string values do not go through a failing JSON parser.
+        """
+        value = payload.strip(_WHITESPACE)
+        if not value:
+            return payload.decode("utf-8")
+
+        first = value[:1]
+        if first in b"{[\"":
+            try:
+                return self.loads(value)
+            except ValueError:
+                return payload.decode("utf-8")
+
+        if first in b"-0123456789":
+            match = _NUMBER.fullmatch(value)
+            if match is not None:
+                if match.group(1) is None and match.group(2) is None:
+                    return int(value)
+                return float(value)
+
+        literal = _LITERALS.get(value, payload)
+        if literal is not payload:
+            return literal
+
+        # string / datetime / other
+        return payload.decode("utf-8")
+
+
+_default = PayloadDecoder("auto")
+
+
+def configure(backend: str):
+    """Select the JSON backend of the decoder returned by `get_decoder`."""
+    global _default
+    _default = PayloadDecoder(backend)
+    logger.debug(f"decoding JSON with {_default._loads.__module__}")
+
+
+def get_decoder() -> PayloadDecoder:
+    return _default
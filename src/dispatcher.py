@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import logging
+import os
+import signal
+import threading
+import typing
+
+import paho.mqtt.client as mqtt
+import yaml
+from paho.mqtt.client import MQTTMessage
+
+import mqtt_loop
+from AbstractAction import AbstractAction
+
+SHARED_SUBSCRIPTION_PREFIX = "$share/"
+
+
+def _topic_filter(subscription: str) -> str:
+    """Strip the `$share/<group>/` prefix of shared subscriptions."""
+    if subscription.startswith(SHARED_SUBSCRIPTION_PREFIX):
+        return subscription.split("/", 2)[2]
+    return subscription
+
+
+def _expand_env(value):
+    if isinstance(value, str):
+        return os.path.expandvars(value)
+    if isinstance(value, dict):
+        return {k: _expand_env(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_expand_env(v) for v in value]
+    return value
+
+
+def load_config(path: str) -> typing.List[dict]:
+    """
+    Read the action definitions of a dispatcher config file, i.e.
+
+        actions:
+          - action: MqttDatastreamAction
+            topic: mqtt_ingest/#
+            workers: 4            # optional, defaults to 0 (no pool)
+            max_in_flight: 100    # optional
+            ordering: thing       # optional, topic, thing or none
+            settings:             # keyword arguments of the action
+              target_uri: ${DATABASE_URL}
+
+    Environment variables in string values are expanded.
+    """
+    with open(path) as f:
+        config = yaml.safe_load(f)
+    actions = _expand_env(config.get("actions") or [])
+    for i, spec in enumerate(actions):
+        for key in ("action", "topic"):
+            if key not in spec:
+                raise ValueError(f"action #{i} in {path!r} has no {key!r}")
+    return actions
+
+
+class Dispatcher:
+    """
+    Run several actions over a single mqtt connection.
+
+    Every received message is routed to all actions with a subscription
+    matching its topic. Each action processes its messages on its own
+    worker pool, if it has one. Reading pauses while any of them is full.
+    """
+
+    def __init__(self, mqtt_broker, mqtt_user, mqtt_password):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.mqtt_broker = mqtt_broker
+        self.mqtt_user = mqtt_user
+        self.mqtt_password = mqtt_password
+        self.mqtt_host = self.mqtt_broker.split(":")[0]
+        self.mqtt_port = int(self.mqtt_broker.split(":")[1])
+        self.mqtt_client = mqtt.Client()
+
+        self.actions: typing.List[AbstractAction] = []
+        # (subscription, topic filter, callback)
+        self.routes: typing.List[typing.Tuple[str, str, typing.Callable]] = []
+        self._stop_event = threading.Event()
+
+    def add(self, action: AbstractAction):
+        self.actions.append(action)
+        for subscription, callback in action.subscriptions():
+            self.routes.append((subscription, _topic_filter(subscription), callback))
+            self.logger.info(
+                f"routing {subscription!r} to {action.__class__.__name__}"
+            )
+
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            self.logger.error(f"Failed to connect, return code {rc}")
+            return
+        self.logger.info(f"Connected to {self.mqtt_broker}")
+        subscriptions = sorted({s for s, _, _ in self.routes})
+        client.subscribe([(s, 0) for s in subscriptions])
+
+    def on_log(self, client, userdata, level, buf):
+        self.logger.debug(f"{buf}")
+
+    def on_message(self, client, userdata, message: MQTTMessage):
+        routed = False
+        for _, topic_filter, callback in self.routes:
+            if mqtt.topic_matches_sub(topic_filter, message.topic):
+                callback(client, userdata, message)
+                routed = True
+        if not routed:
+            self.logger.warning(f"no action for topic {message.topic!r}")
+
+    def on_sigterm(self, signum, frame):
+        self.logger.info("Received SIGTERM, shutting down")
+        self._stop_event.set()
+        self.mqtt_client.disconnect()
+
+    def accepts_messages(self) -> bool:
+        return all(action.accepts_messages() for action in self.actions)
+
+    def run_loop(self) -> typing.NoReturn:
+        self.mqtt_client.username_pw_set(self.mqtt_user, self.mqtt_password)
+        self.mqtt_client.on_connect = self.on_connect
+        self.mqtt_client.on_log = self.on_log
+        self.mqtt_client.on_message = self.on_message
+        self.mqtt_client.connect(self.mqtt_host, self.mqtt_port)
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.on_sigterm)
+        try:
+            mqtt_loop.loop_forever(
+                self.mqtt_client, self.accepts_messages, self._stop_event
+            )
+        finally:
+            for action in self.actions:
+                try:
+                    action.shutdown()
+                except Exception as e:
+                    self.logger.error(
+                        f"Unable to shut down {action.__class__.__name__}", exc_info=e
+                    )
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import logging
+import time
+from datetime import datetime
+from typing import Dict
+
+from psycopg2 import sql as psysql
+from sqlalchemy.engine import Engine
+
+from parsers import ObservationBatch
+
+# extend the first and last result and phenomenon time of the datastreams of
+# a batch, the phenomenon times are read from the written observations
+BOUNDS_SQL = psysql.SQL(
+    "INSERT INTO {schema}.datastream_bounds "
+    "(datastream_id, result_time_start, result_time_end, "
+    "phenomenon_time_start, phenomenon_time_end) "
+    "SELECT d.id, min(v.result_time), max(v.result_time), "
+    "min(o.phenomenon_time_start), max(o.phenomenon_time_end) "
+    "FROM unnest(%s::text[], %s::timestamptz[]) AS v (position, result_time) "
+    "JOIN {schema}.datastream d ON d.position = v.position "
+    "JOIN {schema}.thing t ON d.thing_id = t.id AND t.uuid = %s "
+    "LEFT JOIN {schema}.observation o "
+    "ON o.datastream_id = d.id AND o.result_time = v.result_time "
+    "GROUP BY d.id "
+    "ON CONFLICT (datastream_id) DO UPDATE SET "
+    "result_time_start = LEAST("
+    "datastream_bounds.result_time_start, EXCLUDED.result_time_start), "
+    "result_time_end = GREATEST("
+    "datastream_bounds.result_time_end, EXCLUDED.result_time_end), "
+    "phenomenon_time_start = LEAST("
+    "datastream_bounds.phenomenon_time_start, EXCLUDED.phenomenon_time_start), "
+    "phenomenon_time_end = GREATEST("
+    "datastream_bounds.phenomenon_time_end, EXCLUDED.phenomenon_time_end)"
+)
+
+MAPPING_SQL = psysql.SQL("SELECT {schema}.refresh_datastream_mapping()")
+
+# seconds until a schema without the tables is checked again, if the mapping
+# is never refreshed
+MISSING_RECHECK = 300.0
+
+
+class FrostTables:
+    """
+    Keep the tables behind the FROST views of a thing's schema up to date
+    while ingesting, see `migrations/0001_frost_tables.sql`.
+
+    `datastream_bounds` is extended by every written batch.
+    `datastream_mapping` is refreshed from `public.sms_datastream` at most
+    every `mapping_refresh` seconds per schema (0 never refreshes it).
+    Schemas provisioned before these tables existed are skipped, they are
+    checked again every `mapping_refresh` seconds to pick up migrations.
+    """
+
+    def __init__(self, engine: Engine, mapping_refresh: float = 300):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        # connections are borrowed from the pool of the engine
+        self.engine = engine
+        self.mapping_refresh = mapping_refresh
+        self.recheck = mapping_refresh or MISSING_RECHECK
+        # schema -> time of the last mapping refresh
+        self.schemas: Dict[str, float] = {}
+        # schema -> time the tables were found missing
+        self.missing: Dict[str, float] = {}
+
+    def update(self, schema: str, thing_uuid: str, batch: ObservationBatch):
+        if not batch:
+            return
+        checked = self.missing.get(schema)
+        if checked is not None and time.monotonic() - checked < self.recheck:
+            return
+        positions = [str(p) for p in batch.positions]
+        timestamps = [
+            ts.isoformat() if isinstance(ts, datetime) else ts
+            for ts in batch.timestamps
+        ]
+        conn = self.engine.raw_connection()
+        try:
+            with conn.cursor() as c:
+                if schema not in self.schemas:
+                    # bounds tables without the phenomenon times are skipped
+                    # as well, until the next check
+                    c.execute(
+                        "SELECT 1 FROM information_schema.columns "
+                        "WHERE table_schema = %s AND table_name = 'datastream_bounds' "
+                        "AND column_name = 'phenomenon_time_end'",
+                        (schema,),
+                    )
+                    if c.fetchone() is None:
+                        if checked is None:
+                            self.logger.info(f"no FROST tables in {schema!r}, skipping")
+                        self.missing[schema] = time.monotonic()
+                        return
+                    self.missing.pop(schema, None)
+                    self.schemas[schema] = float("-inf")
+                identifier = psysql.Identifier(schema)
+                c.execute(
+                    BOUNDS_SQL.format(schema=identifier),
+                    (positions, timestamps, thing_uuid),
+                )
+                now = time.monotonic()
+                refreshed = self.schemas[schema]
+                if self.mapping_refresh and now - refreshed >= self.mapping_refresh:
+                    c.execute(MAPPING_SQL.format(schema=identifier))
+                    self.schemas[schema] = now
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            # returns the connection to the pool
+            conn.close()
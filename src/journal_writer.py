@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import json
+import logging
+import random
+import typing
+
+from psycopg2.extras import execute_values
+from sqlalchemy.engine import Engine
+
+if typing.TYPE_CHECKING:
+    from tsm_datastore_lib.JournalEntry import JournalEntry
+
+# severity of the log levels, unknown levels are kept like errors
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "WARN": 30, "ERROR": 40}
+UNKNOWN_LEVEL = 40
+
+POLICIES = ("keep", "drop", "sample")
+
+
+def severity(level: str) -> int:
+    return LEVELS.get(level.upper(), UNKNOWN_LEVEL)
+
+
+class OverloadPolicy:
+    """
+    Decide which log messages are stored while the journal is overloaded,
+    i.e. more than `threshold` entries are waiting to be written.
+
+    'keep' stores everything, 'drop' discards messages below `min_level`
+    and 'sample' stores one of every `sample_rate` of them.
+    """
+
+    def __init__(
+        self,
+        policy: str = "keep",
+        threshold: int = 10000,
+        min_level: str = "WARNING",
+        sample_rate: int = 10,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overload policy {policy!r}, use {POLICIES}")
+        self.policy = policy
+        self.threshold = threshold
+        self.min_severity = severity(min_level)
+        self.sample_rate = sample_rate
+
+    def admit(self, level: str, pending: int) -> bool:
+        if self.policy == "keep" or pending < self.threshold:
+            return True
+        if severity(level) >= self.min_severity:
+            return True
+        if self.policy == "sample":
+            return random.randrange(self.sample_rate) == 0
+        return False
+
+
+class InsertJournalWriter:
+    """
+    Write journal entries of a thing with a single multi-row `INSERT`.
+
+    The table is resolved by the search path of the connection, as the
+    datastore does. Connections are borrowed from the pool of the engine.
+    """
+
+    def __init__(self, engine: Engine, page_size: int = 1000):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.engine = engine
+        self.page_size = page_size
+
+    def write(self, thing_id: int, entries: typing.Sequence[JournalEntry]):
+        rows = [
+            (e.timestamp, e.level, e.message, json.dumps(e.extra), thing_id)
+            for e in entries
+        ]
+        conn = self.engine.raw_connection()
+        try:
+            with conn.cursor() as c:
+                execute_values(
+                    c,
+                    'INSERT INTO journal ("timestamp", "level", "message", "extra", '
+                    '"thing_id") VALUES %s',
+                    rows,
+                    page_size=self.page_size,
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            # returns the connection to the pool
+            conn.close()
+        self.logger.debug(f"inserted {len(rows)} journal entries of thing {thing_id}")
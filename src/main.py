@@ -2,27 +2,24 @@ import json
 import logging
 import logging.config
 import os
+import signal
 import sys
 import uuid
 import warnings
 from json import loads, dumps
 
 import click
-import paho.mqtt.client as mqtt
 import yaml
 
-from CreateThingOnMinioAction import CreateThingOnMinioAction
-from ProcessNewFileAction import ProcessNewFileAction
-from CreateThingInDatabaseAction import CreateThingInDatabaseAction
-from MqttDatastreamAction import MqttDatastreamAction
-from MqttLoggingAction import MqttLoggingAction
-from QaqcAction import QaqcAction
-from MqttUserAction import MqttUserAction
-from CreateNewFrostInstanceAction import CreateNewFrostInstanceAction
-from CreateGrafanaDashboardAction import CreateGrafanaDashboardAction
+# Actions and their dependencies are imported by the registry when a command
+# needs them, starting a worker should not import the world.
+import action_registry
 
 logger: logging.Logger = None
 
+# commands working on the databases only, without the MQTT options
+OFFLINE_COMMANDS = ("provision-things", "migrate")
+
 __version__ = "0.0.1"
 
 
@@ -39,9 +36,8 @@ __version__ = "0.0.1"
 @click.option(
     "--topic",
     "-t",
-    help="mqtt topic name to subscribe.",
+    help="mqtt topic name to subscribe. Required by all commands except 'run'.",
     type=str,
-    required=True,
     show_envvar=True,
     envvar="TOPIC",
 )
@@ -49,8 +45,8 @@ __version__ = "0.0.1"
     "mqtt_broker",
     "--mqtt-broker",
     "-m",
-    help="MQTT broker to connect",
-    required=True,
+    help="MQTT broker to connect. Required by all commands except "
+    "'provision-things' and 'migrate'.",
     show_envvar=True,
     envvar="MQTT_BROKER",
 )
@@ -59,7 +55,6 @@ __version__ = "0.0.1"
     "--mqtt-user",
     "-u",
     help="MQTT user",
-    required=True,
     show_envvar=True,
     envvar="MQTT_USER",
 )
@@ -68,17 +63,177 @@ __version__ = "0.0.1"
     "--mqtt-password",
     "-p",
     help="MQTT password",
-    required=True,
     show_envvar=True,
     envvar="MQTT_PASSWORD",
 )
+@click.option(
+    "--reload-schemas",
+    is_flag=True,
+    help="Reload avro schema files when they change on disk.",
+    show_envvar=True,
+    envvar="RELOAD_SCHEMAS",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=0),
+    default=0,
+    help="Number of worker threads processing messages. "
+    "0 processes them on the network thread of the MQTT client.",
+    show_envvar=True,
+    envvar="WORKERS",
+)
+@click.option(
+    "--max-in-flight",
+    type=click.IntRange(min=1),
+    default=100,
+    help="Maximum number of queued or running messages when using workers. "
+    "Receiving pauses while the limit is reached.",
+    show_envvar=True,
+    envvar="MAX_IN_FLIGHT",
+)
+@click.option(
+    "--ordering",
+    type=click.Choice(["topic", "thing", "none"]),
+    default="topic",
+    help="Process messages of the same topic or the same thing (second topic "
+    "level) in order when using workers.",
+    show_envvar=True,
+    envvar="ORDERING",
+)
+@click.option(
+    "--db-pool-size",
+    type=click.IntRange(min=1),
+    default=5,
+    help="Number of database connections kept open per target database. "
+    "All things of a worker share them, so size it by concurrency.",
+    show_envvar=True,
+    envvar="DB_POOL_SIZE",
+)
+@click.option(
+    "--db-max-overflow",
+    type=click.IntRange(min=0),
+    default=10,
+    help="Number of database connections opened beyond the pool size under load.",
+    show_envvar=True,
+    envvar="DB_MAX_OVERFLOW",
+)
+@click.option(
+    "--db-pool-recycle",
+    type=int,
+    default=3600,
+    help="Seconds after which pooled database connections are replaced. "
+    "-1 keeps them forever.",
+    show_envvar=True,
+    envvar="DB_POOL_RECYCLE",
+)
+@click.option(
+    "--json-backend",
+    type=click.Choice(["auto", "orjson", "msgspec", "json"]),
+    default="auto",
+    help="Library decoding JSON payloads. 'auto' uses orjson or msgspec if "
+    "installed and falls back to python's json module.",
+    show_envvar=True,
+    envvar="JSON_BACKEND",
+)
+@click.option(
+    "--metrics-port",
+    type=click.IntRange(min=0, max=65535),
+    default=0,
+    help="Serve prometheus metrics on http://<host>:<port>/metrics. 0 disables it.",
+    show_envvar=True,
+    envvar="METRICS_PORT",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Sample the stacks of the threads processing messages and log the "
+    "duration of their stages at debug level. SIGUSR1 toggles profiling.",
+    show_envvar=True,
+    envvar="PROFILE",
+)
+@click.option(
+    "--profile-dir",
+    type=click.Path(file_okay=False),
+    default="profiles",
+    help="Directory of the collapsed stack files, one per action and dump.",
+    show_envvar=True,
+    envvar="PROFILE_DIR",
+)
+@click.option(
+    "--profile-interval",
+    type=click.FloatRange(min=0.001),
+    default=0.01,
+    help="Seconds between two stack samples.",
+    show_envvar=True,
+    envvar="PROFILE_INTERVAL",
+)
+@click.option(
+    "--profile-dump-interval",
+    type=click.FloatRange(min=1),
+    default=60,
+    help="Seconds between two dumps of the collected stacks.",
+    show_envvar=True,
+    envvar="PROFILE_DUMP_INTERVAL",
+)
 @click.pass_context
-def cli(ctx, topic, mqtt_broker, mqtt_user, mqtt_password, log_level):
+def cli(
+    ctx,
+    topic,
+    mqtt_broker,
+    mqtt_user,
+    mqtt_password,
+    log_level,
+    reload_schemas,
+    workers,
+    max_in_flight,
+    ordering,
+    db_pool_size,
+    db_max_overflow,
+    db_pool_recycle,
+    json_backend,
+    metrics_port,
+    profile,
+    profile_dir,
+    profile_interval,
+    profile_dump_interval,
+):
     global logger
+    if ctx.invoked_subcommand not in OFFLINE_COMMANDS:
+        for value, option in (
+            (mqtt_broker, "'--mqtt-broker' / '-m'"),
+            (mqtt_user, "'--mqtt-user' / '-u'"),
+            (mqtt_password, "'--mqtt-password' / '-p'"),
+        ):
+            if value is None:
+                raise click.UsageError(f"Missing option {option}.", ctx)
     setup_logging(log_level)
     logger = logging.getLogger("dispatcher-main")
     logger.debug(f"script started: {' '.join(sys.argv)!r}")
 
+    from schema_registry import registry as schema_registry
+
+    schema_registry.auto_reload = reload_schemas
+    schema_registry.preload()
+
+    import decoding
+
+    decoding.configure(json_backend)
+
+    if metrics_port:
+        import metrics
+
+        metrics.start_server(metrics_port)
+
+    import profiling
+
+    profiling.profiler.configure(profile_dir, profile_interval, profile_dump_interval)
+    if hasattr(signal, "SIGUSR1"):
+        profiling.install_signal_handler(signal.SIGUSR1)
+    if profile:
+        profiling.profiler.start()
+    # write the remaining samples
+    ctx.call_on_close(profiling.profiler.stop)
+
 
 def setup_logging(log_level):
     config = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logging.yaml")
@@ -92,6 +247,128 @@ def setup_logging(log_level):
     logging.getLogger().setLevel(log_level)
 
 
+def datastore_cache_options(command):
+    """Options of actions holding a datastore per thing."""
+    command = click.option(
+        "--negative-cache-ttl",
+        type=click.FloatRange(min=0),
+        default=60,
+        help="Seconds for which unknown things are remembered. 0 disables it.",
+        show_envvar=True,
+        envvar="NEGATIVE_CACHE_TTL",
+    )(command)
+    command = click.option(
+        "--datastore-cache-ttl",
+        type=click.FloatRange(min=0),
+        default=3600,
+        help="Seconds after which a cached datastore is created again to pick "
+        "up changed credentials or parsers. 0 keeps them until evicted.",
+        show_envvar=True,
+        envvar="DATASTORE_CACHE_TTL",
+    )(command)
+    command = click.option(
+        "--datastore-cache-size",
+        type=click.IntRange(min=1),
+        default=100,
+        help="Maximum number of datastores (database connections) held.",
+        show_envvar=True,
+        envvar="DATASTORE_CACHE_SIZE",
+    )(command)
+    return command
+
+
+def scheduler_options(command):
+    """Options of actions posting jobs to the scheduler."""
+    command = click.option(
+        "--scheduler-circuit-reset",
+        type=click.FloatRange(min=0),
+        default=30,
+        help="Seconds the scheduler is not called after too many failures.",
+        show_envvar=True,
+        envvar="SCHEDULER_CIRCUIT_RESET",
+    )(command)
+    command = click.option(
+        "--scheduler-circuit-threshold",
+        type=click.IntRange(min=1),
+        default=5,
+        help="Failed requests in a row after which the scheduler is not called "
+        "for --scheduler-circuit-reset seconds.",
+        show_envvar=True,
+        envvar="SCHEDULER_CIRCUIT_THRESHOLD",
+    )(command)
+    command = click.option(
+        "--scheduler-retries",
+        type=click.IntRange(min=0),
+        default=3,
+        help="Retries of a request after failed connection attempts and 429/503 "
+        "responses, with jittered exponential backoff.",
+        show_envvar=True,
+        envvar="SCHEDULER_RETRIES",
+    )(command)
+    command = click.option(
+        "--scheduler-timeout",
+        type=click.FloatRange(min=0, min_open=True),
+        default=30,
+        help="Seconds to wait for a response of the scheduler.",
+        show_envvar=True,
+        envvar="SCHEDULER_TIMEOUT",
+    )(command)
+    return command
+
+
+def scheduler_settings(url: str, params: dict) -> dict:
+    return {
+        "url": url,
+        "timeout": params["scheduler_timeout"],
+        "retries": params["scheduler_retries"],
+        "failure_threshold": params["scheduler_circuit_threshold"],
+        "reset_timeout": params["scheduler_circuit_reset"],
+    }
+
+
+asyncio_option = click.option(
+    "use_asyncio",
+    "--asyncio",
+    is_flag=True,
+    help="Process all messages as asyncio tasks on one thread with non-blocking "
+    "clients, up to --max-in-flight at a time. --workers is ignored.",
+    show_envvar=True,
+    envvar="ASYNCIO",
+)
+
+
+def configure_db_pool(ctx):
+    from datastores import configure_engines
+
+    params = ctx.find_root().params
+    configure_engines(
+        params["db_pool_size"], params["db_max_overflow"], params["db_pool_recycle"]
+    )
+
+
+def start_action(ctx, action):
+    params = ctx.parent.params
+    if params["topic"] is None:
+        raise click.UsageError("Missing option '--topic' / '-t'.", ctx)
+    if getattr(action, "is_async", False):
+        # one thread, max_in_flight limits the concurrent messages
+        action.use_worker_pool(0, params["max_in_flight"], params["ordering"])
+        logger.info(
+            f"Processing up to {params['max_in_flight']} messages concurrently, "
+            f"ordered by {params['ordering']}"
+        )
+    elif params["workers"] > 0:
+        action.use_worker_pool(
+            params["workers"], params["max_in_flight"], params["ordering"]
+        )
+        logger.info(
+            f"Processing messages with {params['workers']} workers, "
+            f"ordered by {params['ordering']}"
+        )
+    logger.info(f"Setup ok, starting service '{ctx.command.name}'")
+    action.run_loop()
+
+
 @cli.command()
 @click.argument("minio_url", type=str, envvar="MINIO_URL")
 @click.argument("minio_access_key", type=str, envvar="MINIO_ACCESS_KEY")
@@ -104,9 +381,23 @@ def setup_logging(log_level):
     envvar="MINIO_SECURE",
     help='Use to disable TLS ("HTTPS://") for testing. Do not disable it on production!',
 )
+@click.option(
+    "--minio-notification-arn",
+    type=str,
+    default="arn:minio:sqs::local:mqtt",
+    help="ARN of the minio notification target the put events of new buckets "
+    "are sent to.",
+    show_envvar=True,
+    envvar="MINIO_NOTIFICATION_ARN",
+)
 @click.pass_context
 def run_create_thing_on_minio_action_service(
-    ctx, minio_url, minio_access_key, minio_secure_key, minio_secure
+    ctx,
+    minio_url,
+    minio_access_key,
+    minio_secure_key,
+    minio_secure,
+    minio_notification_arn,
 ):
     topic = ctx.parent.params["topic"]
     mqtt_broker = ctx.parent.params["mqtt_broker"]
@@ -115,7 +406,7 @@ def run_create_thing_on_minio_action_service(
 
     logger.info(f"MQTT broker to connect: {mqtt_broker}")
 
-    action = CreateThingOnMinioAction(
+    action = action_registry.load("CreateThingOnMinioAction")(
         topic,
         mqtt_broker,
         mqtt_user,
@@ -126,37 +417,167 @@ def run_create_thing_on_minio_action_service(
             "minio_secure_key": minio_secure_key,
             "minio_secure": minio_secure,
         },
+        notification_arn=minio_notification_arn,
     )
 
-    logger.info(f"Setup ok, starting service '{ctx.command.name}'")
-    action.run_loop()
+    start_action(ctx, action)
 
 
 @cli.command()
 @click.argument("database_url", type=str, envvar="DATABASE_URL")
 # @click.argument('database_user', type=str, envvar='DATABASE_USER')
 # @click.argument('database_pass', type=str, envvar='DATABASE_PASS')
+@click.option(
+    "--compress-after",
+    type=str,
+    default="",
+    help="Compress the observations of a new thing older than this postgres "
+    "interval, e.g. '7 days'. Needs TimescaleDB 2.11 or later to ingest into "
+    "compressed chunks. Empty (default) disables compression.",
+    show_envvar=True,
+    envvar="COMPRESS_AFTER",
+)
 @click.pass_context
-def run_create_database_schema_action_service(ctx, database_url):
+def run_create_database_schema_action_service(ctx, database_url, compress_after):
     topic = ctx.parent.params["topic"]  # thing_created
     mqtt_broker = ctx.parent.params["mqtt_broker"]
     mqtt_user = ctx.parent.params["mqtt_user"]
     mqtt_password = ctx.parent.params["mqtt_password"]
 
-    action = CreateThingInDatabaseAction(
+    action = action_registry.load("CreateThingInDatabaseAction")(
         topic,
         mqtt_broker,
         mqtt_user,
         mqtt_password,
         database_settings={
             "url": database_url,
+            "compress_after": compress_after or None,
             # 'user': database_user,
             # 'pass': database_pass
         },
     )
 
-    logger.info(f"Setup ok, starting service '{ctx.command.name}'")
-    action.run_loop()
+    start_action(ctx, action)
+
+
+@cli.command()
+@click.argument("database_url", type=str, envvar="DATABASE_URL")
+@click.argument("events", type=click.File("r"))
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=100,
+    help="Number of things provisioned in one transaction.",
+    show_envvar=True,
+    envvar="PROVISION_BATCH_SIZE",
+)
+@click.option(
+    "--compress-after",
+    type=str,
+    default="",
+    help="Compress the observations of a new thing older than this postgres "
+    "interval, e.g. '7 days'. Needs TimescaleDB 2.11 or later to ingest into "
+    "compressed chunks. Empty (default) disables compression.",
+    show_envvar=True,
+    envvar="COMPRESS_AFTER",
+)
+def provision_things(database_url, events, batch_size, compress_after):
+    """
+    Create the database schemas of the things of the thing EVENTS file, a
+    json array or one event per line, without going through MQTT.
+    """
+    import psycopg2
+    from provisioning import Provisioner
+    from thing import Thing
+
+    text = events.read().strip()
+    if text.startswith("["):
+        contents = loads(text)
+    else:
+        contents = [loads(line) for line in text.splitlines() if line.strip()]
+    things = [Thing.get_instance(content) for content in contents]
+
+    provisioner = Provisioner(psycopg2.connect(database_url), compress_after or None)
+    failed = provisioner.provision_all(things, batch_size)
+    logger.info(f"Provisioned {len(things) - len(failed)} of {len(things)} things")
+    if failed:
+        raise click.ClickException(
+            f"{len(failed)} things failed: {', '.join(t.uuid for t in failed)}"
+        )
+
+
+@cli.command()
+@click.argument("database_url", type=str, envvar="DATABASE_URL")
+@click.argument("schemas", type=str, nargs=-1)
+@click.option(
+    "--source",
+    type=click.Choice(["mqtt_auth", "pg_namespace"]),
+    default="mqtt_auth",
+    help="Where to find the thing schemas without SCHEMAS: the schemas of "
+    "mqtt_auth.mqtt_user or all schemas with an observation table.",
+    show_envvar=True,
+    envvar="MIGRATE_SOURCE",
+)
+@click.option(
+    "--migrate-workers",
+    type=click.IntRange(min=1),
+    default=8,
+    help="Number of schemas migrated at a time, each on its own connection.",
+    show_envvar=True,
+    envvar="MIGRATE_WORKERS",
+)
+@click.option(
+    "--progress-interval",
+    type=click.FloatRange(min=0),
+    default=10,
+    help="Seconds between progress reports.",
+    show_envvar=True,
+    envvar="MIGRATE_PROGRESS_INTERVAL",
+)
+@click.option(
+    "--compress-after",
+    type=str,
+    default="",
+    help="Compress the observations older than this postgres interval, e.g. "
+    "'7 days'. Needs TimescaleDB 2.11 or later. Empty (default) leaves the "
+    "compression migration pending.",
+    show_envvar=True,
+    envvar="COMPRESS_AFTER",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    help="Only report the pending migrations.",
+)
+def migrate(
+    database_url,
+    schemas,
+    source,
+    migrate_workers,
+    progress_interval,
+    compress_after,
+    dry_run,
+):
+    """
+    Apply the pending migrations of the migrations directory to the thing
+    SCHEMAS, or to all of them. Runs resume where interrupted ones stopped.
+    """
+    from schema_migrations import Migrator, load_migrations
+
+    migrations = load_migrations()
+    logger.info(f"Migrations: {migrations}")
+    migrator = Migrator(
+        database_url,
+        migrations,
+        migrate_workers,
+        progress_interval,
+        settings={"compress_after": compress_after},
+    )
+    failed = migrator.run(list(schemas) or None, source, dry_run)
+    if failed:
+        raise click.ClickException(
+            f"{len(failed)} schemas failed: {', '.join(sorted(failed))}"
+        )
 
 
 @cli.command()
@@ -172,6 +593,42 @@ def run_create_database_schema_action_service(ctx, database_url):
     envvar="MINIO_SECURE",
     help='Use to disable TLS ("HTTPS://") for testing. Do not disable it on production!',
 )
+@click.option(
+    "--bucket-tags-cache-size",
+    type=click.IntRange(min=1),
+    default=1000,
+    help="Maximum number of buckets whose tags are cached.",
+    show_envvar=True,
+    envvar="BUCKET_TAGS_CACHE_SIZE",
+)
+@click.option(
+    "--bucket-tags-cache-ttl",
+    type=click.FloatRange(min=0),
+    default=3600,
+    help="Seconds after which the tags of a bucket are read again. 0 keeps "
+    "them until evicted.",
+    show_envvar=True,
+    envvar="BUCKET_TAGS_CACHE_TTL",
+)
+@click.option(
+    "--thing-topic",
+    type=str,
+    default=None,
+    help="Topic of the thing events, e.g. thing_created. The cached tags of "
+    "the bucket of a thing are dropped on its events.",
+    show_envvar=True,
+    envvar="THING_TOPIC",
+)
+@click.option(
+    "--scheduler-batch",
+    is_flag=True,
+    help="Post all files of a notification in one request, as a list of jobs. "
+    "The scheduler has to answer with a list of results in the same order.",
+    show_envvar=True,
+    envvar="SCHEDULER_BATCH",
+)
+@scheduler_options
+@asyncio_option
 @click.pass_context
 def run_process_new_file_service(
     ctx,
@@ -180,6 +637,15 @@ def run_process_new_file_service(
     minio_secure_key,
     scheduler_endpoint_url,
     minio_secure,
+    bucket_tags_cache_size,
+    bucket_tags_cache_ttl,
+    thing_topic,
+    scheduler_batch,
+    use_asyncio,
+    scheduler_timeout,
+    scheduler_retries,
+    scheduler_circuit_threshold,
+    scheduler_circuit_reset,
 ):
     topic = ctx.parent.params["topic"]
     mqtt_broker = ctx.parent.params["mqtt_broker"]
@@ -188,7 +654,8 @@ def run_process_new_file_service(
 
     logger.info(f"MQTT broker to connect: {mqtt_broker}")
 
-    action = ProcessNewFileAction(
+    name = "AsyncProcessNewFileAction" if use_asyncio else "ProcessNewFileAction"
+    action = action_registry.load(name)(
         topic,
         mqtt_broker,
         mqtt_user,
@@ -199,34 +666,125 @@ def run_process_new_file_service(
             "minio_secure_key": minio_secure_key,
             "minio_secure": minio_secure,
         },
-        scheduler_settings={"url": scheduler_endpoint_url},
+        scheduler_settings=scheduler_settings(scheduler_endpoint_url, ctx.params),
+        bucket_tags_cache_size=bucket_tags_cache_size,
+        bucket_tags_cache_ttl=bucket_tags_cache_ttl,
+        thing_topic=thing_topic,
+        scheduler_batch=scheduler_batch,
     )
 
-    logger.info(f"Setup ok, starting service '{ctx.command.name}'")
-    action.run_loop()
+    start_action(ctx, action)
 
 
 @cli.command()
 @click.option("-t", "--target-uri", type=str, help="datastore uri")
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of observations per thing collected across messages before "
+    "they are written to the database, e.g. 5000. 1 disables batching.",
+    show_envvar=True,
+    envvar="BATCH_SIZE",
+)
+@click.option(
+    "--batch-max-latency",
+    type=click.FloatRange(min=0, min_open=True),
+    default=0.5,
+    help="Maximum time in seconds observations are held back when batching.",
+    show_envvar=True,
+    envvar="BATCH_MAX_LATENCY",
+)
+@click.option(
+    "--writer",
+    type=click.Choice(["orm", "copy"]),
+    default="orm",
+    help="Write observations through the datastore library (orm) or with "
+    "PostgreSQL COPY (copy), which falls back to the datastore library for "
+    "unknown datastreams and non-numeric values.",
+    show_envvar=True,
+    envvar="OBSERVATION_WRITER",
+)
+@click.option(
+    "--frost-mapping-refresh",
+    type=click.FloatRange(min=0),
+    default=300,
+    help="Seconds after which the datastream mapping behind the FROST views of "
+    "a thing is refreshed from public.sms_datastream. 0 disables it.",
+    show_envvar=True,
+    envvar="FROST_MAPPING_REFRESH",
+)
+@datastore_cache_options
 @click.pass_context
-def parse_data(ctx, target_uri: str):
+def parse_data(
+    ctx,
+    target_uri: str,
+    batch_size: int,
+    batch_max_latency: float,
+    writer: str,
+    frost_mapping_refresh: float,
+    datastore_cache_size: int,
+    datastore_cache_ttl: float,
+    negative_cache_ttl: float,
+):
     topic = ctx.parent.params["topic"]
     mqtt_broker = ctx.parent.params["mqtt_broker"]
     mqtt_user = ctx.parent.params["mqtt_user"]
     mqtt_password = ctx.parent.params["mqtt_password"]
 
-    action = MqttDatastreamAction(
-        topic, mqtt_broker, mqtt_user, mqtt_password, target_uri
+    configure_db_pool(ctx)
+    action = action_registry.load("MqttDatastreamAction")(
+        topic,
+        mqtt_broker,
+        mqtt_user,
+        mqtt_password,
+        target_uri,
+        batch_size=batch_size,
+        batch_max_latency=batch_max_latency,
+        writer=writer,
+        frost_mapping_refresh=frost_mapping_refresh,
+        datastore_cache_size=datastore_cache_size,
+        datastore_cache_ttl=datastore_cache_ttl,
+        negative_cache_ttl=negative_cache_ttl,
     )
 
-    logger.info(f"Setup ok, starting service '{ctx.command.name}'")
-    action.run_loop()
+    start_action(ctx, action)
 
 
 @cli.command()
 @click.argument("scheduler_endpoint_url", type=str, envvar="SCHEDULER_ENDPOINT_URL")
+@click.option(
+    "--debounce-window",
+    type=click.FloatRange(min=0),
+    default=0,
+    help="Seconds to wait for further parsed data of a thing before its qaqc "
+    "job is started, triggers meanwhile start a single job. 0 starts a job "
+    "per trigger.",
+    show_envvar=True,
+    envvar="QAQC_DEBOUNCE_WINDOW",
+)
+@click.option(
+    "--debounce-max-wait",
+    type=click.FloatRange(min=0),
+    default=60,
+    help="Maximum seconds a qaqc job of a thing is delayed by --debounce-window.",
+    show_envvar=True,
+    envvar="QAQC_DEBOUNCE_MAX_WAIT",
+)
+@scheduler_options
+@asyncio_option
 @click.pass_context
-def run_QAQC(ctx, scheduler_endpoint_url: str):
+def run_QAQC(
+    ctx,
+    scheduler_endpoint_url: str,
+    debounce_window: float,
+    debounce_max_wait: float,
+    use_asyncio: bool,
+    scheduler_timeout: float,
+    scheduler_retries: int,
+    scheduler_circuit_threshold: int,
+    scheduler_circuit_reset: float,
+):
     topic = ctx.parent.params["topic"]
     mqtt_broker = ctx.parent.params["mqtt_broker"]
     mqtt_user = ctx.parent.params["mqtt_user"]
@@ -234,45 +792,151 @@ def run_QAQC(ctx, scheduler_endpoint_url: str):
 
     logger.info(f"MQTT broker to connect: {mqtt_broker}")
 
-    action = QaqcAction(
+    name = "AsyncQaqcAction" if use_asyncio else "QaqcAction"
+    action = action_registry.load(name)(
         topic,
         mqtt_broker,
         mqtt_user,
         mqtt_password,
-        scheduler_settings={"url": scheduler_endpoint_url},
+        scheduler_settings=scheduler_settings(scheduler_endpoint_url, ctx.params),
+        debounce_window=debounce_window,
+        debounce_max_wait=debounce_max_wait,
     )
 
-    logger.info(f"Setup ok, starting service '{ctx.command.name}'")
-    action.run_loop()
+    start_action(ctx, action)
 
 
 @cli.command()
 @click.option("-t", "--target-uri", type=str, help="datastore uri")
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of log messages per thing collected before they are written "
+    "in one transaction, e.g. 500. 1 disables batching.",
+    show_envvar=True,
+    envvar="BATCH_SIZE",
+)
+@click.option(
+    "--batch-max-latency",
+    type=click.FloatRange(min=0, min_open=True),
+    default=1.0,
+    help="Maximum time in seconds log messages are held back when batching.",
+    show_envvar=True,
+    envvar="BATCH_MAX_LATENCY",
+)
+@click.option(
+    "--writer",
+    type=click.Choice(["orm", "insert"]),
+    default="orm",
+    help="Write log messages through the datastore library (orm) or a batch "
+    "with a single multi-row INSERT (insert).",
+    show_envvar=True,
+    envvar="JOURNAL_WRITER",
+)
+@click.option(
+    "--overload-policy",
+    type=click.Choice(["keep", "drop", "sample"]),
+    default="keep",
+    help="What happens to log messages below --overload-min-level while more "
+    "than --overload-threshold messages wait for being written, in batches "
+    "(--batch-size) or queued for the --workers (up to --max-in-flight). drop "
+    "and sample need one of them.",
+    show_envvar=True,
+    envvar="OVERLOAD_POLICY",
+)
+@click.option(
+    "--overload-threshold",
+    type=click.IntRange(min=1),
+    default=10000,
+    help="Number of waiting log messages from which on the journal is overloaded.",
+    show_envvar=True,
+    envvar="OVERLOAD_THRESHOLD",
+)
+@click.option(
+    "--overload-min-level",
+    type=click.Choice(["DEBUG", "INFO", "WARNING", "ERROR"], case_sensitive=False),
+    default="WARNING",
+    help="Log messages of this level and above are always stored.",
+    show_envvar=True,
+    envvar="OVERLOAD_MIN_LEVEL",
+)
+@click.option(
+    "--overload-sample-rate",
+    type=click.IntRange(min=1),
+    default=10,
+    help="Store one of this many low level log messages with --overload-policy "
+    "sample.",
+    show_envvar=True,
+    envvar="OVERLOAD_SAMPLE_RATE",
+)
+@datastore_cache_options
 @click.pass_context
-def persist_log_messages_in_database_service(ctx, target_uri: str):
+def persist_log_messages_in_database_service(
+    ctx,
+    target_uri: str,
+    batch_size: int,
+    batch_max_latency: float,
+    writer: str,
+    overload_policy: str,
+    overload_threshold: int,
+    overload_min_level: str,
+    overload_sample_rate: int,
+    datastore_cache_size: int,
+    datastore_cache_ttl: float,
+    negative_cache_ttl: float,
+):
     topic = ctx.parent.params["topic"]
     mqtt_broker = ctx.parent.params["mqtt_broker"]
     mqtt_user = ctx.parent.params["mqtt_user"]
     mqtt_password = ctx.parent.params["mqtt_password"]
+    workers = ctx.parent.params["workers"]
+    max_in_flight = ctx.parent.params["max_in_flight"]
+    if overload_policy != "keep" and batch_size == 1:
+        if workers == 0 or overload_threshold >= max(max_in_flight, workers):
+            raise click.UsageError(
+                f"--overload-policy {overload_policy} needs --batch-size above 1, "
+                "or --workers with an --overload-threshold below --max-in-flight, "
+                "otherwise no messages wait.",
+                ctx,
+            )
 
-    action = MqttLoggingAction(topic, mqtt_broker, mqtt_user, mqtt_password, target_uri)
+    configure_db_pool(ctx)
+    action = action_registry.load("MqttLoggingAction")(
+        topic,
+        mqtt_broker,
+        mqtt_user,
+        mqtt_password,
+        target_uri,
+        datastore_cache_size=datastore_cache_size,
+        datastore_cache_ttl=datastore_cache_ttl,
+        negative_cache_ttl=negative_cache_ttl,
+        batch_size=batch_size,
+        batch_max_latency=batch_max_latency,
+        writer=writer,
+        overload_policy=overload_policy,
+        overload_threshold=overload_threshold,
+        overload_min_level=overload_min_level,
+        overload_sample_rate=overload_sample_rate,
+    )
 
-    logger.info(f"Setup ok, starting service '{ctx.command.name}'")
-    action.run_loop()
+    start_action(ctx, action)
 
 
 @cli.command()
 @click.argument("database_url", type=str, envvar="DATABASE_URL")
 # @click.argument('database_user', type=str, envvar='DATABASE_USER')
 # @click.argument('database_pass', type=str, envvar='DATABASE_PASS')
+@asyncio_option
 @click.pass_context
-def run_create_mqtt_user_action_service(ctx, database_url):
+def run_create_mqtt_user_action_service(ctx, database_url, use_asyncio):
     topic = ctx.parent.params["topic"]  # thing_created
     mqtt_broker = ctx.parent.params["mqtt_broker"]
     mqtt_user = ctx.parent.params["mqtt_user"]
     mqtt_password = ctx.parent.params["mqtt_password"]
 
-    action = MqttUserAction(
+    name = "AsyncMqttUserAction" if use_asyncio else "MqttUserAction"
+    action = action_registry.load(name)(
         topic,
         mqtt_broker,
         mqtt_user,
@@ -284,8 +948,7 @@ def run_create_mqtt_user_action_service(ctx, database_url):
         },
     )
 
-    logger.info(f"Setup ok, starting service '{ctx.command.name}'")
-    action.run_loop()
+    start_action(ctx, action)
 
 
 @cli.command()
@@ -302,7 +965,7 @@ def run_create_grafana_dashboard_service(
     mqtt_user = ctx.parent.params["mqtt_user"]
     mqtt_password = ctx.parent.params["mqtt_password"]
 
-    action = CreateGrafanaDashboardAction(
+    action = action_registry.load("CreateGrafanaDashboardAction")(
         topic,
         mqtt_broker,
         mqtt_user,
@@ -317,8 +980,7 @@ def run_create_grafana_dashboard_service(
         }
     )
 
-    logger.info(f"Setup ok, starting service '{ctx.command.name}'")
-    action.run_loop()
+    start_action(ctx, action)
 
 
 @cli.command()
@@ -330,7 +992,7 @@ def run_create_new_frost_server_service(ctx, database_url):
     mqtt_user = ctx.parent.params["mqtt_user"]
     mqtt_password = ctx.parent.params["mqtt_password"]
 
-    action = CreateNewFrostInstanceAction(
+    action = action_registry.load("CreateNewFrostInstanceAction")(
         topic,
         mqtt_broker,
         mqtt_user,
@@ -340,8 +1002,47 @@ def run_create_new_frost_server_service(ctx, database_url):
         },
     )
 
-    logger.info(f"Setup ok, starting service '{ctx.command.name}'")
-    action.run_loop()
+    start_action(ctx, action)
+
+
+@cli.command()
+@click.argument("config", type=click.Path(exists=True, dir_okay=False))
+@click.pass_context
+def run(ctx, config):
+    """
+    Run all actions of the CONFIG file in one process over one MQTT connection.
+    """
+    from dispatcher import Dispatcher, load_config
+
+    params = ctx.parent.params
+    configure_db_pool(ctx)
+    dispatcher = Dispatcher(
+        params["mqtt_broker"], params["mqtt_user"], params["mqtt_password"]
+    )
+
+    for spec in load_config(config):
+        try:
+            cls = action_registry.load(spec["action"])
+        except LookupError as e:
+            raise click.BadParameter(str(e), param_hint="CONFIG") from None
+        action = cls(
+            spec["topic"],
+            params["mqtt_broker"],
+            params["mqtt_user"],
+            params["mqtt_password"],
+            **spec.get("settings", {}),
+        )
+        workers = spec.get("workers", params["workers"])
+        if workers > 0 or getattr(action, "is_async", False):
+            action.use_worker_pool(
+                workers,
+                spec.get("max_in_flight", params["max_in_flight"]),
+                spec.get("ordering", params["ordering"]),
+            )
+        dispatcher.add(action)
+
+    logger.info(f"Setup ok, starting {len(dispatcher.actions)} actions")
+    dispatcher.run_loop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import logging
+import threading
+import typing
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily
+
+if typing.TYPE_CHECKING:
+    from ttl_cache import TTLCache
+
+logger = logging.getLogger("metrics")
+
+# message processing takes micro- to milliseconds, database and http calls
+# up to seconds
+STAGE_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0,
+)  # fmt: skip
+CALL_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0, 30.0,
+)  # fmt: skip
+
+MESSAGES = Counter(
+    "dispatcher_messages",
+    "Received mqtt messages.",
+    ["action", "subscription"],
+)
+ERRORS = Counter(
+    "dispatcher_message_errors",
+    "Discarded mqtt messages by the stage that failed.",
+    ["action", "subscription", "stage"],
+)
+STAGE_SECONDS = Histogram(
+    "dispatcher_stage_seconds",
+    "Duration of the stages of processing a message: parse, validate and act.",
+    ["action", "subscription", "stage"],
+    buckets=STAGE_BUCKETS,
+)
+IN_FLIGHT = Gauge(
+    "dispatcher_messages_in_flight",
+    "Received messages, which are queued or being processed.",
+    ["action"],
+)
+COALESCED = Counter(
+    "dispatcher_coalesced_triggers",
+    "Triggers merged into a pending one of the same key, i.e. qaqc runs of a thing.",
+    ["action"],
+)
+DROPPED = Counter(
+    "dispatcher_dropped_messages",
+    "Messages discarded by an overload policy, i.e. low severity log messages.",
+    ["action"],
+)
+DISCARDED = Counter(
+    "dispatcher_discarded_items",
+    "Items of batches discarded after their writes failed repeatedly, "
+    "i.e. observations or log messages.",
+    ["action"],
+)
+DB_SECONDS = Histogram(
+    "dispatcher_db_seconds",
+    "Duration of database calls.",
+    ["action", "operation"],
+    buckets=CALL_BUCKETS,
+)
+HTTP_SECONDS = Histogram(
+    "dispatcher_http_seconds",
+    "Duration of http calls, i.e. to the scheduler or the object storage.",
+    ["action", "target"],
+    buckets=CALL_BUCKETS,
+)
+
+
+class ActionMetrics:
+    """The metrics of a single action, with the label values bound once."""
+
+    STAGES = ("parse", "validate", "act")
+
+    def __init__(self, action: str, subscription: str):
+        self.action = action
+        self.messages = MESSAGES.labels(action, subscription)
+        self.in_flight = IN_FLIGHT.labels(action)
+        self.coalesced = COALESCED.labels(action)
+        self.dropped = DROPPED.labels(action)
+        self.discarded = DISCARDED.labels(action)
+        self.stages = {
+            stage: STAGE_SECONDS.labels(action, subscription, stage)
+            for stage in self.STAGES
+        }
+        self.errors = {
+            stage: ERRORS.labels(action, subscription, stage) for stage in self.STAGES
+        }
+        self.parse = self.stages["parse"]
+        self.validate = self.stages["validate"]
+        self.act = self.stages["act"]
+
+    def db(self, operation: str):
+        """Histogram of database calls, use as `with metrics.db("...").time():`"""
+        return DB_SECONDS.labels(self.action, operation)
+
+    def http(self, target: str):
+        """Histogram of http calls, use as `with metrics.http("...").time():`"""
+        return HTTP_SECONDS.labels(self.action, target)
+
+
+class CacheCollector:
+    """Expose the statistics of the registered `TTLCache`s on collection."""
+
+    def __init__(self):
+        self._caches: typing.Dict[typing.Tuple[str, str], TTLCache] = {}
+        self._lock = threading.Lock()
+
+    def register(self, action: str, name: str, cache: TTLCache):
+        with self._lock:
+            self._caches[(action, name)] = cache
+
+    def collect(self):
+        labels = ["action", "cache"]
+        size = GaugeMetricFamily(
+            "dispatcher_cache_size", "Cached entries.", labels=labels
+        )
+        hits = CounterMetricFamily(
+            "dispatcher_cache_hits", "Cache hits.", labels=labels
+        )
+        misses = CounterMetricFamily(
+            "dispatcher_cache_misses", "Cache misses.", labels=labels
+        )
+        negative = CounterMetricFamily(
+            "dispatcher_cache_negative_hits",
+            "Cache hits of cached lookup failures.",
+            labels=labels,
+        )
+        evictions = CounterMetricFamily(
+            "dispatcher_cache_evictions",
+            "Entries evicted from the cache.",
+            labels=labels,
+        )
+        ratio = GaugeMetricFamily(
+            "dispatcher_cache_hit_ratio",
+            "Hits (including negative hits) per lookup since start.",
+            labels=labels,
+        )
+        with self._lock:
+            caches = list(self._caches.items())
+        for key, cache in caches:
+            stats = cache.stats()
+            lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+            size.add_metric(key, stats["size"])
+            hits.add_metric(key, stats["hits"])
+            misses.add_metric(key, stats["misses"])
+            negative.add_metric(key, stats["negative_hits"])
+            evictions.add_metric(key, stats["evictions"])
+            if lookups:
+                found = stats["hits"] + stats["negative_hits"]
+                ratio.add_metric(key, found / lookups)
+        return [size, hits, misses, negative, evictions, ratio]
+
+
+caches = CacheCollector()
+REGISTRY.register(caches)
+
+
+def start_server(port: int, addr: str = "0.0.0.0"):
+    """Serve the metrics of the process on http://<addr>:<port>/metrics."""
+    start_http_server(port, addr)
+    logger.info(f"serving metrics on {addr}:{port}/metrics")
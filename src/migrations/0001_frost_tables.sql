@@ -0,0 +1,201 @@
+-- FROST views reading datastream_mapping and datastream_bounds instead of
+-- scanning the observations. New schemas run it while being provisioned,
+-- change the views in a new migration.
+
+--- CREATE VIEW "THINGS" ---
+CREATE OR REPLACE VIEW "THINGS" AS SELECT
+    id as "ID",
+    description as "DESCRIPTION",
+    properties as "PROPERTIES",
+    name as "NAME"
+FROM thing;
+
+--- CREATE VIEW SENSORS ---
+CREATE OR REPLACE VIEW "SENSORS" AS SELECT
+    id as "ID",
+    description as "DESCRIPTION",
+    text '' as "ENCODING_TYPE",
+    text '' as "METADATA",
+    short_name as "NAME",
+    jsonb_build_object(
+        'serial_number', serial_number,
+        'model', model
+        ) as "PROPERTIES"
+FROM public.sms_device;
+--- properties (json) or metadata (text) probably need to be built from several fields
+--- (e.g. model and serial number,...)
+
+--- CREATE VIEW OBS_PROPERTIES ---
+CREATE OR REPLACE VIEW "OBS_PROPERTIES" AS SELECT DISTINCT
+    reverse(split_part(reverse(property_uri), '/', 2))::bigint as "ID",
+    property_name as "NAME",
+    property_uri "DEFINITION",
+    text '' as "DESCRIPTION",
+    jsonb_build_object('property_1', 'some property',
+                       'property_2', 'some other property')
+        as "PROPERTIES"
+FROM public.sms_device_property sms_dp;
+
+--- CREATE TABLES BEHIND THE VIEWS ---
+-- The views below must not scan the observation table. The datastreams of
+-- the sms device properties and the first and last observation of every
+-- datastream are kept in these small tables instead. The dispatcher
+-- extends datastream_bounds while ingesting and calls
+-- refresh_datastream_mapping() regularly.
+CREATE TABLE IF NOT EXISTS "datastream_mapping"
+(
+    "datastream_id"      bigint                   NOT NULL,
+    "device_property_id" bigint                   NOT NULL,
+    "begin_date"         timestamp with time zone NOT NULL,
+    "end_date"           timestamp with time zone NULL
+);
+-- refreshes of older schemas may have left duplicates behind
+DELETE FROM "datastream_mapping" a USING "datastream_mapping" b
+    WHERE a.ctid < b.ctid
+        AND a.datastream_id = b.datastream_id
+        AND a.begin_date = b.begin_date;
+DROP INDEX IF EXISTS "datastream_mapping_datastream_id";
+CREATE UNIQUE INDEX IF NOT EXISTS "datastream_mapping_datastream_id_begin_date"
+    ON "datastream_mapping" ("datastream_id", "begin_date");
+CREATE INDEX IF NOT EXISTS "datastream_mapping_device_property_id"
+    ON "datastream_mapping" ("device_property_id");
+
+CREATE TABLE IF NOT EXISTS "datastream_bounds"
+(
+    "datastream_id"         bigint                   NOT NULL PRIMARY KEY,
+    "result_time_start"     timestamp with time zone NOT NULL,
+    "result_time_end"       timestamp with time zone NOT NULL,
+    "phenomenon_time_start" timestamp with time zone NULL,
+    "phenomenon_time_end"   timestamp with time zone NULL
+);
+ALTER TABLE "datastream_bounds"
+    ADD COLUMN IF NOT EXISTS "phenomenon_time_start" timestamp with time zone NULL,
+    ADD COLUMN IF NOT EXISTS "phenomenon_time_end" timestamp with time zone NULL;
+
+-- Concurrent refreshes of a schema (ingest workers, thing events) are
+-- serialized by a lock, each one sees the rows of the previous one.
+CREATE OR REPLACE FUNCTION refresh_datastream_mapping() RETURNS void
+LANGUAGE sql SET search_path FROM CURRENT AS $$
+    SELECT pg_advisory_xact_lock(hashtext(current_schema() || '.datastream_mapping'));
+    INSERT INTO datastream_mapping (datastream_id, device_property_id, begin_date, end_date)
+    SELECT DISTINCT ON (sms_ds.datastream_id::bigint, sms_ds.begin_date)
+           sms_ds.datastream_id::bigint, sms_ds.device_property_id::bigint,
+           sms_ds.begin_date, sms_ds.end_date
+    FROM public.sms_datastream sms_ds
+    JOIN datastream tsm_ds ON tsm_ds.id = sms_ds.datastream_id::bigint
+    ON CONFLICT (datastream_id, begin_date) DO UPDATE SET
+        device_property_id = EXCLUDED.device_property_id,
+        end_date = EXCLUDED.end_date;
+    DELETE FROM datastream_mapping m
+    WHERE NOT EXISTS (
+        SELECT 1 FROM public.sms_datastream sms_ds
+        WHERE sms_ds.datastream_id::bigint = m.datastream_id
+            AND sms_ds.begin_date = m.begin_date
+    );
+$$;
+
+-- one index lookup per datastream and end of the result times, used to
+-- fill the table of an existing schema. The phenomenon times are not
+-- indexed, they take a scan of the observations of every datastream.
+CREATE OR REPLACE FUNCTION refresh_datastream_bounds() RETURNS void
+LANGUAGE sql SET search_path FROM CURRENT AS $$
+    INSERT INTO datastream_bounds (datastream_id, result_time_start, result_time_end,
+                                   phenomenon_time_start, phenomenon_time_end)
+    SELECT * FROM (
+        SELECT
+            tsm_ds.id,
+            (SELECT min(result_time) FROM observation o WHERE o.datastream_id = tsm_ds.id),
+            (SELECT max(result_time) FROM observation o WHERE o.datastream_id = tsm_ds.id),
+            (SELECT min(phenomenon_time_start) FROM observation o WHERE o.datastream_id = tsm_ds.id),
+            (SELECT max(phenomenon_time_end) FROM observation o WHERE o.datastream_id = tsm_ds.id)
+        FROM datastream tsm_ds
+    ) b (datastream_id, result_time_start, result_time_end,
+         phenomenon_time_start, phenomenon_time_end)
+    WHERE result_time_start IS NOT NULL
+    ON CONFLICT (datastream_id) DO UPDATE SET
+        result_time_start = EXCLUDED.result_time_start,
+        result_time_end = EXCLUDED.result_time_end,
+        phenomenon_time_start = EXCLUDED.phenomenon_time_start,
+        phenomenon_time_end = EXCLUDED.phenomenon_time_end;
+$$;
+
+SELECT refresh_datastream_mapping();
+SELECT refresh_datastream_bounds();
+
+--- CREATE VIEW OBSERVATION ---
+-- replaced by datastream_mapping
+DROP VIEW IF EXISTS "dp_ds_mapping" CASCADE;
+DROP VIEW IF EXISTS "date_stream" CASCADE;
+DROP VIEW IF EXISTS "OBSERVATIONS" CASCADE;
+CREATE OR REPLACE VIEW "OBSERVATIONS" AS SELECT
+    phenomenon_time_start as "PHENOMENON_TIME_START",
+    phenomenon_time_end as "PHENOMENON_TIME_END",
+    tsm_obs.result_time as "RESULT_TIME",
+    CASE
+        WHEN result_type = 1 THEN 0
+        WHEN result_type = 2 THEN 1
+        WHEN result_type = 3 THEN 2
+        ELSE result_type
+    END as "RESULT_TYPE",
+    result_number as "RESULT_NUMBER",
+    result_boolean as "RESULT_BOOLEAN",
+    result_json as "RESULT_JSON",
+    result_string as "RESULT_STRING",
+    result_quality as "RESULT_QUALITY",
+    valid_time_start as "VALID_TIME_START",
+    valid_time_end as "VALID_TIME_END",
+    parameters as "PARAMETERS",
+    m.device_property_id as "DATASTREAM_ID",
+    bigint '1' as "FEATURE_ID",
+    null as "MULTI_DATASTREAM_ID",
+    -- unique without numbering all rows: milliseconds since the epoch and
+    -- the datastream id (below 10^6). Observations of a datastream less than
+    -- a millisecond apart share an ID, microseconds don't fit into a bigint
+    -- next to the datastream id.
+    (extract(epoch from tsm_obs.result_time) * 1000)::bigint * 1000000
+        + tsm_obs.datastream_id as "ID"
+FROM observation tsm_obs
+INNER JOIN datastream_mapping m ON tsm_obs.datastream_id = m.datastream_id
+    AND tsm_obs.result_time >= m.begin_date
+    AND (m.end_date IS NULL OR tsm_obs.result_time < m.end_date);
+
+--- CREATE VIEW DATASTREAMS ---
+DROP VIEW IF EXISTS "DATASTREAMS" CASCADE;
+CREATE OR REPLACE VIEW "DATASTREAMS" AS SELECT DISTINCT
+    sms_dp.id::bigint as "ID",
+    sms_dp.label as "NAME",
+    tsm_ds.description as "DESCRIPTION",
+    text '' as "OBSERVATION_TYPE",
+    obs.phenomenon_time_start as "PHENOMENON_TIME_START",
+    obs.phenomenon_time_end as "PHENOMENON_TIME_END",
+    obs.result_time_start as "RESULT_TIME_START",
+    obs.result_time_end as "RESULT_TIME_END",
+    sms_dp.device_id as "SENSOR_ID",
+    reverse(split_part(reverse(sms_dp.property_uri), '/', 2))::bigint as "OBS_PROPERTY_ID",
+    tsm_ds.thing_id::bigint as "THING_ID",
+    sms_dp.property_name as "UNIT_NAME",
+    sms_dp.unit_name as "UNIT_SYMBOL",
+    sms_dp.label as "UNIT_DEFINITION",
+    null as "OBSERVED_AREA",
+    '{}' as "PROPERTIES",
+    bigint '0' as "LAST_FOI_ID"
+FROM datastream tsm_ds
+INNER JOIN datastream_mapping m ON tsm_ds.id = m.datastream_id
+INNER JOIN public.sms_device_property sms_dp ON m.device_property_id = sms_dp.id::bigint
+INNER JOIN (
+    -- the bounds of the datastreams within the periods they were mapped,
+    -- exact as long as there are observations at the period boundaries
+    SELECT
+        m.device_property_id,
+        MIN(GREATEST(b.result_time_start, m.begin_date)) as result_time_start,
+        MAX(LEAST(b.result_time_end, m.end_date)) as result_time_end,
+        MIN(b.phenomenon_time_start) as phenomenon_time_start,
+        MAX(b.phenomenon_time_end) as phenomenon_time_end
+    FROM datastream_mapping m
+    INNER JOIN datastream_bounds b ON b.datastream_id = m.datastream_id
+    WHERE b.result_time_end >= m.begin_date
+        AND (m.end_date IS NULL OR b.result_time_start < m.end_date)
+    GROUP BY m.device_property_id
+    )
+    obs ON m.device_property_id = obs.device_property_id;
+
@@ -0,0 +1,20 @@
+-- compress the observations older than the compress_after setting, needs
+-- TimescaleDB 2.11 to upsert into compressed chunks
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM timescaledb_information.hypertables
+        WHERE hypertable_schema = current_schema()
+          AND hypertable_name = 'observation'
+          AND compression_enabled
+    ) THEN
+        ALTER TABLE observation SET (
+            timescaledb.compress,
+            timescaledb.compress_segmentby = 'datastream_id',
+            timescaledb.compress_orderby = 'result_time DESC'
+        );
+    END IF;
+END
+$$;
+
+SELECT public.add_compression_policy('observation', %(compress_after)s::interval, if_not_exists => true);
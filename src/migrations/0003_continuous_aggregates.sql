@@ -0,0 +1,53 @@
+-- migrate: no-transaction
+-- minute and hour rollups of the numeric observations, used by the grafana
+-- dashboards for long time ranges. TimescaleDB can't create continuous
+-- aggregates in a transaction, so every statement is committed on its own.
+-- Queries add the observations not materialized yet (materialized_only =
+-- false, no longer the default since TimescaleDB 2.13), the existing history
+-- is materialized once, the policies only refresh their recent offsets.
+CREATE MATERIALIZED VIEW IF NOT EXISTS observation_1min
+WITH (timescaledb.continuous) AS SELECT
+    datastream_id,
+    public.time_bucket(INTERVAL '1 minute', result_time) AS bucket,
+    avg(result_number) AS avg,
+    min(result_number) AS min,
+    max(result_number) AS max,
+    count(result_number) AS count
+FROM observation GROUP BY datastream_id, bucket WITH NO DATA;
+
+ALTER MATERIALIZED VIEW observation_1min SET (timescaledb.materialized_only = false);
+
+CALL public.refresh_continuous_aggregate('observation_1min', NULL, NULL);
+
+SELECT public.add_continuous_aggregate_policy('observation_1min',
+    start_offset => INTERVAL '1 day',
+    end_offset => INTERVAL '1 minute',
+    schedule_interval => INTERVAL '1 minute',
+    if_not_exists => true);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS observation_1h
+WITH (timescaledb.continuous) AS SELECT
+    datastream_id,
+    public.time_bucket(INTERVAL '1 hour', result_time) AS bucket,
+    avg(result_number) AS avg,
+    min(result_number) AS min,
+    max(result_number) AS max,
+    count(result_number) AS count
+FROM observation GROUP BY datastream_id, bucket WITH NO DATA;
+
+ALTER MATERIALIZED VIEW observation_1h SET (timescaledb.materialized_only = false);
+
+CALL public.refresh_continuous_aggregate('observation_1h', NULL, NULL);
+
+SELECT public.add_continuous_aggregate_policy('observation_1h',
+    start_offset => INTERVAL '7 days',
+    end_offset => INTERVAL '1 hour',
+    schedule_interval => INTERVAL '1 hour',
+    if_not_exists => true);
+
+-- the schema is named after its user
+DO $$
+BEGIN
+    EXECUTE format('GRANT SELECT ON observation_1min, observation_1h TO %I', current_schema());
+END
+$$;
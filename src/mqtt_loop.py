@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import logging
+import select
+import threading
+import typing
+
+import paho.mqtt.client as mqtt
+
+logger = logging.getLogger("mqtt_loop")
+
+# seconds between reconnection attempts, doubled up to the maximum
+RECONNECT_DELAY = 1.0
+RECONNECT_DELAY_MAX = 120.0
+
+# seconds between checks for free slots while reading is paused
+PAUSE_INTERVAL = 0.05
+
+
+def loop_forever(
+    client: mqtt.Client,
+    can_read: typing.Callable[[], bool],
+    stopping: threading.Event,
+    timeout: float = 1.0,
+):
+    """
+    Run the network loop of a connected `client` until `stopping` is set.
+
+    Unlike `Client.loop_forever`, reading from the socket pauses while
+    `can_read` returns False, e.g. while all slots of a worker pool are
+    taken, instead of blocking in the message callback. The unread messages
+    wait in the socket and at the broker. Acknowledgements and keep alive
+    pings are still sent meanwhile, and while a ping is unanswered the
+    socket is read anyway, or the client would drop the connection. The
+    messages read then exceed the limit. Lost connections are reestablished.
+    """
+    delay = RECONNECT_DELAY
+    while not stopping.is_set():
+        sock = client.socket()
+        if sock is None:
+            stopping.wait(delay)
+            if stopping.is_set():
+                break
+            try:
+                client.reconnect()
+                delay = RECONNECT_DELAY
+            except OSError as e:
+                logger.warning(f"Unable to reconnect: {e}")
+                delay = min(delay * 2, RECONNECT_DELAY_MAX)
+            continue
+
+        # paho 1.6 has no public accessor for the time of the pending ping
+        reading = can_read() or bool(getattr(client, "_ping_t", 0))
+        try:
+            readable, writable, _ = select.select(
+                [sock] if reading else [],
+                [sock] if client.want_write() else [],
+                [],
+                timeout if reading else PAUSE_INTERVAL,
+            )
+        except (OSError, ValueError):
+            # closed by another thread in the meantime
+            continue
+        rc = mqtt.MQTT_ERR_SUCCESS
+        if readable:
+            rc = client.loop_read()
+        if rc == mqtt.MQTT_ERR_SUCCESS and writable:
+            rc = client.loop_write()
+        if rc == mqtt.MQTT_ERR_SUCCESS:
+            client.loop_misc()
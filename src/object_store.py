@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import urllib3
+from minio import Minio, MinioAdmin
+from minio.commonconfig import GOVERNANCE, Tags
+from minio.credentials import StaticProvider
+from minio.notificationconfig import NotificationConfig, QueueConfig
+from minio.objectlockconfig import YEARS, ObjectLockConfig
+
+import metrics
+from thing import Thing
+
+# target of the put events of the raw data buckets, the mqtt notification
+# target configured on the minio server
+DEFAULT_NOTIFICATION_ARN = "arn:minio:sqs::local:mqtt"
+
+PUT_EVENTS = ["s3:ObjectCreated:*"]
+
+
+def bucket_policy(bucket_name: str) -> dict:
+    return {
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "s3:GetBucketLocation",
+                    "s3:GetObject",
+                    "s3:ListBucket",
+                    "s3:PutObject",
+                ],
+                "Resource": [
+                    f"arn:aws:s3:::{bucket_name}",
+                    f"arn:aws:s3:::{bucket_name}/*",
+                ],
+            }
+        ],
+    }
+
+
+def bucket_tags(thing: Thing) -> Tags:
+    tags = Tags.new_bucket_tags()
+    values = {
+        "thing_uuid": thing.uuid,
+        "thing_name": thing.name,
+        "thing_database_user": thing.database.username,
+        "thing_database_pass": thing.database.password,
+        "thing_database_url": thing.database.url,
+        "thing_properties_default_parser": thing.properties.get("default_parser"),
+    }
+    for key, value in values.items():
+        # readers use tags.get, a missing parser is left out
+        if value is not None:
+            tags[key] = str(value)
+    return tags
+
+
+class ObjectStore:
+    """
+    Create the user, policy and raw data bucket of a thing on minio.
+
+    The S3 and admin requests are signed in process and share one pool of
+    keep-alive connections. The user with its policy and the bucket with
+    its retention, notification and tags don't depend on each other and
+    are set up concurrently, on up to `workers` threads shared by all
+    things.
+    """
+
+    def __init__(
+        self,
+        minio_settings: dict,
+        action_metrics: metrics.ActionMetrics,
+        notification_arn: str = DEFAULT_NOTIFICATION_ARN,
+        workers: int = 8,
+    ):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.metrics = action_metrics
+        self.notification_arn = notification_arn
+        self.http = urllib3.PoolManager(
+            maxsize=workers,
+            timeout=urllib3.Timeout(connect=10, read=60),
+            retries=urllib3.Retry(
+                total=3, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]
+            ),
+        )
+        endpoint = minio_settings.get("minio_url")
+        secure = minio_settings.get("minio_secure", True)
+        access_key = minio_settings.get("minio_access_key")
+        secret_key = minio_settings.get("minio_secure_key")
+        self.minio = Minio(
+            endpoint,
+            secure=secure,
+            access_key=access_key,
+            secret_key=secret_key,
+            http_client=self.http,
+        )
+        self.admin = MinioAdmin(
+            endpoint=endpoint,
+            credentials=StaticProvider(access_key, secret_key),
+            secure=secure,
+            http_client=self.http,
+        )
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="minio")
+
+    def provision(self, thing: Thing):
+        storage = thing.raw_data_storage
+        futures = [
+            self.executor.submit(
+                self.create_user, storage.username, storage.password, storage.bucket_name
+            ),
+            self.executor.submit(self.create_bucket, storage.bucket_name, thing),
+        ]
+        # wait for both before raising, nothing is left running
+        errors = [f.exception() for f in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def create_user(self, username: str, password: str, bucket_name: str):
+        with self.metrics.http("minio").time():
+            self.admin.user_add(username, password)
+            self.admin.policy_add(username, policy=bucket_policy(bucket_name))
+            self.admin.policy_set(username, user=username)
+
+    def create_bucket(self, bucket_name: str, thing: Thing):
+        with self.metrics.http("minio").time():
+            if not self.minio.bucket_exists(bucket_name):
+                try:
+                    self.minio.make_bucket(bucket_name, object_lock=True)
+                except Exception as e:
+                    raise ValueError(
+                        f'Unable to create bucket "{bucket_name}": {e}'
+                    ) from None
+            self.minio.set_object_lock_config(
+                bucket_name, ObjectLockConfig(GOVERNANCE, 100, YEARS)
+            )
+            self.minio.set_bucket_notification(
+                bucket_name,
+                NotificationConfig(
+                    queue_config_list=[
+                        QueueConfig(queue=self.notification_arn, events=PUT_EVENTS)
+                    ]
+                ),
+            )
+            self.minio.set_bucket_tags(bucket_name, bucket_tags(thing))
+
+    def close(self):
+        self.executor.shutdown()
+        self.http.clear()
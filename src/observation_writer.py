@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import csv
+import io
+import logging
+import numbers
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from psycopg2 import sql as psysql
+from sqlalchemy.engine import Engine
+
+from parsers import ObservationBatch
+
+# result_type the datastore library stores numeric observations with, the
+# OBSERVATIONS view in migrations/0001_frost_tables.sql maps it to FROST's 0
+RESULT_TYPE_NUMBER = 1
+
+
+class CopyObservationWriter:
+    """
+    Write numeric observations with `COPY ... FROM STDIN` into the
+    observation table of a thing's schema.
+
+    The ids of the datastreams of a thing are cached. Observations of
+    unknown datastreams and non-numeric observations are not written but
+    returned by `write`, the caller stores them the slow way (which also
+    creates missing datastreams) and calls `forget` to refresh the cache.
+    Observations are consumed as columns, no object is created per value.
+    """
+
+    def __init__(self, engine: Engine):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        # connections are borrowed from the pool of the engine
+        self.engine = engine
+        # (schema, thing uuid) -> {position: datastream id}
+        self.datastreams: Dict[Tuple[str, str], Dict[str, int]] = {}
+
+    def forget(self, schema: str, thing_uuid: str):
+        self.datastreams.pop((schema, thing_uuid), None)
+
+    def _datastream_ids(self, cursor, schema: str, thing_uuid: str) -> Dict[str, int]:
+        ids = self.datastreams.get((schema, thing_uuid))
+        if ids is None:
+            cursor.execute(
+                psysql.SQL(
+                    "SELECT d.position, d.id FROM {schema}.datastream d "
+                    "JOIN {schema}.thing t ON d.thing_id = t.id WHERE t.uuid = %s"
+                ).format(schema=psysql.Identifier(schema)),
+                (thing_uuid,),
+            )
+            ids = self.datastreams[(schema, thing_uuid)] = dict(cursor.fetchall())
+        return ids
+
+    def write(
+        self, schema: str, thing_uuid: str, batch: ObservationBatch
+    ) -> ObservationBatch:
+        """
+        Copy the observations of `batch` into the observation table of `schema`.
+
+        :return: the observations which were not written
+        """
+        conn = self.engine.raw_connection()
+        try:
+            with conn.cursor() as c:
+                ids = self._datastream_ids(c, schema, thing_uuid)
+                rows, rest = self._rows(ids, batch)
+                if rows:
+                    self._copy(c, schema, rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            # returns the connection to the pool
+            conn.close()
+        self.logger.debug(
+            f"copied {len(rows)} observations into {schema!r}, "
+            f"{len(rest)} left for the datastore"
+        )
+        return rest
+
+    @staticmethod
+    def _rows(
+        ids: Dict[str, int], batch: ObservationBatch
+    ) -> Tuple[List[tuple], ObservationBatch]:
+        rows = []
+        rest = ObservationBatch(lenient=batch.lenient)
+        for ts, pos, value, header, origin in batch.rows():
+            ds_id = ids.get(str(pos))
+            if (
+                ds_id is None
+                or isinstance(value, bool)
+                or not isinstance(value, numbers.Real)
+            ):
+                rest.append(ts, pos, value, header, origin)
+                continue
+            if isinstance(ts, datetime):
+                ts = ts.isoformat()
+            rows.append((ts, value, ds_id))
+        return rows, rest
+
+    @staticmethod
+    def _copy(cursor, schema: str, rows: List[tuple]):
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        buf.seek(0)
+
+        # COPY does not support ON CONFLICT, so we copy into a staging table
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS observation_copy ("
+            "result_time timestamp with time zone, "
+            "result_number double precision, "
+            "datastream_id bigint"
+            ") ON COMMIT DELETE ROWS"
+        )
+        cursor.copy_expert("COPY observation_copy FROM STDIN WITH (FORMAT csv)", buf)
+        cursor.execute(
+            psysql.SQL(
+                "INSERT INTO {schema}.observation "
+                "(result_time, result_type, result_number, datastream_id) "
+                "SELECT DISTINCT ON (datastream_id, result_time) "
+                "result_time, {result_type}, result_number, datastream_id "
+                "FROM observation_copy "
+                "ON CONFLICT (datastream_id, result_time) DO UPDATE SET "
+                "result_type = EXCLUDED.result_type, "
+                "result_number = EXCLUDED.result_number"
+            ).format(
+                schema=psysql.Identifier(schema),
+                result_type=psysql.Literal(RESULT_TYPE_NUMBER),
+            )
+        )
+
@@ -0,0 +1,222 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from __future__ import annotations
+
+from datetime import datetime
+from itertools import repeat
+from typing import Callable, Dict, Iterator, List
+
+from tsm_datastore_lib.Observation import Observation
+
+
+class ObservationBatch:
+    """
+    Observations of one message (or several merged messages) as columns.
+
+    Parsers fill the columns without creating an `Observation` per value,
+    bulk writers consume them directly. `observations` creates the objects
+    for the datastore library when needed.
+    """
+
+    __slots__ = ("timestamps", "positions", "values", "headers", "origins", "lenient")
+
+    def __init__(self, lenient: bool = False):
+        self.timestamps: list = []
+        self.positions: list = []
+        self.values: list = []
+        self.headers: list = []
+        self.origins: list = []
+        # skip values the datastore library refuses instead of failing
+        self.lenient = lenient
+
+    def __len__(self):
+        return len(self.values)
+
+    def append(self, timestamp, position, value, header, origin):
+        self.timestamps.append(timestamp)
+        self.positions.append(position)
+        self.values.append(value)
+        self.headers.append(header)
+        self.origins.append(origin)
+
+    def extend(self, other: ObservationBatch):
+        self.timestamps.extend(other.timestamps)
+        self.positions.extend(other.positions)
+        self.values.extend(other.values)
+        self.headers.extend(other.headers)
+        self.origins.extend(other.origins)
+        self.lenient = self.lenient or other.lenient
+
+    @classmethod
+    def concat(cls, batches: List[ObservationBatch]) -> ObservationBatch:
+        if len(batches) == 1:
+            return batches[0]
+        out = cls()
+        for batch in batches:
+            out.extend(batch)
+        return out
+
+    def rows(self) -> Iterator[tuple]:
+        """Iterate over (timestamp, position, value, header, origin) tuples."""
+        return zip(
+            self.timestamps, self.positions, self.values, self.headers, self.origins
+        )
+
+    def observations(self) -> List[Observation]:
+        out = []
+        for ts, pos, value, header, origin in self.rows():
+            try:
+                obs = Observation(
+                    timestamp=ts,
+                    value=value,
+                    position=pos,
+                    origin=origin,
+                    header=header,
+                )
+            except Exception:
+                if not self.lenient:
+                    raise
+                continue
+            out.append(obs)
+        return out
+
+
+Parser = Callable[[dict, str], ObservationBatch]
+
+PARSERS: Dict[str, Parser] = {}
+
+
+def register(name: str) -> Callable[[Parser], Parser]:
+    """Register the decorated function as parser `name`."""
+
+    def decorator(parser: Parser) -> Parser:
+        PARSERS[name] = parser
+        return parser
+
+    return decorator
+
+
+def get_parser(name: str) -> Parser:
+    try:
+        return PARSERS[name]
+    except KeyError:
+        raise NotImplementedError(f"parser {name!r} not found.") from None
+
+
+@register("campbell_cr6")
+def campbell_cr6(payload: dict, origin: str) -> ObservationBatch:
+    # the basic data massage looked like this
+    # {
+    #     "type": "Feature",
+    #     "geometry": {"type": "Point", "coordinates": [null, null, null]},
+    #     "properties": {
+    #         "loggerID": "CR6_18341",
+    #         "observationNames": ["Batt_volt_Min", "PTemp"],
+    #         "observations": {"2022-05-24T08:53:00Z": [11.9, 26.91]}
+    #     }
+    # }
+    batch = ObservationBatch()
+    properties = payload.get("properties")
+    if properties is None:
+        return batch
+
+    names = properties["observationNames"]
+    positions = range(len(names))
+    for timestamp, values in properties["observations"].items():
+        n = min(len(names), len(values))
+        batch.timestamps.extend(repeat(timestamp, n))
+        batch.positions.extend(positions[:n])
+        batch.values.extend(values[:n])
+        batch.headers.extend(names[:n])
+    batch.origins = [origin] * len(batch.values)
+    return batch
+
+
+# code of the channel -> header, in the order of the datastream positions
+YDOC_ML417_CHANNELS = (
+    ("MINVi", "MINVi"),
+    ("AVGVi", "AVGCi"),
+    ("AVGCi", "AVGCi"),
+    ("P1*", "P1*"),
+    ("P2", "P2"),
+    ("P3", "P3"),
+    ("P4", "P4"),
+)
+
+
+def _ydoc_timestamp(ts) -> datetime:
+    # same as datetime.strptime(str(ts), "%y%m%d%H%M%S"), but much cheaper
+    s = str(ts)
+    if len(s) != 12 or not s.isdigit():
+        return datetime.strptime(s, "%y%m%d%H%M%S")
+    year = int(s[0:2])
+    # strptime's %y pivot
+    year += 2000 if year < 69 else 1900
+    return datetime(
+        year, int(s[2:4]), int(s[4:6]), int(s[6:8]), int(s[8:10]), int(s[10:12])
+    )
+
+
+@register("ydoc_ml417")
+def ydoc_ml417(payload: dict, origin: str) -> ObservationBatch:
+    # mqtt_ingest/test-logger-pb/test/data/jsn
+    # {
+    # "device":
+    #   {"sn":99073020,"name":"UFZ","v":"4.2B5","imei":353081090730204,"sim":89490200001536167920},
+    # "channels":[
+    #   {"code":"SB","name":"Signal","unit":"bars"},
+    #   {"code":"MINVi","name":"Min voltage","unit":"V"},
+    #   {"code":"AVGVi","name":"Average voltage","unit":"V"},
+    #   {"code":"AVGCi","name":"Average current","unit":"mA"},
+    #   {"code":"P1*","name":"pr2_1_10","unit":"m3/m3"},
+    #   {"code":"P2","name":"pr2_1_20","unit":"m3/m3"},
+    #   {"code":"P3","name":"pr2_1_30","unit":"m3/m3"},
+    #   {"code":"P4","name":"pr2_1_40","unit":"m3/m3"},
+    #   {}],
+    # "data":[
+    #   {"$ts":230116110002,"$msg":"WDT;pr2_1"},
+    #   {"$ts":230116110002,"MINVi":3.74,"AVGVi":3.94,"AVGCi":116,"P1*":"0*T","P2":"0*T","P3":"0*T","P4":"0*T"},
+    #   {}]}
+    batch = ObservationBatch()
+    if "data/jsn" not in origin:
+        return batch
+
+    codes = [code for code, _ in YDOC_ML417_CHANNELS]
+    headers = [header for _, header in YDOC_ML417_CHANNELS]
+    positions = range(len(codes))
+    for data in payload["data"]:
+        # rows without all channels (i.e. messages) are skipped
+        if "$ts" not in data or not all(code in data for code in codes):
+            continue
+        ts = _ydoc_timestamp(data["$ts"])
+        batch.timestamps.extend(repeat(ts, len(codes)))
+        batch.positions.extend(positions)
+        batch.values.extend([data[code] for code in codes])
+        batch.headers.extend(headers)
+    batch.origins = [origin] * len(batch.values)
+    return batch
+
+
+@register("brightsky_dwd_api")
+def brightsky_dwd_api(payload: dict, origin: str) -> ObservationBatch:
+    weather = payload["weather"]
+    timestamp = weather.pop("timestamp")
+    source = payload["sources"][0]
+
+    # the weather record holds values the datastore refuses, i.e. icon names
+    batch = ObservationBatch(lenient=True)
+    for property, value in weather.items():
+        batch.append(timestamp, property, value, source, origin)
+    return batch
+
+
+@register("sine_dummy")
+def scripted_dummy(payload: dict, origin: str) -> ObservationBatch:
+
+    timestamp = datetime.now()
+
+    batch = ObservationBatch()
+    batch.append(timestamp, 0, payload["sine"], "sine", origin)
+    batch.append(timestamp, 1, payload["cosine"], "cosine", origin)
+    return batch
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import collections
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import typing
+
+logger = logging.getLogger("profiling")
+
+
+class _Message:
+    __slots__ = ("action", "mid", "start", "last", "stages")
+
+    def __init__(self, action: str, mid: int):
+        self.action = action
+        self.mid = mid
+        self.start = self.last = time.perf_counter()
+        self.stages: typing.List[typing.Tuple[str, float]] = []
+
+
+class SamplingProfiler:
+    """
+    Sample the stacks of the threads processing messages and periodically
+    write them per action as collapsed stacks, i.e. for flamegraph.pl or
+    speedscope.
+
+    While enabled, the stages marked with `mark` are logged per message at
+    debug level. While disabled, callers skip `begin` and `end` and `mark`
+    returns right away, so the hot path only pays for checking `enabled`.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.directory = "profiles"
+        self.interval = 0.01
+        self.dump_interval = 60.0
+        self._local = threading.local()
+        # thread id -> name of the action processing a message on it
+        self._active: typing.Dict[int, str] = {}
+        # action -> collapsed stack -> number of samples
+        self._samples: typing.Dict[str, collections.Counter] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def configure(self, directory: str, interval: float, dump_interval: float):
+        self.directory = directory
+        self.interval = interval
+        self.dump_interval = dump_interval
+
+    def start(self):
+        with self._lock:
+            if self.enabled:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self.enabled = True
+            self._thread = threading.Thread(
+                target=self._run, name="profiler", daemon=True
+            )
+            self._thread.start()
+        logger.info(
+            f"profiling every {self.interval}s, writing stacks to "
+            f"{self.directory!r} every {self.dump_interval}s"
+        )
+
+    def stop(self):
+        with self._lock:
+            if not self.enabled:
+                return
+            self.enabled = False
+            thread, self._thread = self._thread, None
+        thread.join()
+        logger.info("profiling stopped")
+
+    def toggle(self):
+        if self.enabled:
+            self.stop()
+        else:
+            self.start()
+
+    def begin(self, action: str, mid: int):
+        self._local.message = _Message(action, mid)
+        self._active[threading.get_ident()] = action
+
+    def mark(self, stage: str):
+        message = getattr(self._local, "message", None)
+        if message is None:
+            return
+        now = time.perf_counter()
+        message.stages.append((stage, now - message.last))
+        message.last = now
+
+    def end(self):
+        self._active.pop(threading.get_ident(), None)
+        message = getattr(self._local, "message", None)
+        if message is None:
+            return
+        self._local.message = None
+        total = time.perf_counter() - message.start
+        stages = " ".join(f"{s}={d * 1000:.3f}ms" for s, d in message.stages)
+        logger.debug(
+            f"{message.action} message {message.mid}: {stages} "
+            f"total={total * 1000:.3f}ms"
+        )
+
+    def _run(self):
+        next_dump = time.monotonic() + self.dump_interval
+        while self.enabled:
+            time.sleep(self.interval)
+            self.sample()
+            if time.monotonic() >= next_dump:
+                self.dump()
+                next_dump += self.dump_interval
+        self.dump()
+
+    def sample(self):
+        frames = sys._current_frames()
+        for ident, action in list(self._active.items()):
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} "
+                    f"({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            stack.reverse()
+            samples = self._samples.setdefault(action, collections.Counter())
+            samples[";".join(stack)] += 1
+
+    def dump(self):
+        samples, self._samples = self._samples, {}
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        for action, stacks in samples.items():
+            name = f"{action}-{os.getpid()}-{stamp}.collapsed"
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, "w") as f:
+                    for stack, count in stacks.most_common():
+                        f.write(f"{stack} {count}\n")
+            except OSError as e:
+                logger.error(f"Unable to write profile {path!r}", exc_info=e)
+                continue
+            logger.info(f"wrote {sum(stacks.values())} samples to {path!r}")
+
+
+# shared by all actions of the process
+profiler = SamplingProfiler()
+
+
+def mark(stage: str):
+    """Record the end of `stage` of the current message, if profiling."""
+    if profiler.enabled:
+        profiler.mark(stage)
+
+
+def install_signal_handler(signum: int = signal.SIGUSR1):
+    """Toggle profiling on `signum`, only works on the main thread."""
+
+    def on_signal(signum, frame):
+        # stopping joins the sampler, which must not block the signal handler
+        threading.Thread(target=profiler.toggle, name="profiler-toggle").start()
+
+    signal.signal(signum, on_signal)
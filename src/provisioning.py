@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import typing
+
+from psycopg2 import sql as psysql
+from psycopg2.extensions import connection
+
+import schema_migrations
+from thing import Thing
+
+SQL_DIR = os.path.join(os.path.dirname(__file__), "CreateThingInDatabaseAction")
+
+# first version writing into compressed chunks with ON CONFLICT DO UPDATE
+MIN_COMPRESSION_VERSION = (2, 11)
+
+UPSERT_THING = psysql.SQL(
+    "INSERT INTO thing (name, uuid, description, properties) "
+    "VALUES ({name}, {uuid}, {description}, {properties}) "
+    "ON CONFLICT (uuid) DO UPDATE SET name = EXCLUDED.name, "
+    "description = EXCLUDED.description, properties = EXCLUDED.properties"
+)
+
+
+def _load_script(name: str) -> psysql.SQL:
+    """A SQL file without its own BEGIN and COMMIT, to run in a transaction."""
+    with open(os.path.join(SQL_DIR, name)) as f:
+        lines = [
+            line for line in f if line.strip().upper() not in ("BEGIN;", "COMMIT;")
+        ]
+    return psysql.SQL("".join(lines))
+
+
+class Provisioner:
+    """
+    Create the database user, schema, tables and FROST views of things.
+
+    The SQL files are read once. All statements of a batch of things are
+    rendered into one script and sent in a single round trip and
+    transaction, so a failure leaves no half-built schema behind. Things
+    of existing users only get their thing row upserted. New schemas get
+    the DDL and then the migrations, see `schema_migrations`, each
+    recorded with its version. Migrations needing a setting that is not
+    set (compression without `compress_after`) are left pending, the
+    migrations that can't run in a transaction (the continuous
+    aggregates) are applied afterwards.
+    """
+
+    def __init__(self, db: connection, compress_after: str | None = None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.db = db
+        # compress observation chunks older than this interval, None disables it
+        self.compress_after = compress_after
+        self.settings = {"compress_after": compress_after}
+        self._checked_timescaledb = False
+        self.ddl = _load_script("postgres-ddl.sql")
+        migrations = [
+            m for m in schema_migrations.load_migrations() if m.ready(self.settings)
+        ]
+        self.migrations = []
+        for migration in migrations:
+            if migration.transactional:
+                self.migrations += [migration.render(self.settings), migration.record()]
+        self.after_commit = [m for m in migrations if not m.transactional]
+
+    def provision(self, things: typing.Sequence[Thing]):
+        users = {t.database.username.lower() for t in things}
+        with self.db:
+            with self.db.cursor() as c:
+                if self.compress_after and not self._checked_timescaledb:
+                    self._check_timescaledb(c)
+                existing, frost = self._inspect(c, users)
+                script = []
+                created = []
+                for thing in things:
+                    user = thing.database.username.lower()
+                    if user not in existing:
+                        script += self._schema_statements(thing, user)
+                        existing.add(user)
+                        frost.add(user)
+                        created.append(user)
+                    script += self._thing_statements(thing, user, user in frost)
+                c.execute(psysql.SQL(";\n").join(script))
+        for user in created:
+            for migration in self.after_commit:
+                try:
+                    schema_migrations.apply(self.db, user, migration, self.settings)
+                except Exception as e:
+                    # left pending for the migrate command
+                    self.logger.error(
+                        f"Unable to apply {migration} to {user!r}", exc_info=e
+                    )
+        self.logger.info(
+            f"provisioned {len(things)} things, created {len(created)} schemas"
+        )
+
+    def provision_all(
+        self, things: typing.Sequence[Thing], batch_size: int = 100
+    ) -> typing.List[Thing]:
+        """
+        Provision things in batches of `batch_size`, return the failed ones.
+
+        A failed batch is rolled back as a whole and retried thing by thing,
+        so one broken thing doesn't hold back the others of its batch.
+        """
+        failed = []
+        for start in range(0, len(things), batch_size):
+            batch = things[start : start + batch_size]
+            try:
+                self.provision(batch)
+                continue
+            except Exception as e:
+                if len(batch) == 1:
+                    self.logger.error(f"Unable to provision {batch[0].uuid}", exc_info=e)
+                    failed.append(batch[0])
+                    continue
+                self.logger.warning(f"Batch of {len(batch)} things failed: {e}")
+            for thing in batch:
+                try:
+                    self.provision([thing])
+                except Exception as e:
+                    self.logger.error(f"Unable to provision {thing.uuid}", exc_info=e)
+                    failed.append(thing)
+        return failed
+
+    def _check_timescaledb(self, c):
+        """
+        Upserts into compressed chunks need TimescaleDB 2.11, older versions
+        reject backfilled observations older than `compress_after`.
+        """
+        c.execute("SELECT extversion FROM pg_extension WHERE extname = 'timescaledb'")
+        row = c.fetchone()
+        version = tuple(int(p) for p in row[0].split(".")[:2]) if row else None
+        if version is None or version < MIN_COMPRESSION_VERSION:
+            raise RuntimeError(
+                f"Compression needs TimescaleDB {MIN_COMPRESSION_VERSION[0]}."
+                f"{MIN_COMPRESSION_VERSION[1]} or later, found {row and row[0]}"
+            )
+        self._checked_timescaledb = True
+
+    def _inspect(
+        self, c, users: typing.Set[str]
+    ) -> typing.Tuple[typing.Set[str], typing.Set[str]]:
+        """Existing users and the schemas with the tables behind the FROST views."""
+        c.execute("SELECT rolname FROM pg_roles WHERE rolname = ANY(%s)", (list(users),))
+        existing = {row[0] for row in c.fetchall()}
+        c.execute(
+            "SELECT n.nspname FROM pg_proc p "
+            "JOIN pg_namespace n ON p.pronamespace = n.oid "
+            "WHERE n.nspname = ANY(%s) AND p.proname = 'refresh_datastream_mapping'",
+            (list(users),),
+        )
+        frost = {row[0] for row in c.fetchall()}
+        return existing, frost
+
+    def _schema_statements(self, thing: Thing, user: str) -> typing.List[psysql.Composable]:
+        ident = psysql.Identifier(user)
+        statements = [
+            psysql.SQL("CREATE ROLE {0} WITH LOGIN PASSWORD {1}").format(
+                ident, psysql.Literal(thing.database.password)
+            ),
+            psysql.SQL("GRANT {user} TO {creator}").format(
+                user=ident, creator=psysql.Identifier(self.db.info.user)
+            ),
+            psysql.SQL("CREATE SCHEMA IF NOT EXISTS {user} AUTHORIZATION {user}").format(
+                user=ident
+            ),
+            psysql.SQL("SET LOCAL search_path TO {0}").format(ident),
+            # Allow tcp connections to database with new user
+            psysql.SQL("GRANT CONNECT ON DATABASE {db_name} TO {user}").format(
+                user=ident, db_name=psysql.Identifier(self.db.info.dbname)
+            ),
+            # Set default schema when connecting as user
+            psysql.SQL("ALTER ROLE {user} SET search_path to {user}").format(user=ident),
+            psysql.SQL("GRANT USAGE ON SCHEMA {user} TO {user}").format(user=ident),
+            psysql.SQL("GRANT ALL ON SCHEMA {user} TO {user}").format(user=ident),
+            self.ddl,
+            psysql.SQL(
+                "GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA {user} TO {user}"
+            ).format(user=ident),
+            psysql.SQL(
+                "GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA {user} TO {user}"
+            ).format(user=ident),
+        ]
+        statements.append(schema_migrations.VERSION_TABLE)
+        statements += self.migrations
+        return statements
+
+    @staticmethod
+    def _thing_statements(
+        thing: Thing, user: str, frost: bool
+    ) -> typing.List[psysql.Composable]:
+        ident = psysql.Identifier(user)
+        statements = [
+            psysql.SQL("SET LOCAL search_path TO {0}").format(ident),
+            UPSERT_THING.format(
+                name=psysql.Literal(thing.name),
+                uuid=psysql.Literal(thing.uuid),
+                description=psysql.Literal(thing.description),
+                properties=psysql.Literal(json.dumps(thing.properties)),
+            ),
+        ]
+        if frost:
+            # pick up changed datastreams in the tables behind the frost views
+            statements.append(
+                psysql.SQL("SELECT {0}.refresh_datastream_mapping()").format(ident)
+            )
+        return statements
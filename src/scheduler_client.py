@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import json
+import logging
+import random
+import threading
+import time
+import typing
+
+import urllib3
+
+logger = logging.getLogger("scheduler_client")
+
+# responses telling the job was not accepted and is worth another attempt,
+# everything else >= 400 fails at once. 502 and 504 are not retried, the
+# scheduler may have accepted the job behind the proxy.
+RETRY_STATUS = frozenset((429, 503))
+# the scheduler behind a proxy failed, counted by the circuit breaker
+GATEWAY_STATUS = frozenset((502, 504))
+
+# errors raised before the request was sent, later errors (read timeouts,
+# dropped connections) are not retried as the job may have been accepted
+RETRY_ERRORS = (
+    urllib3.exceptions.NewConnectionError,
+    urllib3.exceptions.ConnectTimeoutError,
+)
+
+
+class SchedulerError(Exception):
+    """The scheduler did not accept a job."""
+
+
+class CircuitOpenError(SchedulerError):
+    """Requests are not sent while the scheduler is considered down."""
+
+
+class _RetryableStatus(SchedulerError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Stop calling a failing service for `reset_timeout` seconds after
+    `failure_threshold` consecutive failures. Afterwards a single trial call
+    is let through, its success closes the circuit again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info("scheduler recovered, closing circuit")
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._trial:
+                    logger.warning(
+                        f"scheduler failed {self.failures} times, not calling it "
+                        f"for {self.reset_timeout}s"
+                    )
+                self.opened_at = time.monotonic()
+                self._trial = False
+
+
+class _RetryPolicy:
+    """Retries, backoff and circuit breaker shared by both clients."""
+
+    def __init__(
+        self,
+        url: str,
+        retries: int,
+        backoff: float,
+        backoff_max: float,
+        failure_threshold: int,
+        reset_timeout: float,
+    ):
+        self.url = url
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    def _delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2**attempt))
+
+    def _check_circuit(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"circuit to {self.url} is open")
+
+    def _response(self, status: int, data: bytes) -> dict:
+        """Decode a response, `_RetryableStatus` asks for another attempt."""
+        if status in RETRY_STATUS:
+            raise _RetryableStatus(f"scheduler responded {status}")
+
+        if status in GATEWAY_STATUS:
+            self.breaker.record_failure()
+            raise SchedulerError(f"scheduler responded {status}")
+
+        # the scheduler is reachable, even if it refuses this job
+        self.breaker.record_success()
+        if status >= 400:
+            raise SchedulerError(f"scheduler responded {status}: {data!r}")
+        return json.loads(data) if data else {}
+
+    def _connect_failed(self, attempt: int, e: Exception) -> SchedulerError:
+        error = SchedulerError(f"connecting to {self.url} failed: {e}")
+        logger.debug(f"attempt {attempt + 1}: {error}")
+        return error
+
+    def _request_failed(self, e: Exception) -> SchedulerError:
+        self.breaker.record_failure()
+        return SchedulerError(f"request to {self.url} failed: {e}")
+
+    def _retries_exhausted(self, error: SchedulerError) -> SchedulerError:
+        self.breaker.record_failure()
+        return error
+
+
+class SchedulerClient(_RetryPolicy):
+    """
+    Post jobs to the scheduler over pooled keep-alive connections.
+
+    Failed connection attempts and the responses in `RETRY_STATUS` are
+    retried up to `retries` times with full jitter exponential backoff. A
+    job is never posted twice after the scheduler may have received it.
+    Requests fail fast with `CircuitOpenError` while the circuit breaker is
+    open. Instances are thread safe, see `get_client` to share them.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+        backoff_max: float = 10.0,
+        pool_size: int = 10,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+    ):
+        super().__init__(
+            url, retries, backoff, backoff_max, failure_threshold, reset_timeout
+        )
+        self.http = urllib3.PoolManager(
+            num_pools=4,
+            maxsize=pool_size,
+            timeout=urllib3.Timeout(connect=connect_timeout, read=timeout),
+            # retried here, to apply the backoff and the circuit breaker
+            retries=False,
+        )
+
+    def post(self, data: dict | list) -> dict:
+        """Post `data` as json and return the decoded json response."""
+        self._check_circuit()
+        body = json.dumps(data).encode()
+        error: SchedulerError | None = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self._delay(attempt - 1))
+            try:
+                r = self.http.request(
+                    "POST",
+                    self.url,
+                    body=body,
+                    headers={"Content-Type": "application/json"},
+                )
+            except RETRY_ERRORS as e:
+                error = self._connect_failed(attempt, e)
+                continue
+            except urllib3.exceptions.HTTPError as e:
+                raise self._request_failed(e) from None
+            try:
+                return self._response(r.status, r.data)
+            except _RetryableStatus as e:
+                error = SchedulerError(str(e))
+                logger.debug(f"attempt {attempt + 1}: {error}")
+
+        raise self._retries_exhausted(error)
+
+
+_clients: typing.Dict[str, SchedulerClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(settings: dict) -> SchedulerClient:
+    """
+    Return the client of the process for `settings["url"]`, so all actions
+    share its connections and circuit breaker. The other keys of
+    `settings` are passed to `SchedulerClient` when it is created.
+    """
+    url = settings["url"]
+    with _clients_lock:
+        client = _clients.get(url)
+        if client is None:
+            options = {k: v for k, v in settings.items() if k != "url"}
+            client = _clients[url] = SchedulerClient(url, **options)
+        return client
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import logging
+import os
+import re
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from psycopg2 import sql as psysql
+from psycopg2.extensions import connection
+from psycopg2.pool import ThreadedConnectionPool
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+
+# migrations are named <version>_<name>.sql and applied in version order
+FILENAME = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+# first line of migrations that can't run in a transaction, their statements
+# are committed one by one and must be idempotent
+NO_TRANSACTION = "-- migrate: no-transaction"
+
+# settings of the run, e.g. %(compress_after)s, rendered as literals. A
+# migration whose settings are not all set is skipped and stays pending.
+PLACEHOLDER = re.compile(r"%\((\w+)\)s")
+
+VERSION_TABLE = psysql.SQL(
+    "CREATE TABLE IF NOT EXISTS schema_migrations ("
+    "version integer PRIMARY KEY, "
+    "name text NOT NULL, "
+    "applied_at timestamp with time zone NOT NULL DEFAULT now())"
+)
+
+RECORD_VERSION = psysql.SQL(
+    "INSERT INTO schema_migrations (version, name) VALUES ({version}, {name}) "
+    "ON CONFLICT (version) DO NOTHING"
+)
+
+# schemas of things, either registered for mqtt ingestion or found by their
+# observation table
+SCHEMA_SOURCES = {
+    "mqtt_auth": "SELECT DISTINCT db_schema FROM mqtt_auth.mqtt_user "
+    "WHERE db_schema IS NOT NULL ORDER BY db_schema",
+    "pg_namespace": "SELECT n.nspname FROM pg_namespace n "
+    "JOIN pg_class c ON c.relnamespace = n.oid "
+    "WHERE c.relname = 'observation' AND c.relkind IN ('r', 'p') "
+    "AND n.nspname NOT IN ('public', 'information_schema') "
+    "AND n.nspname NOT LIKE 'pg\\_%' AND n.nspname NOT LIKE '\\_timescaledb%' "
+    "ORDER BY n.nspname",
+}
+
+
+def _render(text: str, settings: dict) -> psysql.Composed:
+    parts = []
+    position = 0
+    for match in PLACEHOLDER.finditer(text):
+        parts.append(psysql.SQL(text[position : match.start()]))
+        parts.append(psysql.Literal(settings[match.group(1)]))
+        position = match.end()
+    parts.append(psysql.SQL(text[position:]))
+    return psysql.Composed(parts)
+
+
+class Migration:
+    __slots__ = ("version", "name", "sql", "transactional", "requires")
+
+    def __init__(self, version: int, name: str, sql: str):
+        self.version = version
+        self.name = name
+        self.sql = sql
+        self.transactional = not sql.lstrip().startswith(NO_TRANSACTION)
+        self.requires = set(PLACEHOLDER.findall(sql))
+
+    def __repr__(self):
+        return f"Migration({self.version}, {self.name!r})"
+
+    def ready(self, settings: dict) -> bool:
+        return all(settings.get(name) for name in self.requires)
+
+    def render(self, settings: dict) -> psysql.Composed:
+        return _render(self.sql, settings)
+
+    def statements(self, settings: dict) -> typing.List[psysql.Composed]:
+        """The statements of the file, dollar quoted bodies kept together."""
+        statements = []
+        current = []
+        for line in self.sql.splitlines():
+            if not current and (not line.strip() or line.lstrip().startswith("--")):
+                continue
+            current.append(line)
+            text = "\n".join(current)
+            if line.rstrip().endswith(";") and text.count("$$") % 2 == 0:
+                statements.append(text)
+                current = []
+        if current:
+            statements.append("\n".join(current))
+        return [_render(statement, settings) for statement in statements]
+
+    def record(self) -> psysql.Composed:
+        return RECORD_VERSION.format(
+            version=psysql.Literal(self.version), name=psysql.Literal(self.name)
+        )
+
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> typing.List[Migration]:
+    migrations = {}
+    for filename in os.listdir(directory):
+        match = FILENAME.match(filename)
+        if match is None:
+            continue
+        version = int(match.group(1))
+        if version in migrations:
+            raise ValueError(
+                f"Migrations {migrations[version].name!r} and {match.group(2)!r} "
+                f"share the version {version}"
+            )
+        with open(os.path.join(directory, filename)) as f:
+            migrations[version] = Migration(version, match.group(2), f.read())
+    return [migrations[v] for v in sorted(migrations)]
+
+
+def applied_versions(db: connection, schema: str) -> typing.Set[int]:
+    with db:
+        with db.cursor() as c:
+            c.execute(
+                "SELECT 1 FROM pg_tables "
+                "WHERE schemaname = %s AND tablename = 'schema_migrations'",
+                (schema,),
+            )
+            if c.fetchone() is None:
+                return set()
+            c.execute(
+                psysql.SQL("SELECT version FROM {0}.schema_migrations").format(
+                    psysql.Identifier(schema)
+                )
+            )
+            return {row[0] for row in c.fetchall()}
+
+
+def apply(db: connection, schema: str, migration: Migration, settings: dict):
+    """Apply `migration` to `schema` and record its version there."""
+    search_path = psysql.SQL("SET LOCAL search_path TO {0}").format(
+        psysql.Identifier(schema)
+    )
+    if migration.transactional:
+        with db:
+            with db.cursor() as c:
+                c.execute(search_path)
+                c.execute(VERSION_TABLE)
+                c.execute(migration.render(settings))
+                c.execute(migration.record())
+        return
+    db.autocommit = True
+    try:
+        with db.cursor() as c:
+            c.execute(
+                psysql.SQL("SET search_path TO {0}").format(psysql.Identifier(schema))
+            )
+            for statement in migration.statements(settings):
+                c.execute(statement)
+            c.execute(VERSION_TABLE)
+            c.execute(migration.record())
+    finally:
+        db.autocommit = False
+
+
+class Migrator:
+    """
+    Apply the pending migrations to many thing schemas concurrently.
+
+    Every schema records its applied versions in its `schema_migrations`
+    table and every migration is committed on its own, so an interrupted
+    run resumes where it stopped. Up to `workers` schemas are migrated at
+    a time, each on a connection of a pool of that size. A session
+    advisory lock per schema keeps concurrent runs apart. Migrations
+    needing a setting missing from `settings` are skipped.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        migrations: typing.List[Migration],
+        workers: int = 8,
+        progress_interval: float = 10,
+        settings: dict | None = None,
+    ):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.url = url
+        self.settings = settings or {}
+        self.migrations = []
+        for migration in migrations:
+            if migration.ready(self.settings):
+                self.migrations.append(migration)
+            else:
+                self.logger.info(
+                    f"skipping {migration}, it needs the settings {migration.requires}"
+                )
+        self.workers = workers
+        self.progress_interval = progress_interval
+        self.pool: ThreadedConnectionPool | None = None
+        self._done = 0
+        self._applied = 0
+
+    def schemas(self, source: str = "mqtt_auth") -> typing.List[str]:
+        db = self.pool.getconn()
+        try:
+            with db:
+                with db.cursor() as c:
+                    c.execute(SCHEMA_SOURCES[source])
+                    return [row[0] for row in c.fetchall()]
+        finally:
+            self.pool.putconn(db)
+
+    def pending(self, db: connection, schema: str) -> typing.List[Migration]:
+        applied = applied_versions(db, schema)
+        return [m for m in self.migrations if m.version not in applied]
+
+    def migrate_schema(self, schema: str, dry_run: bool = False) -> int:
+        """Apply the pending migrations to `schema`, return their number."""
+        db = self.pool.getconn()
+        try:
+            with db:
+                with db.cursor() as c:
+                    c.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (schema,))
+                    if not c.fetchone()[0]:
+                        raise RuntimeError(f"{schema!r} is migrated by another run")
+            try:
+                pending = self.pending(db, schema)
+                if dry_run:
+                    if pending:
+                        self.logger.info(f"{schema}: pending {pending}")
+                    return len(pending)
+                for migration in pending:
+                    apply(db, schema, migration, self.settings)
+                    self.logger.debug(f"{schema}: applied {migration}")
+                return len(pending)
+            finally:
+                with db:
+                    with db.cursor() as c:
+                        c.execute("SELECT pg_advisory_unlock(hashtext(%s))", (schema,))
+        finally:
+            # connections broken by a failure are not reused
+            self.pool.putconn(db, close=db.closed != 0)
+
+    def run(
+        self,
+        schemas: typing.List[str] | None = None,
+        source: str = "mqtt_auth",
+        dry_run: bool = False,
+    ) -> typing.Dict[str, Exception]:
+        """Migrate `schemas` (default: all of `source`), return the failed ones."""
+        self.pool = ThreadedConnectionPool(1, self.workers, self.url)
+        try:
+            if schemas is None:
+                schemas = self.schemas(source)
+            return self._run(schemas, dry_run)
+        finally:
+            self.pool.closeall()
+            self.pool = None
+
+    def _run(self, schemas: typing.List[str], dry_run: bool):
+        failed = {}
+        self._done = self._applied = 0
+        started = last_report = time.monotonic()
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="migrate") as pool:
+            futures = {
+                pool.submit(self.migrate_schema, schema, dry_run): schema
+                for schema in schemas
+            }
+            for future in as_completed(futures):
+                schema = futures[future]
+                try:
+                    applied = future.result()
+                except Exception as e:
+                    self.logger.error(f"Unable to migrate {schema!r}", exc_info=e)
+                    failed[schema] = e
+                    applied = 0
+                self._done += 1
+                self._applied += applied
+                now = time.monotonic()
+                if now - last_report >= self.progress_interval:
+                    last_report = now
+                    self._report(len(schemas), len(failed), now - started, dry_run)
+        self._report(len(schemas), len(failed), time.monotonic() - started, dry_run)
+        return failed
+
+    def _report(self, total: int, failed: int, elapsed: float, dry_run: bool):
+        self.logger.info(
+            f"{self._done}/{total} schemas done, {self._applied} migrations "
+            f"{'pending' if dry_run else 'applied'}, {failed} failed, {elapsed:.0f}s"
+        )
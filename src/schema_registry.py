@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+import typing
+
+import fastavro
+
+from avro_structs import compile_schema
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "avro_schema_files")
+
+
+class SchemaRegistry:
+    """
+    Process wide store of parsed avro schemas.
+
+    Every schema file is read and parsed exactly once. When `auto_reload`
+    is enabled, the modification time of a file is checked at most every
+    `reload_interval` seconds and the schema is parsed again if the file
+    changed on disk.
+    """
+
+    def __init__(self, auto_reload: bool = False, reload_interval: float = 5.0):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.auto_reload = auto_reload
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        # path -> (parsed schema, mtime, time of last mtime check)
+        self._schemas: typing.Dict[str, typing.Tuple[dict, float, float]] = {}
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.normpath(os.path.abspath(path))
+
+    def _load(self, key: str) -> dict:
+        mtime = os.stat(key).st_mtime
+        schema = fastavro.schema.load_schema(key)
+        self._schemas[key] = (schema, mtime, time.monotonic())
+        self.logger.debug(f"loaded avro schema {key!r}")
+        return schema
+
+    def preload(self, directory: str = SCHEMA_DIR):
+        """Parse all `*.avsc` files of `directory`."""
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".avsc"):
+                self.get(os.path.join(directory, name))
+
+    def get(self, path: str) -> dict:
+        key = self._key(path)
+        entry = self._schemas.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._schemas.get(key)
+                if entry is None:
+                    return self._load(key)
+
+        schema, mtime, checked = entry
+        if self.auto_reload:
+            now = time.monotonic()
+            if now - checked >= self.reload_interval:
+                with self._lock:
+                    if os.stat(key).st_mtime != mtime:
+                        self.logger.info(f"avro schema {key!r} changed on disk, reloading")
+                        return self._load(key)
+                    self._schemas[key] = (schema, mtime, now)
+        return schema
+
+    def validator(self, path: str) -> typing.Callable[[typing.Any], bool]:
+        """
+        Return a callable validating a datum against the parsed schema of
+        `path`. Raises `fastavro.validation.ValidationError` on failure.
+        """
+        key = self._key(path)
+        self.get(key)
+
+        def validate(datum) -> bool:
+            return fastavro.validate(datum, self.get(key), raise_errors=True)
+
+        return validate
+
+    def decoder(self, path: str) -> typing.Callable[[typing.Any], typing.Any]:
+        """
+        Return a callable validating a datum against the schema of `path`
+        and converting it to typed objects in the same pass, see
+        `avro_structs.compile_schema`. Raises
+        `avro_structs.SchemaValidationError` on failure.
+
+        The schema is compiled on the first call, i.e. after the action
+        modules registered their record classes, and again after reloads.
+        """
+        key = self._key(path)
+        self.get(key)
+        compiled = (None, None)
+
+        def decode(datum):
+            nonlocal compiled
+            schema = self.get(key)
+            if compiled[0] is not schema:
+                compiled = (schema, compile_schema(schema))
+            return compiled[1](datum)
+
+        return decode
+
+
+# shared by all action instances of the process
+registry = SchemaRegistry()
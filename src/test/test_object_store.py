@@ -0,0 +1,127 @@
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+try:
+    import minio
+except ImportError:
+    minio = None
+
+import metrics
+
+LOCATION = (
+    b'<?xml version="1.0" encoding="UTF-8"?>'
+    b'<LocationConstraint xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+    b"</LocationConstraint>"
+)
+
+
+class StubMinioHandler(BaseHTTPRequestHandler):
+    """Answers every S3 and admin request with an empty success."""
+
+    protocol_version = "HTTP/1.1"
+
+    def handle_one_request(self):
+        self.server.connections.add(self.client_address)
+        super().handle_one_request()
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        path, _, query = self.path.partition("?")
+        with self.server.lock:
+            self.server.requests.append((self.command, path, query))
+        body = LOCATION if query.startswith("location") else b""
+        # the bucket doesn't exist yet
+        self.send_response(404 if self.command == "HEAD" else 200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_PUT = do_POST = do_HEAD = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+def stub_thing(index: int):
+    return SimpleNamespace(
+        uuid=f"uuid-{index}",
+        name=f"thing-{index}",
+        properties={"default_parser": "csvparser"},
+        database=SimpleNamespace(
+            username=f"user{index}", password="secret", url="postgresql://db"
+        ),
+        raw_data_storage=SimpleNamespace(
+            username=f"minio-user{index}",
+            password="secret123",
+            bucket_name=f"bucket-{index}",
+        ),
+    )
+
+
+@unittest.skipIf(minio is None, "minio is not installed")
+class ObjectStoreTest(unittest.TestCase):
+    def setUp(self):
+        from object_store import ObjectStore
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubMinioHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.connections = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.store = ObjectStore(
+            {
+                "minio_url": f"127.0.0.1:{self.server.server_port}",
+                "minio_secure": False,
+                "minio_access_key": "access",
+                "minio_secure_key": "secret",
+            },
+            metrics.ActionMetrics("CreateThingOnMinioAction", "test"),
+            workers=2,
+        )
+
+    def tearDown(self):
+        self.store.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def provisioning_requests(self):
+        # minio also looks up the region of every new bucket once
+        return sorted(r for r in self.server.requests if r[2] != "location=")
+
+    def test_provision_sends_eight_requests(self):
+        self.store.provision(stub_thing(1))
+
+        self.assertEqual(
+            self.provisioning_requests(),
+            [
+                ("HEAD", "/bucket-1", ""),
+                ("PUT", "/bucket-1", ""),
+                ("PUT", "/bucket-1", "notification="),
+                ("PUT", "/bucket-1", "object-lock="),
+                ("PUT", "/bucket-1", "tagging="),
+                ("PUT", "/minio/admin/v3/add-canned-policy", "name=minio-user1"),
+                ("PUT", "/minio/admin/v3/add-user", "accessKey=minio-user1"),
+                (
+                    "PUT",
+                    "/minio/admin/v3/set-user-or-group-policy",
+                    "isGroup=false&policyName=minio-user1&userOrGroup=minio-user1",
+                ),
+            ],
+        )
+
+    def test_provision_reuses_connections(self):
+        for index in range(10):
+            self.store.provision(stub_thing(index))
+
+        self.assertEqual(len(self.provisioning_requests()), 10 * 8)
+        # one keep-alive connection per worker
+        self.assertLessEqual(len(self.server.connections), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,24 @@
 from __future__ import annotations
 
+import os
+
+from avro_structs import SchemaValidationError, Struct, record
+from schema_registry import registry
+
+THING_SCHEMA_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "avro_schema_files", "thing_event.avsc"
+)
+
+# The classes are the typed output of decoding thing_event.avsc, see
+# `avro_structs`. The properties record is passed through as dict, it is
+# stored as json as it is.
+record("thing_created_event.properties")(dict)
+
+
+@record("thing_created_event.database")
+class Database(Struct):
+    __slots__ = ("username", "password", "url")
 
-class Database:
     def __init__(self, username: str, password: str, url: str):
         self.username = username
         self.password = password
@@ -17,7 +34,10 @@ class Database:
             )
 
 
-class Project:
+@record("thing_created_event.project")
+class Project(Struct):
+    __slots__ = ("uuid", "name")
+
     def __init__(self, uuid: str, name: str) -> None:
         self.uuid = uuid
         self.name = name
@@ -30,7 +50,10 @@ class Project:
             raise ValueError(f'Unable to get Project instance from message "{message}"')
 
 
-class RawDataStorage:
+@record("thing_created_event.raw_data_storage")
+class RawDataStorage(Struct):
+    __slots__ = ("username", "password", "bucket_name")
+
     def __init__(self, username: str, password: str, bucket_name: str):
         self.username = username
         self.password = password
@@ -46,7 +69,36 @@ class RawDataStorage:
             )
 
 
-class Thing:
+@record("thing_created_event.mqtt_authentication_credentials")
+class MqttAuthenticationCredentials(Struct):
+    __slots__ = ("username", "password_hash", "description", "properties")
+
+    def __init__(
+        self,
+        username: str,
+        password_hash: str,
+        description: str | None = None,
+        properties: str | None = None,
+    ):
+        self.username = username
+        self.password_hash = password_hash
+        self.description = description
+        self.properties = properties
+
+
+@record("thing_created_event")
+class Thing(Struct):
+    __slots__ = (
+        "uuid",
+        "name",
+        "project",
+        "database",
+        "raw_data_storage",
+        "description",
+        "properties",
+        "mqtt_authentication_credentials",
+    )
+
     def __init__(
         self,
         uuid: str,
@@ -56,6 +108,7 @@ class Thing:
         raw_data_storage: RawDataStorage,
         description: str,
         properties: dict,
+        mqtt_authentication_credentials: MqttAuthenticationCredentials | None = None,
     ):
         self.uuid = uuid
         self.name = name
@@ -64,28 +117,19 @@ class Thing:
         self.raw_data_storage = raw_data_storage
         self.description = description
         self.properties = properties
+        self.mqtt_authentication_credentials = mqtt_authentication_credentials
 
     @classmethod
-    def get_instance(cls, message: dict) -> Thing:
-        # Raw data storage is optional, i.e. when using mqtt only
-        raw_data_storage = None
+    def get_instance(cls, message: dict | Thing) -> Thing:
+        # actions with the thing_event schema already receive decoded things
+        if isinstance(message, cls):
+            return message
         try:
-
-            if "raw_data_storage" in message:
-                raw_data_storage = RawDataStorage.get_instance(
-                    message["raw_data_storage"]
-                )
-
-            return cls(
-                message["uuid"],
-                message["name"],
-                Project.get_instance(message["project"]),
-                Database.get_instance(message["database"]),
-                raw_data_storage,
-                message["description"],
-                message["properties"],
-            )
-        except KeyError as e:
+            return _decode_thing(message)
+        except SchemaValidationError as e:
             raise ValueError(
                 f'Unable to get Thing instance from message "{message}"', e
             )
+
+
+_decode_thing = registry.decoder(THING_SCHEMA_FILE)
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import threading
+import time
+import typing
+from collections import OrderedDict
+
+K = typing.TypeVar("K")
+V = typing.TypeVar("V")
+
+
+class _Failure:
+    __slots__ = ("error",)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class TTLCache(typing.Generic[K, V]):
+    """
+    Thread safe LRU cache with time to live and negative caching.
+
+    Values are created by the loader passed to `get`. Exceptions of the
+    types in `negative_errors` raised by the loader are cached for
+    `negative_ttl` seconds and raised again on lookup, instead of calling
+    the loader over and over. `on_evict(key, value)` is called for every
+    value leaving the cache, i.e. to close connections held by the value.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float | None = None,
+        negative_ttl: float | None = None,
+        negative_errors: typing.Tuple[typing.Type[Exception], ...] = (LookupError,),
+        on_evict: typing.Callable[[K, V], None] | None = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.negative_errors = negative_errors
+        self.on_evict = on_evict
+        self._lock = threading.Lock()
+        # key -> (value or _Failure, expiry time)
+        self._data: OrderedDict[K, typing.Tuple[typing.Any, float]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> typing.Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "evictions": self.evictions,
+        }
+
+    def get(self, key: K, loader: typing.Callable[[K], V]) -> V:
+        evicted = []
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    if isinstance(value, _Failure):
+                        self.negative_hits += 1
+                        raise value.error.with_traceback(None)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                evicted.append((key, value))
+            self.misses += 1
+        self._evict(evicted)
+
+        # load outside of the lock, loaders are slow
+        try:
+            value = loader(key)
+        except self.negative_errors as e:
+            if self.negative_ttl:
+                self._put(key, _Failure(e), self.negative_ttl)
+            raise
+        return self._put(key, value, self.ttl)
+
+    def peek(self, key: K) -> V:
+        """
+        Value of `key` if cached and fresh, raises `KeyError` otherwise
+        without loading it. Only hits are counted, the miss is counted by
+        the `get` following a failed peek.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                raise KeyError(key)
+            value = entry[0]
+            self._data.move_to_end(key)
+            if isinstance(value, _Failure):
+                self.negative_hits += 1
+                raise value.error.with_traceback(None)
+            self.hits += 1
+            return value
+
+    def _put(self, key: K, value, ttl: float | None):
+        expires = time.monotonic() + ttl if ttl else float("inf")
+        evicted = []
+        with self._lock:
+            current = self._data.get(key)
+            if current is not None and not isinstance(current[0], _Failure):
+                # loaded concurrently by another thread, keep the first one
+                evicted.append((key, value))
+                value = current[0]
+            else:
+                if current is not None:
+                    del self._data[key]
+                self._data[key] = (value, expires)
+                while len(self._data) > self.maxsize:
+                    old_key, (old_value, _) = self._data.popitem(last=False)
+                    evicted.append((old_key, old_value))
+        self._evict(evicted)
+        return value
+
+    def _evict(self, items: typing.List[typing.Tuple[K, typing.Any]]):
+        for key, value in items:
+            if isinstance(value, _Failure):
+                continue
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(key, value)
+
+    def invalidate(self, key: K):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        if entry is not None:
+            self._evict([(key, entry[0])])
+
+    def clear(self):
+        with self._lock:
+            items = [(k, v) for k, (v, _) in self._data.items()]
+            self._data.clear()
+        self._evict(items)
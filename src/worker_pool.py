@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import itertools
+import logging
+import queue
+import threading
+import typing
+import zlib
+
+_STOP = object()
+
+
+class Slots:
+    """
+    Count of messages in flight against a limit. Taking a slot never
+    blocks, the mqtt network loop stops reading while none is available,
+    see `mqtt_loop`.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        with self._lock:
+            self._used += 1
+
+    def release(self):
+        with self._lock:
+            self._used -= 1
+
+    def available(self) -> bool:
+        return self._used < self.size
+
+    def used(self) -> int:
+        return self._used
+
+
+class KeyedWorkerPool:
+    """
+    Bounded pool of worker threads preserving the order of tasks per key.
+
+    All tasks submitted with the same key are executed by the same worker,
+    one after another in submission order. Tasks without a key are handed
+    to the workers round robin. The network loop of the mqtt client stops
+    reading while `max_in_flight` tasks are queued or running
+    (backpressure), see `mqtt_loop`. `submit` never blocks that loop.
+    """
+
+    def __init__(self, workers: int, max_in_flight: int, name: str = "worker"):
+        if workers < 1:
+            raise ValueError(f"at least one worker is needed, got {workers}")
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._slots = Slots(max(max_in_flight, workers))
+        self._queues: typing.List[queue.SimpleQueue] = []
+        self._threads: typing.List[threading.Thread] = []
+        self._round_robin = itertools.cycle(range(workers))
+        for i in range(workers):
+            q = queue.SimpleQueue()
+            t = threading.Thread(
+                target=self._work, args=(q,), name=f"{name}-{i}", daemon=True
+            )
+            self._queues.append(q)
+            self._threads.append(t)
+            t.start()
+
+    def _work(self, q: queue.SimpleQueue):
+        while True:
+            task = q.get()
+            if task is _STOP:
+                return
+            fn, args = task
+            try:
+                fn(*args)
+            except Exception as e:
+                self.logger.error("unhandled error in worker", exc_info=e)
+            finally:
+                self._slots.release()
+
+    def has_capacity(self) -> bool:
+        return self._slots.available()
+
+    def pending(self) -> int:
+        """Number of queued or running tasks."""
+        return self._slots.used()
+
+    def submit(self, key: typing.Optional[str], fn: typing.Callable, *args):
+        if key is None:
+            i = next(self._round_robin)
+        else:
+            i = zlib.crc32(key.encode()) % len(self._queues)
+        self._slots.take()
+        self._queues[i].put((fn, args))
+
+    def shutdown(self, wait: bool = True):
+        """Stop the workers after all queued tasks are done."""
+        for q in self._queues:
+            q.put(_STOP)
+        if wait:
+            for t in self._threads:
+                t.join()